@@ -0,0 +1,112 @@
+import warnings
+import numpy as np
+from scipy.stats import norm
+from random_effects import hedges_g, dersimonian_laird, replace_zero_sd
+from summary_stats import study_gene_index
+
+# Vectorized bootstrap of the random-effects meta-analysis.
+# The samples of each group of each study are resampled with replacement by a seeded numpy Generator.
+# A replicate is summarized through how many times every sample was drawn (one matrix product per group),
+# so the resampled expressions are never copied, and a whole batch of replicates is pooled in one pass.
+# A replicate with a zero resampled deviation would blow up its effect size: the draws of a single sample are
+# drawn again, and the replicates of a gene that still get a zero deviation (tied expressions) are dropped (NaN).
+
+# number of (gene, study, replicate) cells pooled at a time
+BATCH_CELLS = 1 << 22
+
+
+# With this function we draw the sample indices of num_of_reps replicates of a group of n samples
+# and count how many times each sample is drawn in each replicate (num_of_reps x n).
+# A replicate that draws one sample n times has no deviation, it is drawn again (groups of 2 samples or more)
+def resample_counts(rng, n, num_of_reps):
+    counts = _draw_counts(rng, n, num_of_reps)
+    redraw = single_sample_draws(counts) if n > 1 else np.zeros(num_of_reps, dtype=bool)
+    while redraw.any():
+        counts[redraw] = _draw_counts(rng, n, int(redraw.sum()))
+        redraw = single_sample_draws(counts)
+    return counts
+
+
+def _draw_counts(rng, n, num_of_reps):
+    idx = rng.integers(0, n, size=(num_of_reps, n)) + (np.arange(num_of_reps) * n)[:, None]
+    return np.bincount(idx.ravel(), minlength=num_of_reps * n).reshape(num_of_reps, n).astype(float)
+
+
+# With this function we find the degenerate replicates of a group: the ones where every draw is the same sample
+def single_sample_draws(counts):
+    return (counts > 0).sum(axis=1) == 1
+
+
+# With this function we get the mean and standard deviation of every gene of a (genes x n) group
+# in every replicate given by its resampling counts. Output: two (genes x replicates) arrays
+def replicate_stats(values, counts):
+    n = values.shape[1]
+    if n == 0:
+        empty = np.full((values.shape[0], counts.shape[0]), np.nan)
+        return empty, empty
+    # centering first keeps the sum of squares accurate
+    center = values.mean(axis=1, keepdims=True)
+    centered = values - center
+    means = (centered @ counts.T) / n
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = np.maximum((centered * centered) @ counts.T - n * means * means, 0) / (n - 1)
+    return means + center, np.sqrt(var)
+
+
+# With this function we get the pooled effect size of every gene of summaries in num_of_reps bootstrap replicates.
+# studies holds for each study its genes and the (genes x samples) expressions of the controls and the cases.
+# The replicates of a gene where a group of a study has a zero resampled deviation (but not a zero observed one)
+# are NaN.
+# Output: (genes x num_of_reps) effect sizes, the rows follow summaries.genes
+def bootstrap_effects(summaries, studies, num_of_reps, seed=None):
+    rng = np.random.default_rng(seed)
+    num_of_genes, num_of_studies = summaries.mask.shape
+    rows = [study_gene_index(summaries.genes, genes) for genes, _ in studies]
+    effects = np.full((num_of_genes, num_of_reps), np.nan)
+    batch = max(1, BATCH_CELLS // max(1, num_of_genes * num_of_studies))
+
+    for start in range(0, num_of_reps, batch):
+        reps = min(batch, num_of_reps - start)
+        # group x gene x replicate x study
+        shape = (2, num_of_genes, reps, num_of_studies)
+        mean, sd, n = np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, np.nan)
+        degenerate = np.zeros((num_of_genes, reps), dtype=bool)
+        for s, ((_, groups), (idx, first)) in enumerate(zip(studies, rows)):
+            for j, values in enumerate(groups):
+                counts = resample_counts(rng, values.shape[1], reps)
+                m, d = replicate_stats(values[first], counts)
+                with np.errstate(invalid='ignore'):
+                    varies = np.std(values[first], axis=1) > 0
+                degenerate[idx] |= varies[:, None] & (d == 0)
+                mean[j, idx, :, s] = m
+                sd[j, idx, :, s] = d
+                n[j, idx, :, s] = values.shape[1]
+
+        # every (gene, replicate) pair is one row of the pooling
+        mean, sd, n = (x.reshape(2, -1, num_of_studies) for x in (mean, sd, n))
+        sd1, sd2 = replace_zero_sd(sd[1], sd[0])
+        es, se = hedges_g(mean[1], sd1, n[1], mean[0], sd2, n[0])
+        pooled = dersimonian_laird(es, se)[0].reshape(num_of_genes, reps)
+        effects[:, start:start + reps] = np.where(degenerate, np.nan, pooled)
+
+    return effects
+
+
+# With this function we summarize the bootstrap distribution of each gene around its effect size estimate,
+# over its finite (kept) replicates.
+# The bootstrap p value is the one of the centered distribution: the share of replicates that fall at least
+# |estimate| away from the estimate (the replicates of small groups drift away from zero, so the share of
+# them across zero, the percentile p value, rejects far too often).
+# Output: bootstrap SE, |z|, normal p value, percentile confidence interval, bootstrap p value
+# and the number of replicates kept
+def bootstrap_summary(estimates, effects, alpha):
+    finite = np.isfinite(effects)
+    reps = finite.sum(axis=1)
+    # genes without finite replicates get NaN everywhere
+    with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        se = np.nanstd(effects, axis=1, ddof=1)
+        ci_low, ci_up = np.nanpercentile(effects, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=1)
+        z = np.abs(estimates / se)
+        p_centered = (np.abs(effects - estimates[:, None]) >= np.abs(estimates)[:, None]).sum(axis=1) / reps
+    return se, z, norm.sf(z) * 2, ci_low, ci_up, p_centered, reps
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import pickle
+
+# Stage checkpoints of a mage.py run, kept in the checkpoints/ folder of the output directory.
+# Each stage is saved with a key: the hash of the settings the stage depends on, of its inputs and of the
+# key of the stage it starts from, so a resumed run reuses a stage only while all of these are unchanged.
+
+CHECKPOINT_FOLDER = 'checkpoints'
+
+# the settings each stage depends on
+STAGE_SETTINGS = {
+    'studies': ['study_dir', 'cache_dtype', 'memory_map'],
+    'gisu': ['run_gisu', 'gene_data_online', 'updated_genes', 'transformation_method', 'platform',
+             'gene_history_file', 'homo_sapiens_file', 'platforms_folder', 'transformation_organism',
+             'target_namespace', 'gprofiler_url'],
+    'effect_sizes': ['controls', 'cases'],
+    # significance_level only changes the bootstrap intervals, mage.py adds it to the inputs of a bootstrap run
+    'meta_analysis': ['bootstrap', 'num_of_reps', 'bootstrap_seed', 'bayesian_meta_analysis', 'a', 'b', 'prior_sweep'],
+    'multiple_testing': ['significance_level', 'multiple_comparisons', 'stream_results', 'parquet_results'],
+    'multivariate': ['controls', 'cases', 'cases2', 'alpha', 'venn_correction', 'venn_choice', 'multiple_tests'],
+    'enrichment': ['organism', 'threshold', 'threshold_method', 'enrichment_backend', 'gmt_dir',
+                   'gprofiler_url'],
+    'gsea': ['gsea_rank_by', 'gsea_permutations', 'gsea_seed', 'gsea_weight', 'gsea_min_size', 'gsea_max_size',
+             'gmt_dir'],
+}
+
+
+# With this function we get the key of a stage. previous is the key of the stage before it,
+# inputs anything else (JSON serializable) the stage reads
+def stage_key(settings, stage, previous='', inputs=None):
+    state = {'stage': stage, 'previous': previous, 'inputs': inputs,
+             'settings': {key: settings.get(key) for key in STAGE_SETTINGS[stage]}}
+    return hashlib.sha256(json.dumps(state, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+# With this function we describe the study files by name, size and modification time
+def files_state(folder, file_list):
+    state = []
+    for name in sorted(file_list):
+        stat = os.stat(os.path.join(folder, name.strip()))
+        state.append([name.strip(), stat.st_size, stat.st_mtime_ns])
+    return state
+
+
+def _paths(filepath, stage):
+    folder = os.path.join(filepath, CHECKPOINT_FOLDER)
+    return folder, os.path.join(folder, stage + '.pkl'), os.path.join(folder, stage + '.key')
+
+
+# With this function we get the saved value of a stage, or None when there is none saved with this key.
+# A checkpoint that cannot be read back (truncated, or pickled from code that has changed since) is discarded
+def load(filepath, stage, key):
+    folder, value_path, key_path = _paths(filepath, stage)
+    try:
+        with open(key_path, 'r', encoding='utf-8') as f:
+            if f.read().strip() != key:
+                print('Checkpoint of ' + stage + ' is out of date, computing it again')
+                return None
+        with open(value_path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ModuleNotFoundError, ValueError) as e:
+        print('Checkpoint of ' + stage + ' discarded (' + repr(e) + '), computing it again')
+        return None
+
+
+# With this function we save the value of a stage with its key.
+# The key file is removed first and written last, so an interrupted save is never loaded
+def save(filepath, stage, key, value):
+    folder, value_path, key_path = _paths(filepath, stage)
+    os.makedirs(folder, exist_ok=True)
+    if os.path.exists(key_path):
+        os.remove(key_path)
+    with open(value_path + '.tmp', 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(value_path + '.tmp', value_path)
+    with open(key_path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(key)
+    os.replace(key_path + '.tmp', key_path)
+
+
+# With this function we get the value of a stage: its checkpoint when resuming with an unchanged key
+# (and check(value) holds, if given), otherwise compute() which is saved as the new checkpoint
+def run_stage(filepath, stage, key, compute, resume, save_value=True, check=None):
+    value = load(filepath, stage, key) if resume else None
+    if value is not None and (check is None or check(value)):
+        print('Resuming ' + stage + ' from its checkpoint')
+        return value
+    value = compute()
+    if save_value:
+        save(filepath, stage, key, value)
+    return value
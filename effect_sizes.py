@@ -0,0 +1,76 @@
+import os
+import numpy as np
+from collections import namedtuple
+from summary_stats import StudySummaries
+from random_effects import hedges_g, replace_zero_sd
+
+# Per-study effect sizes of a meta-analysis run (the effect_sizes stage of mage.py).
+# For every (gene, study) entry the table holds Hedges' g of the cases against the controls and its standard error
+# (as CONT_Heg_SMD) with the group sizes, means and standard deviations they come from.
+# It is written as effect_sizes.npz in the output directory, one row per entry (a gene missing from a study has
+# no row), and read back into a StudyEffects: the random-effects meta-analysis pools its g and se while the
+# Bayesian meta-analysis uses its summaries, so a resumed run does not read or summarize the studies again.
+
+EFFECT_SIZES_FILE = 'effect_sizes.npz'
+
+# the groups of the table, in the order of the StudySummaries of split_data
+GROUPS = ['controls', 'cases']
+
+# A StudySummaries of the controls and the cases with the (genes x studies) Hedges' g and standard errors
+StudyEffects = namedtuple('StudyEffects', StudySummaries._fields + ('g', 'se'))
+
+
+# With this function we get the StudyEffects of a StudySummaries (controls, cases)
+def study_effects(summaries):
+    summaries = StudySummaries(*summaries[:len(StudySummaries._fields)])
+    m1, sd1, n1 = summaries.mean[:, :, 1], summaries.sd[:, :, 1], summaries.n[:, :, 1]
+    m2, sd2, n2 = summaries.mean[:, :, 0], summaries.sd[:, :, 0], summaries.n[:, :, 0]
+
+    # studies where both groups have zero deviation take the max deviation of the gene
+    sd1, sd2 = replace_zero_sd(sd1, sd2)
+    g, se = hedges_g(m1, sd1, n1, m2, sd2, n2)
+    return StudyEffects(*summaries, g, se)
+
+
+# With this function we write the StudyEffects of the studies (names in the order of the study axis)
+# to path with the key of its stage
+def write_effects(path, effects, studies, key=''):
+    gene, study = np.nonzero(effects.mask)
+    columns = {'g': effects.g[gene, study], 'se': effects.se[gene, study]}
+    for j, group in enumerate(GROUPS):
+        columns['n_' + group] = effects.n[gene, study, j]
+        columns['mean_' + group] = effects.mean[gene, study, j]
+        columns['sd_' + group] = effects.sd[gene, study, j]
+
+    # the table is written next to its final name and replaces it at once
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, key=np.array(key), genes=np.asarray(effects.genes).astype(str),
+                 studies=np.array([str(name) for name in studies]), gene=gene.astype(np.int32),
+                 study=study.astype(np.int32), **columns)
+    os.replace(path + '.tmp', path)
+
+
+# With this function we read the StudyEffects of the table of path and the names of its studies,
+# None when there is no table or it was written with another key
+def read_effects(path, key=None):
+    try:
+        with np.load(path) as table:
+            if key is not None and str(table['key']) != key:
+                return None
+            genes, studies = table['genes'].astype(object), table['studies'].tolist()
+            gene, study = table['gene'], table['study']
+            shape = (len(genes), len(studies), len(GROUPS))
+
+            mean, sd, n = np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, np.nan)
+            for j, group in enumerate(GROUPS):
+                n[gene, study, j] = table['n_' + group]
+                mean[gene, study, j] = table['mean_' + group]
+                sd[gene, study, j] = table['sd_' + group]
+            g, se = np.full(shape[:2], np.nan), np.full(shape[:2], np.nan)
+            g[gene, study] = table['g']
+            se[gene, study] = table['se']
+    except (OSError, ValueError, KeyError):
+        return None
+    mask = np.zeros(shape[:2], dtype=bool)
+    mask[gene, study] = True
+    return StudyEffects(genes, mean, sd, n, mask, g, se), studies
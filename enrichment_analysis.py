@@ -1,29 +1,28 @@
 import numpy as np
-from gprofiler import GProfiler
+import gprofiler_client
+import local_enrichment
 
 
+# With this function we conduct the enrichment analysis of the genes with the enrichment_backend of settings:
+# the g:Profiler service (gprofiler, the default) or the GMT files of gmt_dir (local, no network needed)
 def run(settings, genes):
-    p_organism = settings['organism']
-    p_threshold = float(settings['threshold'])
-    p_threshold_method = settings['threshold_method']
-
-    gp = GProfiler(return_dataframe=True)
-    var = gp.profile(organism=p_organism,
-                     query=genes,
-                     all_results=True,
-                     ordered=False,
-                     combined=False,
-                     measure_underrepresentation=False,
-                     no_iea=False,
-                     no_evidences=False,
-                     domain_scope='annotated',
-                     numeric_namespace='AFFY_HUGENE_1_0_ST_V1',
-                     sources=["GO:MF", "GO:CC", "GO:BP", "KEGG", "REAC", "WP", "TF", "MIRNA", "HPA", "CORUM", "HP"],
-                     user_threshold=p_threshold,
-                     significance_threshold_method=p_threshold_method,
-                     )
+    if settings.get('enrichment_backend', 'gprofiler') == 'local':
+        var = local_enrichment.run(settings, genes)
+    else:
+        var = gprofiler_enrichment(settings, genes)
 
     var['negative_log10_of_adjusted_p_value'] = -np.log10(var.p_value)
 
     #print(var.head())
     return var
+
+
+# With this function we conduct the enrichment analysis of the genes with g:Profiler, the response of a request
+# made before is read from the g:Profiler cache
+def gprofiler_enrichment(settings, genes):
+    p_organism = settings['organism']
+    p_threshold = float(settings['threshold'])
+    p_threshold_method = settings['threshold_method']
+
+    var = gprofiler_client.profile(settings, genes, p_organism, p_threshold, p_threshold_method)
+    return var
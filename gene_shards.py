@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# Gene-sharded execution of the per-gene meta-analysis steps.
+# The gene universe of a StudySummaries is cut into contiguous shards (genes stay sorted),
+# every shard runs in a worker process and the shard results are concatenated back in shard order,
+# so the merged table is the same whatever the number of workers or the order they finish in.
+
+
+# With this function we cut num_of_genes genes into at most num_of_shards contiguous (start, stop) ranges
+def shard_bounds(num_of_genes, num_of_shards):
+    edges = np.linspace(0, num_of_genes, max(1, min(num_of_shards, num_of_genes)) + 1).astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+# With this function we keep the genes start:stop of a StudySummaries (or of any namedtuple of gene-major arrays
+# built on it, such as the StudyEffects of effect_sizes)
+def slice_summaries(summaries, start, stop):
+    return type(summaries)(*(np.asarray(field[start:stop]) for field in summaries))
+
+
+# The worker side: the summary arrays are memory-mapped from the folder written by map_shards,
+# only the rows of the shard are read
+def _run_shard(func, folder, kind, start, stop, args):
+    fields = [np.load(os.path.join(folder, name + '.npy'), mmap_mode='r') for name in kind._fields]
+    shard = slice_summaries(kind(*fields), start, stop)
+    return func(shard._replace(genes=shard.genes.astype(object)), *args)
+
+
+# With this function we run func(summaries_of_shard, *args) on num_of_shards gene shards and yield the
+# results in shard order as they become available. With workers > 1 the shards run in a process pool and
+# share the summary arrays through .npy files memory-mapped by each worker instead of pickling them.
+def iter_shards(func, summaries, workers, num_of_shards, *args):
+    workers = int(workers)
+    bounds = shard_bounds(len(summaries.genes), num_of_shards)
+    if workers <= 1:
+        for start, stop in bounds:
+            yield func(slice_summaries(summaries, start, stop), *args)
+        return
+
+    folder = tempfile.mkdtemp(prefix='mage_shards_')
+    try:
+        for name, field in zip(summaries._fields, summaries):
+            # gene names are saved as fixed width strings so they can be memory-mapped too
+            np.save(os.path.join(folder, name + '.npy'), field.astype(str) if name == 'genes' else field)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_shard, func, folder, type(summaries), start, stop, args) for start, stop in bounds]
+            for future in futures:
+                yield future.result()
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+# With this function we run func on one gene shard per worker and concatenate the returned DataFrames
+def map_shards(func, summaries, workers, *args):
+    if int(workers) <= 1 or len(summaries.genes) < 2:
+        return func(summaries, *args)
+    return pd.concat(list(iter_shards(func, summaries, workers, int(workers), *args)), ignore_index=True)
@@ -1,73 +1,79 @@
 import pandas as pd
-import numpy as np
-from gprofiler import GProfiler
-
+import gisu_index
+import gisu_references
+import gprofiler_client
+from http.client import HTTPException
+
+
+
+# the references (gene_history and gene info tables) of the running process, read once for all the studies
+_REFERENCES = {}
+
+
+# With this function we get the versions of the reference tables of the reference cache, brought up to date with
+# the web (or the reference_mirror folder) once per process. None when gene_data_online is NO or the cache can not
+# be brought up, the local reference files are used then
+def reference_versions(settings):
+    if settings['gene_data_online'] != 'YES':
+        return None
+    cache_dir = settings.get('reference_cache_dir') or 'data/GISU_references/'
+    mirror = settings.get('reference_mirror') or None
+    key = ('versions', cache_dir, mirror)
+    if key not in _REFERENCES:
+        try:
+            _REFERENCES[key] = gisu_references.sync(cache_dir, mirror, settings.get('refresh_references') == 'YES')
+        except (OSError, ValueError, HTTPException) as e:
+            print('The reference cache could not be brought up (' + str(e) + '), GISU uses the local reference files')
+            _REFERENCES[key] = None
+    return _REFERENCES[key]
+
+
+# With this function we get the gene_history and gene info (NCBI) tables, from the reference cache with
+# gene_data_online or from the local files
+def load_references(settings):
+    versions = reference_versions(settings)
+    if versions is not None:
+        cache_dir = settings.get('reference_cache_dir') or 'data/GISU_references/'
+        return (gisu_references.load_table(cache_dir, 'gene_history', versions['gene_history']),
+                gisu_references.load_table(cache_dir, 'gene_info', versions['gene_info']))
+
+    key = (settings['gene_history_file'], settings['homo_sapiens_file'])
+    if key not in _REFERENCES:
+        # Load Data from local folder
+        gene_history = pd.read_csv(settings['gene_history_file'], delimiter="\t")
+        NCBI_intel = pd.read_csv(settings['homo_sapiens_file'], delimiter="\t")
+        _REFERENCES[key] = gene_history, NCBI_intel
+    return _REFERENCES[key]
+
+
+# With this function we get the probe -> GeneID -> symbol index of a platform, kept in gisu_index_dir and
+# reused while the platform file and the references (the versions of the reference cache or the local files)
+# are unchanged
+def platform_index(settings, platform):
+    platform_file = settings['platforms_folder'] + platform + ".txt"
+
+    def references():
+        gene_history, NCBI_intel = load_references(settings)
+        return pd.read_csv(platform_file, delimiter="\t"), gene_history, NCBI_intel
+
+    versions = reference_versions(settings)
+    if versions is not None:
+        key = gisu_index.files_key([platform_file], versions)
+    else:
+        key = gisu_index.files_key([settings['gene_history_file'], settings['homo_sapiens_file'], platform_file])
+    return gisu_index.platform_index(platform, key, references, settings.get('gisu_index_dir', 'data/GISU_index/'))
 
 
 def run(settings, study, platform):
         transformation_method = settings['transformation_method']
-        if settings['gene_data_online'] == 'YES':
-            # Load data from web
-            try:
-                gene_history = pd.read_csv("https://ftp.ncbi.nih.gov/gene/DATA/gene_history.gz", delimiter="\t",
-                                           usecols=['GeneID', 'Discontinued_GeneID'])
-
-                print(gene_history.head())
-            except:
-                print("Error load Gene History data from web")
-                gene_history = pd.read_csv(settings['gene_history_file'], delimiter="\t")
-
-            try:
-                NCBI_intel = pd.read_csv("https://ftp.ncbi.nih.gov/gene/DATA/GENE_INFO/Mammalia/Homo_sapiens.gene_info.gz",
-                                         delimiter="\t", usecols=['GeneID', 'Symbol'])
-            except:
-                print("Error load data from web")
-                NCBI_intel = pd.read_csv(settings['homo_sapiens_file'], delimiter="\t")
-
-        else:
-            # Load Data from local folder
-            gene_history = pd.read_csv(settings['gene_history_file'], delimiter="\t")
-            NCBI_intel = pd.read_csv(settings['homo_sapiens_file'], delimiter="\t")
-
-        Platform_intel = pd.read_csv(settings['platforms_folder'] + platform + ".txt", delimiter="\t")
+        index = platform_index(settings, platform)
 
         # Get dataframe without first line
         data = study.iloc[2:].copy()
         data.rename(columns={data.columns[0]: "ID_REF"}, inplace=True)
 
-        # Get Gene IDs
-        dataIDs = pd.DataFrame(data["ID_REF"])
-
-        # Gene name update based on gene_history
-        probe_ID_platform = pd.merge(dataIDs, Platform_intel, how="inner", left_on="ID_REF", right_on="ID").drop(
-            columns="ID")
-
-        probe_ID_gene_history = pd.merge(probe_ID_platform, gene_history, how="inner", left_on="SPOT_ID",
-                                         right_on="Discontinued_GeneID").drop(columns=["Discontinued_GeneID", "SPOT_ID"])
-        probe_ID_gene_history_UPDATED = pd.merge(probe_ID_platform, probe_ID_gene_history, how="outer", left_on="ID_REF",
-                                                 right_on="ID_REF")
-        probe_ID_gene_history_UPDATED['SPOT_ID'] = np.where(probe_ID_gene_history_UPDATED.GeneID.notna(),
-                                                            probe_ID_gene_history_UPDATED['GeneID'],
-                                                            probe_ID_gene_history_UPDATED['SPOT_ID'])
-
-        probe_ID_gene_history_UPDATED.drop(columns="GeneID", inplace=True)
-
-        probe_ID_final = probe_ID_gene_history_UPDATED[probe_ID_gene_history_UPDATED['SPOT_ID'] != '-'].copy()
-        probe_ID_final.dropna(axis=0, how="any", inplace=True)
-        probe_ID_final['SPOT_ID'] = probe_ID_final['SPOT_ID'].astype(int)
-
-        probe_ID_NCBI = pd.merge(probe_ID_final, NCBI_intel, how="inner", left_on="SPOT_ID", right_on="GeneID").drop(
-            columns="GeneID")
-
-        final_file = pd.merge(probe_ID_NCBI, data, how="inner", left_on="ID_REF", right_on="ID_REF")
-        final_file.drop(columns="ID_REF", inplace=True)
-
-        for col in final_file.columns[2:]:
-            final_file[col] = final_file[col].astype(float)
-
-        fun = {i: transformation_method for i in list(final_file.columns.values)[2:]}
-        output = final_file.groupby(by=['SPOT_ID', 'Symbol']).agg(fun).reset_index()
-        output.drop(columns="SPOT_ID", inplace=True)
+        # Map the probes to their genes and reduce the probes of each gene
+        output = gisu_index.transform(data, index, transformation_method)
 
         output.loc[-1] = study.iloc[1] # adding a row
         output.loc[-2] = study.iloc[0]  # adding a row
@@ -79,13 +85,18 @@ def run(settings, study, platform):
 
 
 
+# With this function we convert probes to the target_namespace of settings with g:Convert.
+# Converting the probes of all the studies first sends them together, once
+def convert_probes(settings, probes):
+    return gprofiler_client.convert(settings, probes, settings['transformation_organism'],
+                                    settings['target_namespace'])
+
+
 def run_updated_genes(settings, study):
   
    
 
     transformation_method = settings['transformation_method']
-    transformation_organism = settings['transformation_organism']
-    target_name  = settings['target_namespace']
      
     
     data = study.iloc[2:].copy()
@@ -93,12 +104,10 @@ def run_updated_genes(settings, study):
     # Get Gene IDs
     dataIDs = pd.DataFrame(data["ID_REF"])
 
-    # GConvert(probe IDs to Gene Sympols)
-    gp = GProfiler(return_dataframe=True)
-    conv = gp.convert(organism=transformation_organism,
-            query=list(list(data["ID_REF"])),
-            target_namespace= target_name)['converted']
-     
+    # GConvert(probe IDs to Gene Sympols), the probes converted before in the run or recorded in the
+    # g:Profiler cache are not requested again
+    conv = convert_probes(settings, data["ID_REF"])
+
     data["ID_REF"] = conv
     # GConvert(probe IDs to Gene Sympols)
     # print(data)
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+
+# Indexed probe -> GeneID -> symbol mapping of GISU.
+# The index of a platform holds the probes of its platform file that map to a current gene: the GeneID of the probe
+# (SPOT_ID) with a discontinued GeneID replaced by its current one from gene_history (the probes of genes
+# discontinued without a replacement are left out), and its symbol from the Homo sapiens gene info.
+# It is built once from the reference files and kept in index_dir as <platform>.npz with the key of the files it
+# was built from, so the transformation of a study is one lookup of its probes and a grouped reduction of their rows.
+
+INDEX_VERSION = 1
+
+# the probes of a platform with their current GeneIDs and symbols
+GeneIndex = namedtuple('GeneIndex', ['probes', 'gene_ids', 'symbols'])
+
+# the indexes built or read by the running process
+_INDEXES = {}
+
+
+# With this function we get the key of the index of a platform: its version, the name, size and modification
+# time of the reference files it is built from and the versions of any other references (JSON serializable)
+def files_key(paths, versions=None):
+    state = [INDEX_VERSION, versions]
+    for path in paths:
+        stat = os.stat(path)
+        state.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha256(json.dumps(state).encode('utf-8')).hexdigest()
+
+
+# With this function we build the GeneIndex of a platform table (ID, SPOT_ID) from the gene_history
+# (GeneID, Discontinued_GeneID) and gene info (GeneID, Symbol) tables.
+# A probe listed more than once keeps its first row, as does a GeneID of the references
+def build_index(platform_table, gene_history, gene_info):
+    platform_table = platform_table.dropna(subset=['ID']).drop_duplicates(subset=['ID'])
+    probes = platform_table['ID'].astype(str).to_numpy()
+    # SPOT_ID '-' (no gene) becomes NaN
+    gene_ids = pd.to_numeric(platform_table['SPOT_ID'], errors='coerce').to_numpy(dtype=float)
+
+    # gene name update based on gene_history, a current GeneID '-' (no replacement) becomes NaN too
+    history = pd.DataFrame({'discontinued': pd.to_numeric(gene_history['Discontinued_GeneID'], errors='coerce'),
+                            'current': pd.to_numeric(gene_history['GeneID'], errors='coerce')})
+    history = history.dropna(subset=['discontinued']).drop_duplicates(subset=['discontinued'])
+    found = pd.Index(history['discontinued']).get_indexer(gene_ids)
+    gene_ids = np.where(found >= 0, history['current'].to_numpy(dtype=float)[found], gene_ids)
+
+    gene_info = gene_info.assign(GeneID=pd.to_numeric(gene_info['GeneID'], errors='coerce'))
+    gene_info = gene_info.dropna(subset=['GeneID', 'Symbol']).drop_duplicates(subset=['GeneID'])
+    found = pd.Index(gene_info['GeneID']).get_indexer(gene_ids)
+    keep = ~np.isnan(gene_ids) & (found >= 0)
+    return GeneIndex(probes[keep], gene_ids[keep].astype(np.int64),
+                     gene_info['Symbol'].astype(str).to_numpy()[found[keep]])
+
+
+def write_index(path, index, key):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, key=np.array(key), probes=index.probes.astype(str), gene_ids=index.gene_ids,
+                 symbols=index.symbols.astype(str))
+    os.replace(path + '.tmp', path)
+
+
+# With this function we read the GeneIndex of path, None when there is none or it was built with another key
+def read_index(path, key):
+    try:
+        with np.load(path) as table:
+            if str(table['key']) != key:
+                return None
+            return GeneIndex(table['probes'], table['gene_ids'], table['symbols'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+# With this function we get the GeneIndex of a platform. key identifies the references it is built from,
+# references() loads them as (platform table, gene_history, gene info) and is only called when the index has to be
+# built. With an index_dir the index is kept there, otherwise only for the running process
+def platform_index(platform, key, references, index_dir=None):
+    if (platform, key) in _INDEXES:
+        return _INDEXES[(platform, key)]
+    path = os.path.join(index_dir, platform + '.npz') if index_dir else None
+    index = read_index(path, key) if path else None
+    if index is None:
+        index = build_index(*references())
+        if path:
+            write_index(path, index, key)
+    _INDEXES[(platform, key)] = index
+    return index
+
+
+# With this function we map the rows of a study (probe IDs in the first column, expressions in the rest)
+# to the genes of index and reduce the rows of each gene with transformation_method (mean, min or max).
+# The rows of a gene are reduced in probe order, as after the merges with the platform table.
+# Output: a DataFrame with the Symbol and the expression columns of the genes, sorted by GeneID and Symbol
+def transform(data, index, transformation_method):
+    probes = data.iloc[:, 0].astype(str).to_numpy()
+    found = pd.Index(index.probes).get_indexer(probes)
+    rows = np.flatnonzero(found >= 0)
+    rows = rows[np.argsort(probes[rows], kind='stable')]
+
+    values = pd.DataFrame(data.iloc[rows, 1:].to_numpy(dtype=float), columns=data.columns[1:])
+    values.insert(0, 'SPOT_ID', index.gene_ids[found[rows]])
+    values.insert(1, 'Symbol', index.symbols[found[rows]])
+    output = values.groupby(by=['SPOT_ID', 'Symbol']).agg(transformation_method).reset_index()
+    return output.drop(columns='SPOT_ID')
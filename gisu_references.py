@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import urllib.request
+import numpy as np
+import pandas as pd
+
+# Local cache of the NCBI reference tables of GISU (gene_history and the Homo sapiens gene_info).
+# Every table is downloaded, or copied from a mirror folder holding the same .gz files for hosts without network
+# access, parsed once and kept in cache_dir/<table>/<version>/ as one .npy per column, the version being the sha256
+# of the .gz file. manifest.json records the version of each table with the ETag, Last-Modified and size of its
+# source, so a run only checks the source (a HEAD request, or the size and modification time of the mirror file)
+# and fetches the table again when the source changed or a refresh is asked for.
+
+CACHE_VERSION = 1
+
+# the NCBI file and the columns GISU needs of every reference table
+REFERENCE_TABLES = {
+    'gene_history': ('https://ftp.ncbi.nih.gov/gene/DATA/gene_history.gz', ['GeneID', 'Discontinued_GeneID']),
+    'gene_info': ('https://ftp.ncbi.nih.gov/gene/DATA/GENE_INFO/Mammalia/Homo_sapiens.gene_info.gz',
+                  ['GeneID', 'Symbol']),
+}
+
+# seconds to wait for the NCBI server
+TIMEOUT = 60
+
+# the tables loaded by the running process
+_TABLES = {}
+
+
+def read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('cache_version') == CACHE_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'cache_version': CACHE_VERSION, 'tables': {}}
+
+
+def write_manifest(cache_dir, manifest):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = os.path.join(cache_dir, 'manifest.json.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(cache_dir, 'manifest.json'))
+
+
+# With this function we get the source of a table: its file in the mirror folder, or its NCBI url
+def source_of(name, mirror=None):
+    url = REFERENCE_TABLES[name][0]
+    return os.path.join(mirror, url.rsplit('/', 1)[1]) if mirror else url
+
+
+# With this function we describe the current state of a source without fetching it:
+# the size and modification time of a mirror file, the ETag, Last-Modified and size the server reports for a url
+def source_state(source):
+    if not source.startswith(('http://', 'https://')):
+        stat = os.stat(source)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    with urllib.request.urlopen(urllib.request.Request(source, method='HEAD'), timeout=TIMEOUT) as response:
+        return {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified'),
+                'size': response.headers.get('Content-Length')}
+
+
+# With this function we copy (or download) a source to path. Output: the sha256 of the file
+def fetch(source, path):
+    sha = hashlib.sha256()
+    if source.startswith(('http://', 'https://')):
+        stream = urllib.request.urlopen(source, timeout=TIMEOUT)
+    else:
+        stream = open(source, 'rb')
+    with stream, open(path, 'wb') as f:
+        for chunk in iter(lambda: stream.read(1 << 20), b''):
+            sha.update(chunk)
+            f.write(chunk)
+    return sha.hexdigest()
+
+
+# With this function we parse the columns GISU needs of a fetched table into the folder of its version.
+# The GeneIDs are kept as floats, '-' (no GeneID) as NaN
+def parse_table(name, path, folder):
+    columns = REFERENCE_TABLES[name][1]
+    table = pd.read_csv(path, delimiter="\t", usecols=columns, compression='gzip', low_memory=False)
+    os.makedirs(folder, exist_ok=True)
+    for column in columns:
+        if column == 'Symbol':
+            values = table[column].astype(str).to_numpy(dtype=str)
+        else:
+            values = pd.to_numeric(table[column], errors='coerce').to_numpy(dtype=float)
+        np.save(os.path.join(folder, column + '.npy'), values)
+
+
+def _version_folder(cache_dir, name, version):
+    return os.path.join(cache_dir, name, version)
+
+
+def _cached(cache_dir, name, entry):
+    folder = _version_folder(cache_dir, name, entry['version'])
+    return all(os.path.exists(os.path.join(folder, column + '.npy')) for column in REFERENCE_TABLES[name][1])
+
+
+# With this function we bring the table name of the cache up to date with its source and get its manifest entry.
+# The table is fetched again when it is not cached, its source state changed or refresh is set, and parsed again
+# only when the fetched file is a new version. When the source can not be checked the cached version is used
+# (said so), without a cached version the error is raised
+def sync_table(cache_dir, name, mirror=None, refresh=False):
+    manifest = read_manifest(cache_dir)
+    entry = manifest['tables'].get(name)
+    cached = entry is not None and entry['source'] == source_of(name, mirror) and _cached(cache_dir, name, entry)
+    try:
+        state = source_state(source_of(name, mirror))
+    except OSError as e:
+        if not cached:
+            raise
+        print('Could not check the source of ' + name + ' (' + str(e) + '), using its cached version ' +
+              entry['version'][:12] + ' of ' + entry['fetched'])
+        return entry
+    if cached and not refresh and state == entry['state']:
+        return entry
+
+    print('Fetching ' + name + ' from ' + source_of(name, mirror))
+    os.makedirs(cache_dir, exist_ok=True)
+    download = os.path.join(cache_dir, name + '.gz.tmp')
+    try:
+        version = fetch(source_of(name, mirror), download)
+        if not (cached and version == entry['version']):
+            parse_table(name, download, _version_folder(cache_dir, name, version))
+    finally:
+        if os.path.exists(download):
+            os.remove(download)
+
+    # the older versions of the table leave the cache
+    for old in os.listdir(os.path.join(cache_dir, name)):
+        if old != version:
+            shutil.rmtree(os.path.join(cache_dir, name, old), ignore_errors=True)
+    entry = {'source': source_of(name, mirror), 'state': state, 'version': version,
+             'fetched': time.strftime('%Y-%m-%d %H:%M:%S')}
+    manifest['tables'][name] = entry
+    write_manifest(cache_dir, manifest)
+    print(name + ' version ' + version[:12])
+    return entry
+
+
+# With this function we bring every reference table of the cache up to date.
+# Output: the version (sha256) of each table
+def sync(cache_dir, mirror=None, refresh=False):
+    return {name: sync_table(cache_dir, name, mirror, refresh)['version'] for name in REFERENCE_TABLES}
+
+
+# With this function we get a version of a table of the cache as a DataFrame, loaded once per process
+def load_table(cache_dir, name, version):
+    if (name, version) not in _TABLES:
+        folder = _version_folder(cache_dir, name, version)
+        _TABLES[(name, version)] = pd.DataFrame({column: np.load(os.path.join(folder, column + '.npy'))
+                                                 for column in REFERENCE_TABLES[name][1]})
+    return _TABLES[(name, version)]
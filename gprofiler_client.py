@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import requests
+from gprofiler import GProfiler
+
+# Cached client of the g:Profiler requests of MAGE: g:Convert of the GISU probes (updated_genes) and g:GOSt profile
+# of the gprofiler enrichment backend.
+# Every response is kept in gprofiler_cache_dir/<tool>/<key>.json, the key being the sha256 of the request (organism,
+# namespaces, sources, threshold settings, server and the sorted query), so rerunning the same inputs makes no
+# request at all and gprofiler_replay = YES runs from the recorded responses alone (no network).
+# The probes are converted once per process: the probes of all the studies go out together, only the ones not
+# converted yet, in batches of CONVERT_BATCH sent gprofiler_concurrency at a time. A failed request is retried
+# gprofiler_retries times with exponential backoff.
+
+CACHE_VERSION = 1
+
+# the sources of the enrichment analysis
+PROFILE_SOURCES = ["GO:MF", "GO:CC", "GO:BP", "KEGG", "REAC", "WP", "TF", "MIRNA", "HPA", "CORUM", "HP"]
+
+# the columns of profile with the evidences (as GProfiler(return_dataframe=True))
+PROFILE_COLUMNS = ['source', 'native', 'name', 'p_value', 'significant', 'description', 'term_size', 'query_size',
+                   'intersection_size', 'effective_domain_size', 'precision', 'recall', 'query', 'parents',
+                   'intersections', 'evidences']
+
+# probes per g:Convert request
+CONVERT_BATCH = 5000
+
+# seconds before the first retry, doubled at every retry
+BACKOFF = 2
+
+# the conversions of the running process: (organism, target, numeric namespace, server) ---> {probe: converted}
+_CONVERSIONS = {}
+
+
+def _cache_dir(settings):
+    return settings.get('gprofiler_cache_dir') or 'data/gprofiler_cache/'
+
+
+# With this function we get the key of a request (JSON serializable) of a g:Profiler tool
+def request_key(tool, request):
+    return hashlib.sha256(json.dumps([CACHE_VERSION, tool, request], sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# With this function we read the recorded response of request, None when there is none
+def read_response(path, request):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return record['response'] if record.get('request') == request else None
+
+
+def write_response(path, request, response):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'request': request, 'response': response, 'fetched': time.strftime('%Y-%m-%d %H:%M:%S')}, f)
+    os.replace(path + '.tmp', path)
+
+
+# With this function we call the g:Profiler service, again after BACKOFF, 2 * BACKOFF, ... seconds when it fails
+def with_retries(call, retries):
+    for attempt in range(retries + 1):
+        try:
+            return call()
+        except (requests.exceptions.RequestException, AssertionError, ValueError) as e:
+            if attempt == retries:
+                raise
+            print('g:Profiler request failed (' + str(e) + '), retrying in ' + str(BACKOFF * 2 ** attempt) + ' s')
+            time.sleep(BACKOFF * 2 ** attempt)
+
+
+# With this function we get the response of a request of tool: the recorded one, otherwise the one of
+# call(GProfiler client), recorded for the next runs. With gprofiler_replay a request without a recorded
+# response is an error
+def cached_request(settings, tool, request, call):
+    path = os.path.join(_cache_dir(settings), tool, request_key(tool, request) + '.json')
+    response = read_response(path, request)
+    if response is not None:
+        return response
+    if settings.get('gprofiler_replay') == 'YES':
+        raise LookupError('No recorded g:Profiler ' + tool + ' response for this request (' + path + ')')
+
+    client = GProfiler(user_agent='MAGE', base_url=settings.get('gprofiler_url') or None)
+    response = with_retries(lambda: call(client), int(settings.get('gprofiler_retries', 3)))
+    write_response(path, request, response)
+    return response
+
+
+# With this function we convert probes with g:Convert. Output: the converted name of every probe
+# (its first one when it has several, 'None' as g:Convert when it has none)
+def convert(settings, probes, organism, target_namespace, numeric_namespace='ENTREZGENE'):
+    probes = [str(probe) for probe in probes]
+    conversions = _CONVERSIONS.setdefault((organism, target_namespace, numeric_namespace,
+                                           settings.get('gprofiler_url') or None), {})
+    missing = sorted(set(probes) - conversions.keys())
+
+    def convert_batch(query):
+        request = {'organism': organism, 'target': target_namespace, 'numeric_ns': numeric_namespace,
+                   'url': settings.get('gprofiler_url') or None, 'query': query}
+        return cached_request(settings, 'convert', request, lambda client: [
+            [row['incoming'], row['converted']] for row in client.convert(
+                query=query, organism=organism, target_namespace=target_namespace,
+                numeric_namespace=numeric_namespace)])
+
+    batches = [missing[start:start + CONVERT_BATCH] for start in range(0, len(missing), CONVERT_BATCH)]
+    if batches:
+        print('g:Convert of ' + str(len(missing)) + ' probes in ' + str(len(batches)) + ' requests')
+    with ThreadPoolExecutor(max_workers=max(1, int(settings.get('gprofiler_concurrency', 2)))) as pool:
+        for pairs in pool.map(convert_batch, batches):
+            for incoming, converted in pairs:
+                conversions.setdefault(incoming, converted)
+    for probe in missing:
+        conversions.setdefault(probe, 'None')
+    return [conversions[probe] for probe in probes]
+
+
+# With this function we conduct the g:GOSt enrichment analysis of the genes.
+# Output: a DataFrame of the PROFILE_COLUMNS
+def profile(settings, genes, organism, threshold, threshold_method):
+    query = sorted(set(str(gene) for gene in genes))
+    request = {'organism': organism, 'query': query, 'sources': PROFILE_SOURCES, 'user_threshold': threshold,
+               'significance_threshold_method': threshold_method, 'all_results': True, 'ordered': False,
+               'combined': False, 'measure_underrepresentation': False, 'no_iea': False, 'no_evidences': False,
+               'domain_scope': 'annotated', 'numeric_namespace': 'AFFY_HUGENE_1_0_ST_V1',
+               'url': settings.get('gprofiler_url') or None}
+    parameters = {name: value for name, value in request.items() if name != 'url'}
+    result = cached_request(settings, 'profile', request, lambda client: client.profile(**parameters))
+    return pd.DataFrame(result, columns=PROFILE_COLUMNS)
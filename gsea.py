@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+import local_enrichment
+
+# Preranked gene set enrichment analysis (GSEA) of the whole ranking of a meta-analysis, no network needed.
+# The genes are ranked by a signed statistic and every gene set of the GMT files (read by local_enrichment) gets the
+# weighted running-sum enrichment score of Subramanian et al. (2005). The running sum only changes direction at the
+# genes of the set, so a score comes from the ranks of those genes alone and all the sets are scored at once with
+# their ranks laid out one after the other (CSR style).
+# The null distribution permutes the gene labels (random sets of the same sizes). The permutations run in batches
+# of a fixed size, each with its own seed spawned from the seed of the run, so the results are the same whatever
+# the number of workers.
+
+GSEA_COLUMNS = ['source', 'native', 'name', 'size', 'ES', 'NES', 'p_value', 'FDR', 'leading_edge']
+
+# number of (permutation, set gene) cells scored at a time
+BATCH_CELLS = 1 << 22
+
+
+# With this function we get the ranking of the genes of a meta-analysis results table, by the signed z
+# (z_test_value with the sign of the effect size) or by the effect size (rank_by = effect_size).
+# A gene listed more than once keeps its first row. Output: the genes and their statistics, from the top
+def ranking(meta_analysis_df, rank_by='z'):
+    df = meta_analysis_df.drop_duplicates(subset=['Genes'])
+    if 'E(mu)' in df.columns:
+        effect, z = df['E(mu)'].to_numpy(dtype=float), df['z'].to_numpy(dtype=float)
+    else:
+        effect = df["Effect size (Hedge's g)"].to_numpy(dtype=float)
+        z = df['z_test_value'].to_numpy(dtype=float)
+    statistic = effect if rank_by == 'effect_size' else np.sign(effect) * np.abs(z)
+    keep = np.isfinite(statistic)
+    genes, statistic = df['Genes'].to_numpy()[keep], statistic[keep]
+    order = np.argsort(-statistic, kind='stable')
+    return genes[order], statistic[order]
+
+
+# With this function we get the running sums of gene sets at their genes.
+# ranks: (batch x set genes) ranks in the ranking (0 = top), the genes of set s in the columns
+# offsets[s]:offsets[s + 1], weights: the weight |statistic|^p of every rank.
+# Output: the sorted ranks and the running sum just after and just before every gene of the sets
+def running_sums(ranks, offsets, weights):
+    num_of_genes = len(weights)
+    sizes = np.diff(offsets)
+    start = np.repeat(offsets[:-1], sizes)
+    shift = np.repeat(np.arange(len(sizes)), sizes) * num_of_genes
+    # the ranks of every set in ascending order
+    ranks = np.sort(ranks + shift, axis=1) - shift
+
+    w = weights[ranks]
+    cum = np.cumsum(w, axis=1)
+    cum = cum - np.where(start > 0, cum[:, start - 1], 0.0)
+    total = cum[:, offsets[1:] - 1]
+    # the genes of the ranking before each gene that are not in the set
+    misses = ranks - (np.arange(ranks.shape[1]) - start)
+    miss_step = np.repeat(1.0 / (num_of_genes - sizes), sizes)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        after = cum / np.repeat(total, sizes, axis=1) - misses * miss_step
+        before = (cum - w) / np.repeat(total, sizes, axis=1) - misses * miss_step
+    return ranks, after, before
+
+
+# With this function we get the enrichment scores (batch x sets) of the ranks of running_sums: the largest
+# deviation of the running sum from zero, which it starts and ends at
+def enrichment_scores(ranks, offsets, weights):
+    ranks, after, before = running_sums(ranks, offsets, weights)
+    es_max = np.maximum(np.maximum.reduceat(after, offsets[:-1], axis=1), 0)
+    es_min = np.minimum(np.minimum.reduceat(before, offsets[:-1], axis=1), 0)
+    return np.where(es_max >= -es_min, es_max, es_min)
+
+
+# The scores of one batch of permutations: every permutation moves the genes of the sets to random ranks
+def _null_batch(ranks, offsets, weights, seed, num_of_permutations):
+    rng = np.random.default_rng(seed)
+    permutations = np.array([rng.permutation(len(weights)) for i in range(num_of_permutations)])
+    return enrichment_scores(permutations[:, ranks], offsets, weights)
+
+
+# With this function we get the (permutations x sets) null enrichment scores, computed in batches of a fixed size
+# with the seeds spawned from seed, on workers processes
+def null_scores(ranks, offsets, weights, num_of_permutations, seed, workers=1):
+    # a permutation holds every rank of the ranking
+    batch = max(1, min(num_of_permutations, BATCH_CELLS // max(len(ranks), len(weights), 1)))
+    sizes = [min(batch, num_of_permutations - start) for start in range(0, num_of_permutations, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if int(workers) <= 1 or len(sizes) == 1:
+        batches = [_null_batch(ranks, offsets, weights, s, n) for s, n in zip(seeds, sizes)]
+    else:
+        with ProcessPoolExecutor(max_workers=int(workers)) as pool:
+            batches = list(pool.map(_null_batch, *zip(*[(ranks, offsets, weights, s, n)
+                                                        for s, n in zip(seeds, sizes)])))
+    return np.concatenate(batches, axis=0)
+
+
+# the scores divided by the mean of the null scores of the same sign of their set (columns)
+def _normalize(scores, null):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        positive = np.where(null >= 0, null, 0).sum(axis=0) / (null >= 0).sum(axis=0)
+        negative = -np.where(null < 0, null, 0).sum(axis=0) / (null < 0).sum(axis=0)
+        return np.where(scores >= 0, scores / positive, scores / negative)
+
+
+# With this function we get the nominal p values of the scores of the sets (the fraction of the null scores of the
+# same sign that are as extreme) and the FDR of their normalized scores against the null of all the sets
+def significance(es, nes, null, null_nes):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p_value = np.where(es >= 0, (null >= es).sum(axis=0) / (null >= 0).sum(axis=0),
+                           (null <= es).sum(axis=0) / (null < 0).sum(axis=0))
+
+        # the fraction of null and of observed normalized scores at least as extreme, within their sign
+        null_positive = np.sort(null_nes[null_nes >= 0].ravel())
+        null_negative = np.sort(null_nes[null_nes < 0].ravel())
+        observed_positive, observed_negative = np.sort(nes[nes >= 0]), np.sort(nes[nes < 0])
+        null_fraction = np.where(nes >= 0, (len(null_positive) - np.searchsorted(null_positive, nes)) /
+                                 len(null_positive), np.searchsorted(null_negative, nes, side='right') /
+                                 len(null_negative))
+        observed_fraction = np.where(nes >= 0, (len(observed_positive) - np.searchsorted(observed_positive, nes)) /
+                                     len(observed_positive), np.searchsorted(observed_negative, nes, side='right') /
+                                     len(observed_negative))
+        fdr = np.minimum(null_fraction / observed_fraction, 1)
+    return p_value, fdr
+
+
+# With this function we conduct the preranked GSEA of the ranked genes (from the top) and their statistics
+# against gene_sets. Only the sets with min_size to max_size genes of the ranking, and not all of them, are tested.
+# Output: the tested sets with their ES, NES, nominal p value, FDR and leading edge genes, by FDR and p value
+def preranked_gsea(gene_sets, genes, statistic, num_of_permutations=1000, seed=0, weight=1.0, min_size=15,
+                   max_size=500, workers=1):
+    # the rank of every gene of the gene sets (its first one), -1 when it is not in the ranking
+    upper = pd.Series([str(gene).upper() for gene in genes])
+    first = np.flatnonzero(~upper.duplicated().to_numpy())
+    rank_of = pd.Index(upper.to_numpy()[first]).get_indexer(gene_sets.genes)
+    rank_of = np.where(rank_of >= 0, first[rank_of], -1)
+    term = np.repeat(np.arange(len(gene_sets.native)), np.diff(gene_sets.offsets))
+    ranks = rank_of[gene_sets.term_genes]
+    term, ranks = term[ranks >= 0], ranks[ranks >= 0]
+    sizes = np.bincount(term, minlength=len(gene_sets.native))
+    tested = np.flatnonzero((sizes >= min_size) & (sizes <= max_size) & (sizes < len(genes)))
+    ranks = ranks[np.isin(term, tested)]
+    offsets = np.concatenate([[0], np.cumsum(sizes[tested])])
+    if len(tested) == 0:
+        return pd.DataFrame(columns=GSEA_COLUMNS)
+
+    weights = np.abs(np.asarray(statistic, dtype=float)) ** float(weight)
+    sorted_ranks, after, before = running_sums(ranks[None, :], offsets, weights)
+    es = enrichment_scores(ranks[None, :], offsets, weights)[0]
+    null = null_scores(ranks, offsets, weights, num_of_permutations, seed, workers)
+    nes, null_nes = _normalize(es, null), _normalize(null, null)
+    p_value, fdr = significance(es, nes, null, null_nes)
+
+    # the leading edge: the genes of the set up to the peak of the running sum (from the bottom when ES < 0)
+    leading_edge = []
+    for s in range(len(tested)):
+        set_ranks = sorted_ranks[0, offsets[s]:offsets[s + 1]]
+        if es[s] >= 0:
+            edge = set_ranks[:np.argmax(after[0, offsets[s]:offsets[s + 1]]) + 1]
+        else:
+            edge = set_ranks[np.argmin(before[0, offsets[s]:offsets[s + 1]]):]
+        leading_edge.append(list(np.asarray(genes)[edge]))
+
+    results = pd.DataFrame({'source': gene_sets.source[tested], 'native': gene_sets.native[tested],
+                            'name': gene_sets.name[tested], 'size': sizes[tested], 'ES': es, 'NES': nes,
+                            'p_value': p_value, 'FDR': fdr, 'leading_edge': leading_edge}, columns=GSEA_COLUMNS)
+    return results.sort_values(by=['FDR', 'p_value'], kind='stable').reset_index(drop=True)
+
+
+def run(settings, meta_analysis_df):
+    genes, statistic = ranking(meta_analysis_df, settings.get('gsea_rank_by', 'z'))
+    seed = settings.get('gsea_seed')
+    return preranked_gsea(local_enrichment.gene_sets_of(settings.get('gmt_dir', 'data/GMT/')), genes, statistic,
+                          int(settings.get('gsea_permutations', 1000)), int(seed) if seed else None,
+                          float(settings.get('gsea_weight', 1)), int(settings.get('gsea_min_size', 15)),
+                          int(settings.get('gsea_max_size', 500)), int(settings.get('workers', 1)))
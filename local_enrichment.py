@@ -0,0 +1,142 @@
+import os
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from scipy.stats import hypergeom
+import multiple_testing
+
+# Local (offline) enrichment analysis, an alternative to g:Profiler that returns the same columns.
+# The gene sets are read from the GMT files of a folder (term ID, name, genes) and indexed once per process:
+# every gene gets an integer and the genes of every term are a sorted integer array, all laid out one after the
+# other (CSR style). The query is a mask over the genes, so the intersections of all terms are one gather and one
+# sum. As g:Profiler with domain_scope='annotated', every source is tested against its own domain (the genes
+# annotated in it) with the hypergeometric test and its p values are corrected over its terms.
+
+# The gene sets: genes (upper case symbols), source / native / name of every term, the gene integers of all the
+# terms and the offsets where the genes of each term start (offsets[-1] == len(term_genes))
+GeneSets = namedtuple('GeneSets', ['genes', 'source', 'native', 'name', 'term_genes', 'offsets'])
+
+# the columns of the results, as g:Profiler's profile
+RESULT_COLUMNS = ['source', 'native', 'name', 'p_value', 'significant', 'description', 'term_size', 'query_size',
+                  'intersection_size', 'effective_domain_size', 'precision', 'recall', 'query', 'parents',
+                  'intersections', 'evidences']
+
+# the gene sets read by the running process
+_GENE_SETS = {}
+
+
+# With this function we get the source of the terms of a GMT file: the one in the name of a g:Profiler
+# source file (<organism>.<source>.name.gmt), otherwise the prefix of each term ID (KEGG:00010 ---> KEGG)
+# or, without one, the name of the file
+def term_sources(filename, natives):
+    parts = os.path.basename(filename).split('.')
+    if len(parts) == 4 and parts[2] == 'name':
+        return [parts[1]] * len(natives)
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return [native.split(':', 1)[0] if ':' in native else stem for native in natives]
+
+
+# With this function we read the GMT files of gmt_dir into GeneSets.
+# A gene listed twice in a term counts once, the genes of a term are sorted by their integer
+def read_gene_sets(gmt_dir):
+    sources, natives, names, members = [], [], [], []
+    for filename in sorted(name for name in os.listdir(gmt_dir) if name.lower().endswith('.gmt')):
+        with open(os.path.join(gmt_dir, filename), 'r', encoding='utf-8') as f:
+            terms = [line.rstrip('\r\n').split('\t') for line in f if line.strip()]
+        terms = [fields for fields in terms if len(fields) >= 3]
+        sources.extend(term_sources(filename, [fields[0] for fields in terms]))
+        natives.extend(fields[0] for fields in terms)
+        names.extend(fields[1] for fields in terms)
+        members.extend([gene.strip().upper() for gene in fields[2:] if gene.strip()] for fields in terms)
+
+    genes, codes = np.unique(np.array([gene for term in members for gene in term], dtype=str), return_inverse=True)
+    lengths = np.array([len(term) for term in members], dtype=np.int64)
+    # sort the genes of every term and drop the repeated ones
+    term = np.repeat(np.arange(len(members)), lengths)
+    order = np.lexsort((codes, term))
+    term, codes = term[order], codes[order]
+    keep = np.ones(len(codes), dtype=bool)
+    keep[1:] = (term[1:] != term[:-1]) | (codes[1:] != codes[:-1])
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(term[keep], minlength=len(members)))])
+    return GeneSets(genes, np.array(sources, dtype=object), np.array(natives, dtype=object),
+                    np.array(names, dtype=object), codes[keep].astype(np.int64), offsets)
+
+
+# With this function we get the GeneSets of gmt_dir, read once per process
+def gene_sets_of(gmt_dir):
+    if gmt_dir not in _GENE_SETS:
+        _GENE_SETS[gmt_dir] = read_gene_sets(gmt_dir)
+    return _GENE_SETS[gmt_dir]
+
+
+# With this function we get the g:SCS-style adjusted p values of the terms of one source: the p values are
+# multiplied by the number of terms that could reach the threshold at all, the ones whose smallest possible
+# p value (every gene of the query that can be in the term is in it) is not above it
+def g_scs(p, term_size, query_size, domain_size, threshold):
+    best = hypergeom.sf(np.minimum(term_size, query_size) - 1, domain_size, term_size, query_size)
+    testable = max(int((best <= threshold).sum()), 1)
+    return np.minimum(p * testable, 1)
+
+
+# With this function we correct the p values of the terms of one source with threshold_method
+# (fdr, bonferroni or g_SCS)
+def correct(p, term_size, query_size, domain_size, threshold, threshold_method):
+    if threshold_method == 'g_SCS':
+        return g_scs(p, term_size, query_size, domain_size, threshold)
+    method = {'fdr': 'fdr_bh', 'false_discovery_rate': 'fdr_bh', 'bonferroni': 'bonferroni'}.get(threshold_method)
+    if method is None:
+        raise ValueError('Unknown threshold method: ' + threshold_method)
+    return multiple_testing.adjusted_p_values(p, [method])[method]
+
+
+# With this function we conduct the enrichment analysis of the genes against gene_sets.
+# Output: the terms with at least one gene of the query in the columns of g:Profiler, by adjusted p value
+def enrichment(gene_sets, genes, threshold, threshold_method):
+    query = pd.unique(np.array([str(gene) for gene in genes], dtype=object))
+    found = pd.Index(gene_sets.genes).get_indexer([gene.upper() for gene in query])
+    in_query = np.zeros(len(gene_sets.genes), dtype=bool)
+    in_query[found[found >= 0]] = True
+    # the query gene of each gene set gene
+    query_gene = np.full(len(gene_sets.genes), None, dtype=object)
+    query_gene[found[found >= 0]] = query[found >= 0]
+
+    num_of_terms = len(gene_sets.native)
+    term_size = np.diff(gene_sets.offsets)
+    term = np.repeat(np.arange(num_of_terms), term_size)
+    hits = in_query[gene_sets.term_genes]
+    intersection_size = np.bincount(term, weights=hits, minlength=num_of_terms).astype(np.int64)
+
+    # the domain of every source: the genes annotated in any of its terms
+    source, sources = pd.factorize(gene_sets.source)
+    pairs = np.unique(source[term] * len(gene_sets.genes) + gene_sets.term_genes)
+    pair_source, pair_gene = np.divmod(pairs, len(gene_sets.genes))
+    domain_size = np.bincount(pair_source, minlength=len(sources))[source]
+    query_size = np.bincount(pair_source, weights=in_query[pair_gene], minlength=len(sources)).astype(np.int64)[source]
+
+    p_value = hypergeom.sf(intersection_size - 1, domain_size, term_size, query_size)
+    p_value = np.where(intersection_size > 0, p_value, 1.0)
+    for i in range(len(sources)):
+        terms = np.flatnonzero(source == i)
+        p_value[terms] = correct(p_value[terms], term_size[terms], query_size[terms], domain_size[terms], threshold,
+                                 threshold_method)
+
+    reported = np.flatnonzero(intersection_size > 0)
+    intersections = [list(query_gene[gene_sets.term_genes[gene_sets.offsets[t]:gene_sets.offsets[t + 1]][
+        hits[gene_sets.offsets[t]:gene_sets.offsets[t + 1]]]]) for t in reported]
+    results = pd.DataFrame({
+        'source': gene_sets.source[reported], 'native': gene_sets.native[reported],
+        'name': gene_sets.name[reported], 'p_value': p_value[reported],
+        'significant': p_value[reported] <= threshold, 'description': gene_sets.name[reported],
+        'term_size': term_size[reported], 'query_size': query_size[reported],
+        'intersection_size': intersection_size[reported], 'effective_domain_size': domain_size[reported],
+        'precision': intersection_size[reported] / query_size[reported],
+        'recall': intersection_size[reported] / term_size[reported], 'query': 'query_1',
+        'parents': [[] for t in reported], 'intersections': intersections,
+        # GMT files hold no evidence codes
+        'evidences': [[[] for gene in genes_of_term] for genes_of_term in intersections]}, columns=RESULT_COLUMNS)
+    return results.sort_values(by=['p_value', 'source', 'native'], kind='stable').reset_index(drop=True)
+
+
+def run(settings, genes):
+    return enrichment(gene_sets_of(settings.get('gmt_dir', 'data/GMT/')), genes, float(settings['threshold']),
+                      settings['threshold_method'])
@@ -12,12 +12,19 @@ import os
 import plots
 import enrichment_analysis
 import simple_meta_analysis
-from statsmodels.stats import multitest
-
-global settings, gprofiler_settings, version, studies
+import study_io
+import result_writer
+import checkpoints
+import study_store
+import effect_sizes
+import gsea
+from summary_stats import build_summaries
+from multiple_testing import adjusted_p_values, ADJUSTED_METHODS
+
+global settings, gprofiler_settings, version
 settings = {}
-studies = []
-studies_transform = []
+# the GISU platform of every study file, by name
+platforms = {}
 version = '1.0.4'
 
 
@@ -28,6 +35,17 @@ def parse_args():
     # One argument for the configuration file conf.txt
     parser.add_argument('-c', metavar='--conf', required=True, help='Configuration File', type=str, default='conf.txt')
     parser.add_argument('-o', metavar='--output', required=True, help='Output Directory', type=str, default='results/')
+    # Reuse the checkpoints of the output directory for the stages whose settings and inputs are unchanged
+    parser.add_argument('--resume', action='store_true', help='Resume from the stage checkpoints of the output directory')
+    # Incremental meta-analysis: the per-study statistics are kept in the study store of the output directory
+    # and only the new or changed studies of study_dir are summarized again
+    parser.add_argument('--add-study', metavar='STUDY', nargs='*', default=None,
+                        help='Pool the studies of study_dir through the study store, summarizing again the given ones')
+    parser.add_argument('--remove-study', metavar='STUDY', nargs='+', default=None,
+                        help='Leave the given studies of study_dir out of the study store and the pool')
+    # Fetch the GISU reference tables again (from the web or the reference_mirror) whatever their cached version
+    parser.add_argument('--refresh-references', action='store_true',
+                        help='Fetch the GISU reference tables again instead of checking their cached version')
 
     args = parser.parse_args()
     return args
@@ -48,20 +66,161 @@ def apply_multiple_testing_corrections(df, alpha):
     - Modified DataFrame with new columns for each of the adjusted p-values.
     """
     # Extract the p-values from the specified column
-    pvals = df['p_value']
-
-    # Apply multiple testing correction methods
-    methods = ['fdr_bh', 'holm-sidak', 'simes-hochberg', 'bonferroni', 'holm']
-    corrected_p_values = {}
+    pvals = df['p_value'].to_numpy(dtype=float)
 
-    for method in methods:
-        corrected_p_values[method] = multitest.multipletests(pvals, alpha=alpha, method=method, is_sorted=False)[1]
+    # Apply multiple testing correction methods, the p values are sorted once for all of them
+    corrected_p_values = adjusted_p_values(pvals, ADJUSTED_METHODS)
 
     # Add the corrected p-values as new columns in the DataFrame
     for method, values in corrected_p_values.items():
         df[f'{method}_adj_p_value'] = values
 
     return df
+
+
+# With this function we run the meta-analysis of the loaded (summaries and expressions) studies writing its per-gene results into <results>.partial.txt
+# of the output folder shard by shard (stream_chunk_genes genes each) while they are computed.
+# The multiple testing columns are then added by a final pass over that file into <results>.txt
+# (and <results>.parquet with parquet_results). Output: the path of the results file
+def stream_meta_analysis(loaded, filepath, alpha):
+    bayes = settings['bayesian_meta_analysis'] == 'YES'
+    name = filepath + ('bayesian_meta_analysis_results' if bayes else 'meta_analysis_results')
+    parquet = settings.get('parquet_results') == 'YES'
+
+    summaries, expressions_team1, expressions_team2 = loaded
+    num_of_shards = max(int(settings.get('workers', 1)),
+                        -(-len(summaries.genes) // int(settings.get('stream_chunk_genes', 5000))))
+    result_writer.write_chunks(
+        meta_analysis.iter_results(settings, summaries, expressions_team1, expressions_team2, num_of_shards),
+        name + '.partial.txt', name + '.partial.parquet' if parquet else None)
+
+    def multiple_tests(df):
+        columns = meta_analysis.multiple_test_columns(settings, df)
+        if not bayes:
+            corrected = apply_multiple_testing_corrections(df[['p_value']].copy(), alpha=alpha)
+            columns = pd.concat([columns, corrected.drop(columns='p_value')], axis=1)
+        return columns
+
+    result_writer.add_columns(name + '.partial.txt', name + '.txt', meta_analysis.multiple_test_inputs(settings),
+                              multiple_tests, name + '.parquet' if parquet else None, name + '.partial.parquet')
+    for partial in (name + '.partial.txt', name + '.partial.parquet'):
+        if os.path.exists(partial):
+            os.remove(partial)
+    return name + '.txt'
+
+
+# With this function we load the study files of file_list, GISU-transformed when run_gisu is set.
+# The loaded and the transformed studies are stage checkpoints of the run
+def load_data(file_list, filepath, resume, studies_key, data_key):
+    cached = settings.get('study_cache') == 'YES' or settings.get('memory_map') == 'YES'
+
+    def read_studies():
+        studies = []
+        for i in range(len(file_list)):
+            # Read file data
+            studies.append(read_study(file_list[i]))
+        return studies
+
+    # with the study cache (memory-mapped or not) the studies are read again from it instead of being checkpointed
+    studies = checkpoints.run_stage(filepath, 'studies', studies_key, read_studies, resume,
+                                    save_value=not cached)
+    if settings.get('run_gisu') != 'YES':
+        return studies
+
+    def transform_studies():
+        print("Gene ID/Symbol update started")
+        if settings['updated_genes'] == 'YES':
+            # the probes of all the studies go to g:Convert together
+            gisu.convert_probes(settings, np.concatenate([study_io.to_frame(study).iloc[2:, 0].to_numpy()
+                                                          for study in studies]))
+        studies_transform = []
+        for i, study in enumerate(studies):
+            studies_transform.append(transform_study(study, file_list[i]))
+        return studies_transform
+
+    return checkpoints.run_stage(filepath, 'gisu', data_key, transform_studies, resume)
+
+
+# With this function we read the study file name of study_dir.
+# Parsed studies can be kept in a binary cache so repeated runs skip the text parsing,
+# memory_map keeps their expression matrices on disk (memory-mapped from the cache) instead of in memory
+def read_study(name):
+    memory_map = settings.get('memory_map') == 'YES'
+    cache_dir = settings.get('cache_dir', 'cache/') if settings.get('study_cache') == 'YES' or memory_map else None
+    studypath = settings['study_dir'] + '/' + name.strip()
+    return study_io.read_study(studypath, cache_dir, settings.get('cache_dtype', 'float64'), memory_map)
+
+
+# With this function we get the GISU platform of every study file of study_dir: the platforms of the platform
+# setting are given in the order of the study_dir listing, whichever studies a run pools
+def study_platforms(study_files):
+    names = list(settings.get('platform', '').split(","))
+    return {name.strip(): names[i] if i < len(names) else None for i, name in enumerate(study_files)}
+
+
+# With this function we GISU-transform the study of the file name (with its platform)
+def transform_study(study, name):
+    study = study_io.to_frame(study)
+    if settings['updated_genes'] == 'YES':
+        study_transform = gisu.run_updated_genes(settings, study)
+    else:
+        study_transform = gisu.run(settings, study, platforms[name.strip()])
+    return study_io.parse_study(study_transform)
+
+
+# With this function we get the StudySummaries of the studies of file_list through the study store
+# of the output directory: only the studies that are new, changed or in added are read and summarized
+def store_summaries(file_list, filepath, added):
+    gisu_run = settings.get('run_gisu') == 'YES'
+    keys = [study_store.study_key(settings, {'platform': platforms[name.strip()],
+                                             'references': gisu.reference_versions(settings)}
+                                  if gisu_run and settings['updated_genes'] != 'YES' else None)
+            for name in file_list]
+
+    def compute(i):
+        study = read_study(file_list[i])
+        if gisu_run:
+            study = transform_study(study, file_list[i])
+        return meta_analysis.study_statistics(study, settings['controls'], settings['cases'])
+
+    study_genes, study_stats = study_store.sync(filepath, settings['study_dir'], file_list, keys, compute, added)
+    return build_summaries(study_genes, study_stats)
+
+
+# With this function we add the multiple testing columns (and, unless Bayesian, the corrected p values)
+# to the per-gene results of meta_analysis.results_table
+def multiple_testing_stage(settings, meta_analysis_df, alpha):
+    meta_analysis_df = meta_analysis.add_multiple_tests(settings, meta_analysis_df)
+    if settings['bayesian_meta_analysis'] != 'YES':
+        meta_analysis_df = apply_multiple_testing_corrections(meta_analysis_df, alpha=alpha)
+    return meta_analysis_df
+
+
+# With this function we write the summary of the prior sweep of a Bayesian results table
+def prior_sweep_summary(bayesian_df, filepath):
+    summary, changing = meta_analysis.prior_sensitivity(bayesian_df, meta_analysis.bayesian_priors(settings))
+    summary.to_csv(filepath + 'bayesian_prior_sweep_summary.txt', sep='\t', index=False, mode='w')
+    print(str(changing) + ' genes change significance across the ' + str(len(summary)) + ' priors')
+
+
+# With this function we get the state of the GMT files of gmt_dir, which the local enrichment and the GSEA read
+def gmt_files_state():
+    gmt_dir = settings.get('gmt_dir', 'data/GMT/')
+    return checkpoints.files_state(gmt_dir, [name for name in os.listdir(gmt_dir) if name.lower().endswith('.gmt')])
+
+
+# With this function we conduct the preranked GSEA of the whole ranking of a results table
+# and write it to the output directory
+def preranked_gsea(metanalysis_df, filepath, results_key='', resume=False):
+    print('Preranked GSEA started')
+    gsea_df = checkpoints.run_stage(filepath, 'gsea',
+                                    checkpoints.stage_key(settings, 'gsea', results_key, inputs=gmt_files_state()),
+                                    lambda: gsea.run(settings, metanalysis_df), resume)
+    gsea_df.to_csv(filepath + 'gsea_results.txt', sep='\t', index=None, mode='w')
+    print(str(int((gsea_df['FDR'] < float(settings['threshold'])).sum())) + ' of ' + str(len(gsea_df)) +
+          ' gene sets with FDR < ' + settings['threshold'])
+
+
 def parse_conf(conf_filename):
     print("Preparing System Configuration (" + conf_filename + ")")
     """Parse configuration arguments."""
@@ -82,14 +241,28 @@ if __name__ == '__main__':
     # initialization step
     args = parse_args()
     parse_conf(args.c)
+    renderer = plots.renderer(settings)
+    if args.refresh_references:
+        settings['refresh_references'] = 'YES'
     filepath = args.o
 
     print("Loading File data")
     #file_list = list(settings['study_files'].split(","))
     file_list = os.listdir(settings['study_dir'])
-    print(file_list)
+    platforms.update(study_platforms(file_list))
     alpha = float(settings['significance_level'])
 
+    # --add-study / --remove-study pool the per-study statistics of the study store,
+    # which only the random-effects and the Bayesian meta-analysis are computed from
+    incremental = args.add_study is not None or args.remove_study is not None
+    if incremental:
+        if settings.get('run_simple_meta_analysis') == 'YES' or settings['multivariate'] == 'YES' or \
+                (settings['bootstrap'] == 'YES' and settings['bayesian_meta_analysis'] != 'YES'):
+            print('--add-study and --remove-study need the random-effects or the Bayesian meta-analysis')
+            exit()
+        file_list = study_store.pooled_studies(filepath, file_list, args.add_study or [], args.remove_study or [])
+    print(file_list)
+
     if settings.get('run_simple_meta_analysis') == 'YES':
         # Run simple meta-analysis
         metanalysis_df = simple_meta_analysis.simple_meta_analysis(file_list,settings['study_dir'],float(settings['significance_level']),settings['multiple_comparisons'])
@@ -97,7 +270,7 @@ if __name__ == '__main__':
 
         # create and save plots
         if settings.get('plots') == 'YES':
-            plots.meta_analysis_plots(metanalysis_df, filepath, alpha)
+            plots.meta_analysis_plots(renderer, metanalysis_df, filepath, alpha)
 
         if settings.get('enrichment_analysis') == 'YES':
             print('Enrichment Analysis started')
@@ -112,8 +285,12 @@ if __name__ == '__main__':
             enrichment_analysis_df.to_csv(filepath + 'enrichment_analysis_results.txt',
                                           header=enrichment_analysis_df.columns, index=None, sep='\t', mode='w')
             if settings.get('plots') == 'YES':
-                plots.ea_manhattan_plot(enrichment_analysis_df, filepath, settings['threshold'])
-                plots.ea_heatmap_plot(enrichment_analysis_df, filepath)
+                plots.ea_manhattan_plot(renderer, enrichment_analysis_df, filepath, settings['threshold'])
+                plots.ea_heatmap_plot(renderer, enrichment_analysis_df, filepath)
+
+        if settings.get('gsea') == 'YES':
+            preranked_gsea(metanalysis_df, filepath)
+        plots.wait(renderer)
         t1 = time.time()
         total = t1 - t0
         print("Execution time = " + str(total) + '\t' + '  seconds')
@@ -122,48 +299,96 @@ if __name__ == '__main__':
 
 
 
-    for i in range(len(file_list)):
-        # Read file data
-        studypath = settings['study_dir'] +'/'+ file_list[i].strip()
-        file = pd.read_csv(studypath, sep='\t', low_memory=False, header=None,encoding = 'unicode_escape')
-        studies.append(file)
-
-    if settings.get('run_gisu') == 'YES':
-        print("Gene ID/Symbol update started")
-        platforms = list(settings['platform'].split(","))
-
-        for study in studies:
-            if settings['updated_genes'] == 'YES':
-                study_transform = gisu.run_updated_genes(settings, study)
-            else:
-                study_transform = gisu.run(settings, study, platforms[i])
-            studies_transform.append(study_transform)
-        data = studies_transform
-    else:
-        data = studies
+    # Every stage depends on its settings and on the key of the stage before it,
+    # with --resume the stages whose key is unchanged are loaded from their checkpoints
+    resume = args.resume
+    studies_key = checkpoints.stage_key(settings, 'studies',
+                                        inputs=checkpoints.files_state(settings['study_dir'], file_list))
+    # the GISU platform transformation also depends on the versions of the reference tables it maps with
+    data_key = checkpoints.stage_key(settings, 'gisu', studies_key,
+                                     inputs=gisu.reference_versions(settings)
+                                     if settings.get('updated_genes') != 'YES' else None) \
+        if settings.get('run_gisu') == 'YES' else studies_key
 
     if settings['multivariate'] == 'YES':
         print('Multivariate Analysis started')
-        metanalysis_df = multivariate.run(settings, data, filepath)
+        results_key = checkpoints.stage_key(settings, 'multivariate', data_key)
+        metanalysis_df = checkpoints.run_stage(
+            filepath, 'multivariate', results_key,
+            lambda: multivariate.run(settings, load_data(file_list, filepath, resume, studies_key, data_key)),
+            resume)
 
         metanalysis_df.to_csv(filepath + 'multivariate_analysis_results.txt', sep='\t', mode='w')
+        # the Venn diagram is drawn on resumed runs too
+        if settings.get('plots') == 'YES':
+            multivariate.venn_plot(renderer, settings, metanalysis_df, filepath)
     else:
         print('Meta-analysis started')
-        metanalysis_df = meta_analysis.run(settings, data)
+
+        # The per-study effect sizes (and the expressions the bootstrap needs) of the studies.
+        # The effect sizes are written to the effect size table of the output directory, a resumed run
+        # with an unchanged key reads them back from it instead of reading the studies
+        effects_key = checkpoints.stage_key(settings, 'effect_sizes', data_key)
+        effects_path = filepath + effect_sizes.EFFECT_SIZES_FILE
+
+        def load_summaries():
+            if resume and not meta_analysis.needs_expressions(settings):
+                table = effect_sizes.read_effects(effects_path, effects_key)
+                if table is not None:
+                    print('Resuming effect_sizes from its table')
+                    return table[0], [], []
+            if incremental:
+                loaded = effect_sizes.study_effects(store_summaries(file_list, filepath, args.add_study or [])), [], []
+            else:
+                loaded = meta_analysis.load_summaries(settings, load_data(file_list, filepath, resume, studies_key,
+                                                                          data_key))
+            effect_sizes.write_effects(effects_path, loaded[0], [name.strip() for name in file_list], effects_key)
+            return loaded
+
+        meta_analysis_key = checkpoints.stage_key(
+            settings, 'meta_analysis', effects_key,
+            inputs=settings['significance_level'] if meta_analysis.needs_expressions(settings) else None)
+        results_key = checkpoints.stage_key(settings, 'multiple_testing', meta_analysis_key)
+        # the streamed results are only read back when plots, enrichment or GSEA need them
+        stream = settings.get('stream_results') == 'YES'
+        if stream:
+            results_path = checkpoints.run_stage(
+                filepath, 'multiple_testing', results_key,
+                lambda: stream_meta_analysis(load_summaries(), filepath, alpha), resume, check=os.path.exists)
+            if settings.get('plots') == 'YES' or settings.get('enrichment_analysis') == 'YES' or \
+                    settings.get('gsea') == 'YES':
+                metanalysis_df = result_writer.read_results(results_path)
+        else:
+            def meta_analysis_table():
+                return meta_analysis.results_table(settings, *load_summaries())
+
+            meta_analysis_df = checkpoints.run_stage(filepath, 'meta_analysis', meta_analysis_key,
+                                                     meta_analysis_table, resume)
+            metanalysis_df = checkpoints.run_stage(filepath, 'multiple_testing', results_key,
+                                                   lambda: multiple_testing_stage(settings, meta_analysis_df, alpha), resume)
         if settings ['bayesian_meta_analysis'] == 'YES':
             print('Bayesian Meta-analysis started')
-            metanalysis_df.to_csv(filepath + 'bayesian_meta_analysis_results.txt', sep='\t', mode='w')
+            if not stream:
+                metanalysis_df.to_csv(filepath + 'bayesian_meta_analysis_results.txt', sep='\t', mode='w')
+            if settings.get('prior_sweep') == 'YES':
+                prior_sweep_summary(metanalysis_df if not stream else
+                                    result_writer.read_results(results_path, usecols=['Genes', 'a', 'b', 'p_value',
+                                                                                      'simes']), filepath)
+            if settings.get('gsea') == 'YES':
+                preranked_gsea(metanalysis_df, filepath, results_key, resume)
             print('Bayesian Meta-analysis finished')
 
             exit()
-        else:
+        elif not stream:
             #metanalysis_df = metanalysis_df.drop(['p_values_one_step', 'p_values_step_up', 'p_values_step_down','genes_one_step'], axis=1)
-            metanalysis_df = apply_multiple_testing_corrections(metanalysis_df, alpha=alpha)
             metanalysis_df.to_csv(filepath + 'meta_analysis_results.txt', sep='\t', mode='w')
 
         # create and save plots
         if settings.get('plots') == 'YES':
-            plots.meta_analysis_plots(metanalysis_df, filepath,alpha)
+            plots.meta_analysis_plots(renderer, metanalysis_df, filepath,alpha)
+
+        if settings.get('gsea') == 'YES':
+            preranked_gsea(metanalysis_df, filepath, results_key, resume)
 
     if settings.get('enrichment_analysis') == 'YES':
         print('Enrichment Analysis started')
@@ -175,13 +400,19 @@ if __name__ == '__main__':
         print(str(len(genes_for_ea))+' genes for Enrichment Analysis')
 
         pd.DataFrame(genes_for_ea).to_csv(filepath + 'stat_significant_genes.txt', sep='\t', mode='w')
-        enrichment_analysis_df = enrichment_analysis.run(settings, genes_for_ea)
+        # the local backend also depends on the GMT files it reads
+        gmt_files = gmt_files_state() if settings.get('enrichment_backend') == 'local' else None
+        enrichment_analysis_df = checkpoints.run_stage(
+            filepath, 'enrichment', checkpoints.stage_key(settings, 'enrichment', results_key, inputs=gmt_files),
+            lambda: enrichment_analysis.run(settings, genes_for_ea), resume)
         enrichment_analysis_df.to_csv(filepath + 'enrichment_analysis_results.txt',
                                       header=enrichment_analysis_df.columns, index=None, sep='\t', mode='w')
         if settings.get('plots') == 'YES':
-            plots.ea_manhattan_plot(enrichment_analysis_df, filepath, settings['threshold'])
-            plots.ea_heatmap_plot(enrichment_analysis_df, filepath)
+            plots.ea_manhattan_plot(renderer, enrichment_analysis_df, filepath, settings['threshold'])
+            plots.ea_heatmap_plot(renderer, enrichment_analysis_df, filepath)
 
+    # the plots are rendered in the background while the rest of the run goes on
+    plots.wait(renderer)
     t1 = time.time()
     total = t1 - t0
     print("Execution time = " + str(total) + '\t' + '  seconds')
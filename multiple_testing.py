@@ -0,0 +1,83 @@
+import numpy as np
+
+# Vectorized multiple testing of a column of p values.
+# The p values are sorted once, every threshold and adjusted p value is computed as an array
+# and returned row by row aligned with the input. NaN p values are ranked last.
+
+# the threshold methods of each multiple_comparisons choice
+MULTIPLE_TESTS = {'one_step': ['bonferroni', 'sidak'],
+                  'step_down': ['holm', 'holland'],
+                  'step_up': ['hochberg', 'simes']}
+MULTIPLE_TESTS['all'] = MULTIPLE_TESTS['one_step'] + MULTIPLE_TESTS['step_down'] + MULTIPLE_TESTS['step_up']
+
+# the adjusted p values, named as in statsmodels' multipletests
+ADJUSTED_METHODS = ['fdr_bh', 'holm-sidak', 'simes-hochberg', 'bonferroni', 'holm']
+
+
+# With this function we get the ascending order of the p values (a stable sort, NaN last)
+# and the number of p values that are not NaN
+def sort_order(p):
+    finite = np.flatnonzero(~np.isnan(p))
+    order = finite[np.argsort(p[finite], kind='stable')]
+    return np.concatenate([order, np.flatnonzero(np.isnan(p))]), len(finite)
+
+
+# With this function we get the thresholds every p value is compared with.
+# One step: Bonferroni and Sidak. Step down (ascending rank r = 0..m-1): Holm and Holland.
+# Step up (descending rank j = 0..m-1): Hochberg and Simes, where the largest p value is its own threshold.
+# Output: a dict of arrays aligned with p
+def thresholds(p, alpha):
+    p = np.asarray(p, dtype=float)
+    m = len(p)
+    if m == 0:
+        return {name: np.array([]) for name in MULTIPLE_TESTS['all']}
+    order, num_finite = sort_order(p)
+    # the descending order keeps the NaN p values last
+    descending = np.concatenate([order[:num_finite][::-1], order[num_finite:]])
+    r = np.empty(m)
+    r[order] = np.arange(m)
+    j = np.empty(m)
+    j[descending] = np.arange(m)
+    with np.errstate(divide='ignore'):
+        return {'bonferroni': np.full(m, alpha / m),
+                'sidak': np.full(m, 1 - (1 - alpha) ** (1 / m)),
+                'holm': alpha / (m - r + 1),
+                'holland': 1 - (1 - alpha) ** (1 / (m - r + 1)),
+                'hochberg': np.where(j == 0, p, alpha / (j + 1)),
+                'simes': np.where(j == 0, p, (m - j) * alpha / m)}
+
+
+# With this function we get the 0/1 decisions (1 ---> significant difference) of the threshold methods
+def decisions(p, alpha, methods=MULTIPLE_TESTS['all']):
+    p = np.asarray(p, dtype=float)
+    limits = thresholds(p, alpha)
+    return {name: (p < limits[name]).astype(int) for name in methods}
+
+
+# With this function we get the adjusted p values of the ADJUSTED_METHODS (as statsmodels' multipletests),
+# over the p values that are not NaN. Output: a dict of arrays aligned with p
+def adjusted_p_values(p, methods=ADJUSTED_METHODS):
+    p = np.asarray(p, dtype=float)
+    order, n = sort_order(p)
+    order = order[:n]
+    ps = p[order]
+    factor = np.arange(n, 0, -1)
+
+    adjusted = {}
+    for method in methods:
+        if method == 'bonferroni':
+            raw = ps * float(n)
+        elif method == 'holm':
+            raw = np.maximum.accumulate(ps * factor)
+        elif method == 'holm-sidak':
+            raw = np.maximum.accumulate(-np.expm1(factor * np.log1p(-ps)))
+        elif method == 'simes-hochberg':
+            raw = np.minimum.accumulate((factor * ps)[::-1])[::-1]
+        elif method == 'fdr_bh':
+            raw = np.minimum.accumulate((ps / (np.arange(1, n + 1) / float(n)))[::-1])[::-1]
+        else:
+            raise ValueError('Unknown multiple testing method: ' + method)
+        values = np.full(len(p), np.nan)
+        values[order] = np.minimum(raw, 1)
+        adjusted[method] = values
+    return adjusted
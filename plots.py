@@ -1,83 +1,255 @@
+import os
 import numpy as np
 import scipy.stats as stats
 import pandas as pd
+import matplotlib
+from matplotlib.colors import LogNorm
+# the figures are only saved to files, with no window, also in the rendering processes
+matplotlib.use('Agg')
 import seaborn as sns
 import matplotlib.pyplot as plt
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from matplotlib_venn import venn3_circles, venn3
 
+# The plots of a run are rendered in the background: every plot function takes the Renderer of the run and the
+# data of its figures and submits their rendering to the pool of plot_workers processes of the Renderer (with
+# plot_workers = 0 they are rendered at once), so the analysis goes on and writes its outputs while the figures
+# are drawn. mage.py waits for them at the end. The module keeps no state, every run owns its Renderer.
+# Every figure is saved in each of the plot_formats at plot_dpi (heatmap_dpi for the heatmaps) and closed.
+# With more than plot_density_genes genes the volcano and QQ plots are aggregated: the genes are binned into a
+# density raster of DENSITY_BINS and only the outliers (the most significant genes, the tails of the QQ plot) are
+# drawn as points, at most MAX_POINTS, so their render time and file size do not grow with the number of genes.
 
-def meta_analysis_plots(meta_analysis_df, filepath,alpha):
+# the (x, y) bins of the density rasters (coarser for the QQ plot, a curve) and the most points drawn over them
+DENSITY_BINS = (400, 300)
+QQ_BINS = (200, 150)
+MAX_POINTS = 2000
 
-    # QQ plot
-    plt.figure("QQ plot ",dpi= 600)
-    measurements = meta_analysis_df["Effect size (Hedge's g)"]
-    tau = meta_analysis_df['Tau_Squared']
-    q = meta_analysis_df['Q']
-    i2 = meta_analysis_df['I_Squared']
-    stats.probplot(measurements, dist="norm", plot=plt)
-    plt.savefig(filepath + '/qq_plot.png')
+# The plots of one run: its plot settings, the pool rendering its figures (None without plot workers)
+# and the (name, future) of the figures submitted to it
+Renderer = namedtuple('Renderer', ['dpi', 'heatmap_dpi', 'formats', 'workers', 'density_genes', 'pool', 'pending'])
 
-    # Tau2 plot
-    plt.figure("Tau - Squared DL Histogram ",dpi= 600)
-    plt.hist(tau, color='r',bins = 20 , density=True, edgecolor='black', linewidth=1.2)
-    plt.title("Tau - Squared DL Histogram")
+
+# With this function we get the Renderer of a run with the plot settings of settings.
+# The processes of its pool only start with the first figure
+def renderer(settings):
+    workers = int(settings.get('plot_workers') or 2)
+    return Renderer(dpi=float(settings.get('plot_dpi') or 600),
+                    heatmap_dpi=float(settings.get('heatmap_dpi') or 300),
+                    formats=[name.strip().lower() for name in (settings.get('plot_formats') or 'png').split(',')
+                             if name.strip()],
+                    workers=workers, density_genes=int(settings.get('plot_density_genes') or 0),
+                    pool=ProcessPoolExecutor(max_workers=workers) if workers > 0 else None, pending=[])
+
+
+# With this function we render a figure with function(*args) in the background, or at once without plot workers.
+# name is the path of the figure without its format
+def submit(renderer, function, name, *args):
+    options = (renderer.heatmap_dpi if function is heatmap_figure else renderer.dpi, renderer.formats)
+    if renderer.pool is None:
+        function(name, options, *args)
+        return
+    renderer.pending.append((name, renderer.pool.submit(function, name, options, *args)))
+
+
+# With this function we wait for the figures of a run rendered in the background and close its pool (at the end
+# of the run). A figure that could not be rendered is reported and its error raised after all the others are done
+def wait(renderer):
+    if renderer.pool is not None:
+        renderer.pool.shutdown(wait=False)
+    if not renderer.pending:
+        return
+    print('Waiting for ' + str(sum(not future.done() for name, future in renderer.pending)) + ' of ' +
+          str(len(renderer.pending)) + ' plots')
+    error = None
+    for name, future in renderer.pending:
+        try:
+            future.result()
+        except Exception as e:
+            print('Plot ' + os.path.basename(name) + ' failed: ' + repr(e))
+            error = error or e
+    del renderer.pending[:]
+    if error is not None:
+        raise error
+
+
+# With this function we save a figure in every format of options (dpi, formats) and close it
+def save_figure(fig, name, options):
+    try:
+        for extension in options[1]:
+            fig.savefig(name + '.' + extension, dpi=options[0])
+    finally:
+        plt.close(fig)
+
+
+def qq_figure(name, options, measurements):
+    fig = plt.figure("QQ plot ")
+    stats.probplot(measurements, dist="norm", plot=fig.gca())
+    save_figure(fig, name, options)
+
+
+def histogram_figure(name, options, values, title, color, bins):
+    fig = plt.figure(title)
+    plt.hist(values, color=color, bins=bins, density=True, edgecolor='black', linewidth=1.2)
+    plt.title(title)
     plt.xlabel('Values')
     plt.ylabel('Frequency')
-    plt.savefig(filepath + '/tau2.png')
+    save_figure(fig, name, options)
+
+
+# With this function we bin the points (x, y) into a density raster of bins over extent (left, right, bottom, top).
+# Output: the (y bins x x bins) counts
+def density_raster(x, y, extent, bins=DENSITY_BINS):
+    counts = np.histogram2d(x, y, bins=bins, range=[extent[:2], extent[2:]])[0]
+    return counts.T
+
+
+# the range of the finite values of x and y, widened when they are all the same
+def _extent(x, y):
+    extent = []
+    for values in (x, y):
+        low, high = (values.min(), values.max()) if len(values) else (0.0, 1.0)
+        extent.extend([low, high] if high > low else [low - 0.5, high + 0.5])
+    return extent
+
+
+# With this function we draw a density raster on ax, the empty bins left blank
+def draw_density(fig, ax, counts, extent, cmap):
+    if counts.max() == 0:
+        return
+    image = ax.imshow(np.ma.masked_equal(counts, 0), origin='lower', extent=extent, aspect='auto', cmap=cmap,
+                      norm=LogNorm(vmin=1, vmax=counts.max()), interpolation='nearest', rasterized=True)
+    fig.colorbar(image, ax=ax, label='Genes per bin')
+
+
+# With this function we get the aggregated volcano plot of the genes: the density raster of all of them but the
+# most significant ones (at most MAX_POINTS of the ones below alpha), which are drawn as points
+def volcano_density(smd, log_p, p_values, alpha):
+    finite = np.isfinite(smd) & np.isfinite(log_p)
+    smd, log_p, p_values = smd[finite], log_p[finite], p_values[finite]
+    points = np.argsort(p_values, kind='stable')[:min(MAX_POINTS, int((p_values < alpha).sum()))]
+    rest = np.ones(len(smd), dtype=bool)
+    rest[points] = False
+    extent = _extent(smd, log_p)
+    return density_raster(smd[rest], log_p[rest], extent), extent, smd[points], log_p[points]
+
+
+def volcano_density_figure(name, options, counts, extent, smd, log_p):
+    fig, ax = plt.subplots(num="Volcano plot")
+    draw_density(fig, ax, counts, extent, 'Reds')
+    ax.scatter(smd, log_p, color='green', s=6)
+    ax.set_title("Volcano Plot")
+    ax.set_xlabel("Effect Size Hedge's g")
+    ax.set_ylabel("- log10 p_values")
+    save_figure(fig, name, options)
+
+
+# With this function we get the aggregated normal QQ plot of the measurements (as stats.probplot): the density
+# raster of the ordered values against their theoretical quantiles, with the MAX_POINTS / 2 smallest and largest
+# drawn as points, and the least squares line
+def qq_density(measurements):
+    measurements = measurements[np.isfinite(measurements)]
+    (osm, osr), (slope, intercept, r) = stats.probplot(measurements, dist="norm")
+    tails = np.zeros(len(osm), dtype=bool)
+    tails[:MAX_POINTS // 2] = True
+    tails[max(len(osm) - MAX_POINTS // 2, 0):] = True
+    extent = _extent(osm, osr)
+    line = osm[[0, -1]] if len(osm) else np.zeros(2)
+    return density_raster(osm[~tails], osr[~tails], extent, QQ_BINS), extent, osm[tails], osr[tails], line, \
+        slope * line + intercept
+
+
+def qq_density_figure(name, options, counts, extent, osm, osr, line_x, line_y):
+    fig, ax = plt.subplots(num="QQ plot ")
+    # the line goes under the genes
+    ax.plot(line_x, line_y, 'r-', linewidth=0.8)
+    draw_density(fig, ax, counts, extent, 'Blues')
+    ax.plot(osm, osr, 'bo', markersize=3)
+    ax.set_title('Probability Plot')
+    ax.set_xlabel('Theoretical quantiles')
+    ax.set_ylabel('Ordered Values')
+    save_figure(fig, name, options)
+
+
+def volcano_figure(name, options, smd, log_p, color):
+    fig = plt.figure("Volcano plot")
+    plt.scatter(smd, log_p, c=color, cmap='RdYlGn')
+    plt.title("Volcano Plot")
+    plt.xlabel("Effect Size Hedge's g")
+    plt.ylabel("- log10 p_values")
+    save_figure(fig, name, options)
+
+
+def meta_analysis_plots(renderer, meta_analysis_df, filepath,alpha):
+
+    # QQ plot
+    measurements = meta_analysis_df["Effect size (Hedge's g)"].to_numpy(dtype=float)
+    tau = meta_analysis_df['Tau_Squared'].to_numpy(dtype=float)
+    q = meta_analysis_df['Q'].to_numpy(dtype=float)
+    i2 = meta_analysis_df['I_Squared'].to_numpy(dtype=float)
+    # the volcano and QQ plots of many genes are aggregated
+    dense = 0 < renderer.density_genes < len(meta_analysis_df)
+    if dense:
+        submit(renderer, qq_density_figure, filepath + '/qq_plot', *qq_density(measurements))
+    else:
+        submit(renderer, qq_figure, filepath + '/qq_plot', measurements)
+
+    # Tau2 plot
+    submit(renderer, histogram_figure, filepath + '/tau2', tau, "Tau - Squared DL Histogram", 'r', 20)
 
     # Q plot
-    plt.figure("Q Histogram ",dpi= 600)
-    plt.hist(q, color='g', density=True, bins = 40,edgecolor='black', linewidth=1.2)
-    plt.title("Q Histogram")
-    plt.xlabel('Values')
-    plt.ylabel('Frequency')
-    plt.savefig(filepath + '/q.png')
+    submit(renderer, histogram_figure, filepath + '/q', q, "Q Histogram", 'g', 40)
 
     # I2 plot
-    plt.figure("I - Squared Histogram ",dpi= 600)
-    plt.hist(i2, color='b', density=True, bins = 40, edgecolor='black', linewidth=1.2)
-    plt.title("I - Squared DL Histogram ")
-    plt.xlabel('Values')
-    plt.ylabel('Frequency')
-    plt.savefig(filepath + '/i2.png')
+    submit(renderer, histogram_figure, filepath + '/i2', i2, "I - Squared DL Histogram ", 'b', 40)
 
     # Volcano Plot
     df = meta_analysis_df[meta_analysis_df.p_value != 0]
     p_values = np.array(df['p_value'].to_numpy().tolist(), dtype=float)
 
-    smd = df["Effect size (Hedge's g)"]
+    smd = df["Effect size (Hedge's g)"].to_numpy(dtype=float)
     log_p = -(np.log10(p_values))
 
-    color = []
+    if dense:
+        submit(renderer, volcano_density_figure, filepath + "/volc_plot",
+               *volcano_density(smd, log_p, p_values, alpha))
+    else:
+        color = np.where(p_values < alpha, 2, 1)
 
-    for i in range(len(p_values)):
-        if p_values[i] < alpha:
-            color.append(2)
-        else:
-            color.append(1)
+        submit(renderer, volcano_figure, filepath + "/volc_plot", smd, log_p, color)
 
-    plt.figure("Volcano plot",dpi= 600)
-    plt.scatter(smd, log_p, c=color, cmap='RdYlGn')
-    plt.title("Volcano Plot")
-    plt.xlabel("Effect Size Hedge's g")
-    plt.ylabel("- log10 p_values")
-    plt.savefig(filepath + "/volc_plot.png")
 
-    # plt.show()
+def venn_figure(name, options, set1, set2, set3, venn_correction, venn_choice):
+    fig = plt.figure()
+    plt.title("p-values Venn diagram" + " - " + venn_correction + " correction")
+    venn3([set1, set2, set3], ('g1', 'g2', venn_choice))
+    venn3_circles(subsets=[set1, set2, set3], linestyle='dashed')
+    save_figure(fig, name, options)
 
 
-def multivariate_plots(list1, list2, list3, venn_correction, venn_choice, filepath):
+def multivariate_plots(renderer, list1, list2, list3, venn_correction, venn_choice, filepath):
     set1 = set(list1)
     set2 = set(list2)
     set3 = set(list3)
-    plt.figure(dpi= 600)
-    plt.title("p-values Venn diagram" + " - " + venn_correction + " correction")
-    venn3([set1, set2, set3], ('g1', 'g2', venn_choice))
-    venn3_circles(subsets=[set1, set2, set3], linestyle='dashed')
-    plt.savefig(filepath + "/venn_plot.png")
+    submit(renderer, venn_figure, filepath + "/venn_plot", set1, set2, set3, venn_correction, venn_choice)
 
 
-def ea_manhattan_plot(data, filepath,threshold):
+def manhattan_figure(name, options, df):
+    # palette: Paired, Set2, bright, dark, coloblind, deep
+    plot = sns.relplot(data=df, x='i', y='negative_log10_of_adjusted_p_value', aspect=4,
+                       hue='source', palette='bright', legend='full')
+    plot.ax.axhline(16, linestyle='--', linewidth=1)
+
+    plot.set_axis_labels('Source', '-log10(Padj)')
+    plot.fig.suptitle('Enrichment Analysis - Manhattan plot', fontsize=16)
+    plot.ax.set_xticks(df.groupby('group_id')['i'].median())
+    plot.ax.set_xticklabels(df['source'].unique(), rotation=25)
+    plot.fig.tight_layout()
+    save_figure(plot.fig, name, options)
+
+
+def ea_manhattan_plot(renderer, data, filepath,threshold):
 
     df = data.loc[data.p_value < float(threshold), ['source', 'native', 'p_value', 'negative_log10_of_adjusted_p_value']]
     df = df.where(df ['negative_log10_of_adjusted_p_value']<=16 )
@@ -88,60 +260,34 @@ def ea_manhattan_plot(data, filepath,threshold):
     df.reset_index(inplace=True, drop=True)
     df['i'] = df.index
 
-    plt.subplots(dpi=600)
-    plt.figure("Manhattan plot")
+    submit(renderer, manhattan_figure, filepath + "/manhattan_plot", df)
 
-    # palette: Paired, Set2, bright, dark, coloblind, deep
-    plot = sns.relplot(data=df, x='i', y='negative_log10_of_adjusted_p_value', aspect=4,
-                       hue='source', palette='bright', legend='full')
-    plot.ax.axhline(16, linestyle='--', linewidth=1)
 
-    plot.set_axis_labels('Source', '-log10(Padj)')
-    plot.fig.suptitle('Enrichment Analysis - Manhattan plot', fontsize=16)
-    plot.ax.set_xticks(df.groupby('group_id')['i'].median())
-    plot.ax.set_xticklabels(df['source'].unique(), rotation=25)
-    plt.tight_layout()
-    plt.savefig(filepath + "/manhattan_plot.png")
+def heatmap_figure(name, options, df, source):
+    # the notebook context of sns.set(font_scale=1.2), for this figure only
+    with sns.plotting_context('notebook', font_scale=1.2):
+        fig = plt.figure("Heatmap plot - " + source, figsize=(30, 15))
+        sns.heatmap(df, cmap='RdYlGn_r')
 
+        plt.title(source, fontsize=20)
+        plt.xlabel('Genes', fontsize=15)  # x-axis label with fontsize 15
+        plt.ylabel('Terms', fontsize=15)  # y-axis label with fontsize 15
+        save_figure(fig, name, options)
 
-def ea_heatmap_plot(data, filepath):
+
+def ea_heatmap_plot(renderer, data, filepath):
     # Get unique sources
-    df = data.where(data ['negative_log10_of_adjusted_p_value']<=16)
-    data = df
-    sourses = list(set(data.source))
-    sourses = [x for x in sourses if str(x) != 'nan']
-
-    # print(data.head())
-    # # Create a heatmap plot for each source
-    # # print(data['source'])
-    # x= data.where(data['source'] == 'GO:MF')
-    # print(x.dropna()['intersections'])
-    for source in sourses:
-        if source == None:
-            sourses.remove(source)
+    data = data[data['negative_log10_of_adjusted_p_value'] <= 16]
+    sourses = [x for x in pd.unique(data.source) if x is not None and str(x) != 'nan']
+
     for source in sourses:
         print('Heatmap for: '+source)
-        genes_all = []
-        # x= data.where(data['source'] == source)
-        for index, row in data[data.source == source].iterrows():
-            genes_all.extend(row['intersections'])
-
-        genes_all = list(set(genes_all))
-        # print(genes_all)
-        df = pd.DataFrame(columns=genes_all)
-
-        for index, row in data[data.source == source].iterrows():
-            df.loc[row['native'], row['intersections']] = row['negative_log10_of_adjusted_p_value']
-
-        df = df.fillna(0)
-        # print(df)
-        # df = df.where(df ['negative_log10_of_adjusted_p_value']<=16)
-        plt.figure("Heatmap plot - " + source, figsize=(30, 15), dpi=300)
-        sns.heatmap(df, cmap='RdYlGn_r')
-        sns.set(font_scale=1.2)
+        terms = data[data.source == source]
+        # the (terms x genes) -log10 adjusted p values of the terms at their intersection genes, 0 elsewhere
+        genes_all = pd.unique(np.array([gene for genes in terms['intersections'] for gene in genes], dtype=object))
+        df = pd.DataFrame(0.0, index=pd.unique(terms['native']), columns=genes_all)
+        for native, genes, value in zip(terms['native'], terms['intersections'],
+                                        terms['negative_log10_of_adjusted_p_value']):
+            df.loc[native, list(genes)] = float(value)
 
-        plt.title(source, fontsize=20)
-        plt.xlabel('Genes', fontsize=15)  # x-axis label with fontsize 15
-        plt.ylabel('Terms', fontsize=15)  # y-axis label with fontsize 15
-        plt.savefig(filepath + "/heatmap_plot_" + source + ".png")
-        # plt.show()
+        submit(renderer, heatmap_figure, filepath + "/heatmap_plot_" + source, df, source)
@@ -0,0 +1,68 @@
+import numpy as np
+from scipy.special import gammaln
+from scipy.stats import norm, chi2
+
+# Vectorized combination of the per-study p values of the multivariate meta-analysis (the global1 variants).
+# Every function works on (genes x studies) arrays with a mask of the studies each gene is found in,
+# and uses log-space forms (no factorials, no products of p values), so it stays finite for hundreds of studies.
+# num_of_studies is the number of studies of the run, as in the per-gene formulas it replaces.
+
+
+# sum over the studies of every gene, the missing ones left out
+def _masked_sum(x, valid):
+    return np.where(valid, x, 0.0).sum(axis=1)
+
+
+# two-sided p value of a standard normal statistic
+def _two_sided(z):
+    return 2 * norm.sf(np.abs(z))
+
+
+# With this function we get the p value of Stouffer's method: sum(z) / sqrt(k)
+def stouffer(z, valid):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return _two_sided(_masked_sum(z, valid) / np.sqrt(valid.sum(axis=1)))
+
+
+# With this function we get the p value of the weighted Stouffer's method: sum(N^(1/4) z) / sqrt(sum(N)),
+# N the samples of each study
+def weighted_stouffer(z, N, valid):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return _two_sided(_masked_sum(np.sqrt(np.sqrt(N)) * z, valid) / np.sqrt(_masked_sum(N, valid)))
+
+
+# With this function we get the p value of the Fisher variant of the multivariate analysis from the log p values:
+# U = -2 sum(log p), fisher = -U * sum_{i < num_of_studies - 1} log(U)^i / i!, p = P(chi2_2 > |fisher|).
+# The terms of the series come from one another (term_i = term_{i-1} log(U) / i) instead of factorials
+def fisher(log_p, valid, num_of_studies):
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        U = -2 * _masked_sum(log_p, valid)
+        log_U = np.log(U)
+        series = np.zeros(len(U))
+        term = np.ones(len(U))
+        for i in range(num_of_studies - 1):
+            series += term
+            term = term * log_U / (i + 1)
+        return 2 * chi2.sf(np.abs(-U * series), 2)
+
+
+# With this function we get the p values of Edgington's methods:
+# edg1 = sum(p)^num_of_studies / num_of_studies! (through gammaln) and
+# edg2 the normal approximation of the mean p value, (0.5 - mean(p)) sqrt(12)
+def edgington(p, valid, num_of_studies):
+    total = _masked_sum(p, valid)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p_edg1 = np.exp(num_of_studies * np.log(total) - gammaln(num_of_studies + 1))
+    p_edg2 = _two_sided((0.5 - total / num_of_studies) * np.sqrt(12))
+    return p_edg1, p_edg2
+
+
+# With this function we get the five global1 combinations of every gene from the log p values,
+# the one-sided z scores and the samples N of its studies. Output: a dict of arrays, one value per gene
+def global1_combinations(log_p, z, N, valid, num_of_studies):
+    p_edg1, p_edg2 = edgington(np.exp(log_p), valid, num_of_studies)
+    return {'global1_stoufer': stouffer(z, valid),
+            'global1_stoufer_weighted': weighted_stouffer(z, N, valid),
+            'global1_p_fisher': fisher(log_p, valid, num_of_studies),
+            'global1_p_edg1': p_edg1,
+            'global1_p_edg2': p_edg2}
@@ -0,0 +1,158 @@
+import numpy as np
+from scipy.special import gamma, gammaln
+from scipy.stats import norm, chi2
+from PythonMeta.core import lmtbl_chisquare
+
+# Vectorized random-effects meta-analysis (IV-Heg, SMD, DerSimonian-Laird).
+# Every function works on (genes x studies) arrays, a missing study is a NaN entry,
+# and reproduces the numbers of PythonMeta's IV_total_SMD(..., 'Random', 'Heg') for all genes at once.
+
+_CHI2_TABLE = np.array(lmtbl_chisquare.data, dtype=float)
+_CHI2_SEEDS = np.array(lmtbl_chisquare.seeds, dtype=float)
+
+
+# Hedges' J correction, math.gamma overflows for large samples so we fall back to gammaln there
+def hedges_j(df):
+    df = np.asarray(df, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        J = gamma(df / 2) / (np.sqrt(df / 2) * gamma((df - 1) / 2))
+        J_large = np.exp(gammaln(df / 2) - gammaln((df - 1) / 2)) / np.sqrt(df / 2)
+    return np.where(np.isfinite(J) | (df <= 2), J, J_large)
+
+
+# With this function we get Hedges' J of an array of (integer) degrees of freedom through gammaln,
+# computed once per distinct degrees of freedom of the array
+def hedges_j_table(df):
+    df = np.asarray(df, dtype=float)
+    keys, inverse = np.unique(df, return_inverse=True)
+    # missing studies (NaN) stay NaN
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        J = np.exp(gammaln(keys / 2) - gammaln((keys - 1) / 2)) / np.sqrt(keys / 2)
+    return J[inverse.reshape(-1)].reshape(df.shape)
+
+
+# With this function we get Hedges' g and its standard error for every (gene, study) entry (as CONT_Heg_SMD)
+def hedges_g(m1, sd1, n1, m2, sd2, n2):
+    m1, sd1, n1, m2, sd2, n2 = (np.asarray(x, dtype=float) for x in (m1, sd1, n1, m2, sd2, n2))
+    N = n1 + n2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        s = np.sqrt(((n1 - 1) * sd1 * sd1 + (n2 - 1) * sd2 * sd2) / (N - 2))
+        s = np.where(s == 0, 0.000000001, s)
+        J = hedges_j(N - 2)
+        md = m1 - m2
+        smd = md * J / s
+        smd2 = md / s
+        se = (J * J) * np.sqrt(N / (n1 * n2) + (smd2 * smd2) / (2 * N))
+    return smd, se
+
+
+# p value of the heterogeneity Q test, looked up in the PythonMeta chi-square table (as Stat_guess_CSP)
+def chisquare_table_p(Q, k):
+    Q = np.asarray(Q, dtype=float)
+    rows = _CHI2_TABLE[np.clip(np.asarray(k, dtype=int), 2, 201) - 2]
+    # linear interpolation between the two table values around Q
+    idx = np.clip((rows < Q[..., None]).sum(axis=-1), 1, rows.shape[-1] - 1)
+    lo = np.take_along_axis(rows, (idx - 1)[..., None], axis=-1)[..., 0]
+    hi = np.take_along_axis(rows, idx[..., None], axis=-1)[..., 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p = _CHI2_SEEDS[idx] - ((_CHI2_SEEDS[idx] - _CHI2_SEEDS[idx - 1]) * (hi - Q)) / (hi - lo)
+    p = np.where(Q >= np.minimum(rows.max(axis=-1), 297), 0.0, p)
+    p = np.where(Q <= rows.min(axis=-1), 0.999, p)
+    return np.char.mod('%.3f', p)
+
+
+# With this function we pool (genes x studies) effect sizes and standard errors with the DerSimonian-Laird
+# random-effects model, entries that are not finite are left out.
+# Output: pooled effect size, SE, Q, tau^2 and number of studies per gene
+def dersimonian_laird(es, se):
+    valid = np.isfinite(es) & np.isfinite(se)
+    es = np.where(valid, es, 0.0)
+    se = np.where(valid, se, 1.0)
+    k = valid.sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # fixed effect weights for Q and the DL estimator of tau^2
+        w_q = np.where(valid, 1 / (se * se), 0.0)
+        tw_q = w_q.sum(axis=1)
+        es_q = (w_q * es).sum(axis=1) / tw_q
+        Q = (w_q * (es - es_q[:, None]) ** 2).sum(axis=1)
+
+        ww = (w_q * w_q).sum(axis=1)
+        denom = tw_q - ww / tw_q
+        tau2 = np.where((Q <= k - 1) | (denom == 0), 0.0, np.maximum((Q - k + 1) / denom, 0))
+
+        # random effect weights
+        w = np.where(valid, 1 / (se * se + tau2[:, None]), 0.0)
+        tw = w.sum(axis=1)
+        ttl_es = (w * es).sum(axis=1) / tw
+        ttl_se = 1 / np.sqrt(tw)
+    return ttl_es, ttl_se, Q, tau2, k
+
+
+# Studies where both groups have zero deviation take the largest deviation of the gene (row)
+def replace_zero_sd(sd1, sd2):
+    both_zero = (sd1 == 0) & (sd2 == 0)
+    sd1 = np.where(both_zero, np.fmax.reduce(sd1, axis=1)[:, None], sd1)
+    sd2 = np.where(both_zero, np.fmax.reduce(sd2, axis=1)[:, None], sd2)
+    return sd1, sd2
+
+
+# With this function we conduct the random-effects meta-analysis of all genes in one pass.
+# Input: (genes x studies) arrays of the two groups, NaN where a gene is missing from a study.
+# Output: pooled effect size, SE, Q, I^2 (%), tau^2, p of Q, |z|, p value and number of studies per gene
+def random_effects_smd(m1, sd1, n1, m2, sd2, n2):
+    return random_effects_pool(*hedges_g(m1, sd1, n1, m2, sd2, n2))
+
+
+# With this function we conduct the random-effects meta-analysis of (genes x studies) Hedges' g and their
+# standard errors (of hedges_g) that are already computed. Output: as random_effects_smd
+def random_effects_pool(es, se):
+    ttl_es, ttl_se, Q, tau2, k = dersimonian_laird(es, se)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        I2 = np.where(Q == 0, 0.0, np.maximum(100 * (Q - k + 1) / Q, 0))
+        z = np.abs(ttl_es / ttl_se)
+
+    p_Q = chisquare_table_p(Q, k)
+    p = norm.sf(z) * 2
+    return ttl_es, ttl_se, Q, np.round(I2, 2), tau2, p_Q, z, p, k
+
+
+# With this function we lay out ragged per-gene lists, given as one flat array and the offsets where the
+# values of each gene start (CSR style, offsets[-1] == len(values)), as a padded (genes x max studies) matrix.
+# Output: the matrix (NaN padded) and the mask of its real entries
+def ragged_to_padded(values, offsets):
+    values, offsets = np.asarray(values, dtype=float), np.asarray(offsets)
+    lengths = np.diff(offsets)
+    valid = np.arange(lengths.max() if len(lengths) else 0)[None, :] < lengths[:, None]
+    padded = np.full(valid.shape, np.nan)
+    padded[valid] = values
+    return padded, valid
+
+
+# With this function we conduct the DerSimonian-Laird random-effects meta-analysis of effect sizes y and their
+# variances v, (genes x studies) arrays where the studies of a gene are the valid entries (all but NaN by default).
+# Genes with Q == 0 have no heterogeneity (I^2 = tau^2 = 0).
+# Output: Q, I^2 (a fraction), tau^2, p of Q, SE, z, pooled effect size and one-sided p value per gene
+def altmeta(y, v, valid=None):
+    y, v = np.asarray(y, dtype=float), np.asarray(v, dtype=float)
+    if valid is None:
+        valid = ~np.isnan(y)
+    n = valid.sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w = np.where(valid, 1 / v, 0.0)
+        sum_w = w.sum(axis=1)
+        mu_bar = np.where(valid, w * y, 0.0).sum(axis=1) / sum_w
+        Q = np.where(valid, w * (y - mu_bar[:, None]) ** 2, 0.0).sum(axis=1)
+        p_Q = chi2.sf(Q, n - 1)
+        I2 = np.where(Q == 0, 0.0, np.maximum(0, (Q - (n - 1)) / Q))
+        tau2_DL = np.where(Q == 0, 0.0, np.maximum(0, (Q - n + 1) / (sum_w - (w * w).sum(axis=1) / sum_w)))
+
+        # re adjustment of the weights
+        w = np.where(valid, 1 / (v + tau2_DL[:, None]), 0.0)
+        sum_w = w.sum(axis=1)
+        mu_bar = np.where(valid, w * y, 0.0).sum(axis=1) / sum_w
+        se = np.sqrt(1 / sum_w)
+        z = mu_bar / se
+    return Q, I2, tau2_DL, p_Q, se, z, mu_bar, norm.sf(np.abs(z))
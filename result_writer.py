@@ -0,0 +1,111 @@
+import os
+import pandas as pd
+
+# Streaming output of the per-gene result tables.
+# write_chunks appends every chunk of results to a tab delimited file (and optionally a Parquet file)
+# as soon as it is computed and flushes it to disk, so a run that dies keeps every finished chunk.
+# add_columns is the final pass: it loads only the columns the whole-table steps (multiple testing) need,
+# and copies the lines of the file as they are into the final output with the fields of the new columns appended.
+
+# number of rows copied at a time by add_columns
+CHUNK_ROWS = 50000
+
+
+# The Parquet writer is created on the first chunk, pyarrow is only needed when Parquet output is asked for
+def _write_parquet(writer, path, frame):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    if writer is None:
+        writer = pq.ParquetWriter(path, table.schema)
+    writer.write_table(table.cast(writer.schema))
+    return writer
+
+
+# With this function we read a file written by write_chunks (or add_columns) back into a DataFrame,
+# only the given columns if usecols is set. Gene names such as NA are kept as they are
+def read_results(path, usecols=None, chunksize=None):
+    return pd.read_csv(path, sep='\t', index_col=None if usecols else 0, usecols=usecols, chunksize=chunksize,
+                       keep_default_na=False, na_values=[''], float_precision='round_trip')
+
+
+# With this function we write the DataFrames of frames one after the other into the tab delimited file path
+# (and into the Parquet file parquet_path when given), each one flushed to disk once written.
+# Rows are numbered over the whole file, as to_csv numbers a single table. Output: the number of rows
+def write_chunks(frames, path, parquet_path=None):
+    rows = 0
+    writer = None
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        try:
+            for frame in frames:
+                if len(frame) == 0:
+                    continue
+                frame = frame.set_axis(range(rows, rows + len(frame)), axis=0)
+                frame.to_csv(f, sep='\t', header=rows == 0)
+                f.flush()
+                os.fsync(f.fileno())
+                if parquet_path is not None:
+                    writer = _write_parquet(writer, parquet_path, frame)
+                rows += len(frame)
+        finally:
+            if writer is not None:
+                writer.close()
+    return rows
+
+
+# The fields of the rows of frame as to_csv writes them, one string per row
+def _fields(frame, header):
+    return frame.to_csv(sep='\t', header=header, index=False).splitlines()
+
+
+# With this function we add the columns returned by func to every row of the file path written by write_chunks.
+# func gets the columns of the whole file (a DataFrame) and returns the new columns row by row aligned with it.
+# The lines of path are copied as they are with the new fields appended, so the columns already written keep their
+# text. The result goes to out_path through a temporary file, so out_path is either complete or left untouched.
+# With parquet_path the Parquet file source_parquet (written by write_chunks) gets the new columns too.
+# Output: the number of rows
+def add_columns(path, out_path, columns, func, parquet_path=None, source_parquet=None, chunksize=CHUNK_ROWS):
+    if os.path.getsize(path) == 0:
+        # no rows were written
+        open(out_path, 'w').close()
+        return 0
+    needed = read_results(path, usecols=columns)
+    extra = func(needed).reindex(needed.index).reset_index(drop=True)
+
+    tmp = out_path + '.tmp'
+    rows = 0
+    with open(path, 'r', encoding='utf-8', newline='') as source, \
+            open(tmp, 'w', encoding='utf-8', newline='') as f:
+        header = source.readline()
+        line = header.rstrip('\r\n')
+        f.write(line + '\t' + _fields(extra.iloc[:0], True)[0] + header[len(line):])
+        while rows < len(extra):
+            lines = [source.readline() for i in range(min(chunksize, len(extra) - rows))]
+            for raw, fields in zip(lines, _fields(extra.iloc[rows:rows + len(lines)], False)):
+                line = raw.rstrip('\r\n')
+                f.write(line + '\t' + fields + raw[len(line):])
+            rows += len(lines)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, out_path)
+
+    if parquet_path is not None and rows:
+        import pyarrow.parquet as pq
+        tmp_parquet = parquet_path + '.tmp'
+
+        def chunks():
+            start = 0
+            for batch in pq.ParquetFile(source_parquet).iter_batches(batch_size=chunksize):
+                chunk = batch.to_pandas()
+                yield pd.concat([chunk, extra.iloc[start:start + len(chunk)].reset_index(drop=True)], axis=1)
+                start += len(chunk)
+
+        writer = None
+        try:
+            for chunk in chunks():
+                writer = _write_parquet(writer, tmp_parquet, chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        os.replace(tmp_parquet, parquet_path)
+    return rows
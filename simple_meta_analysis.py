@@ -1,105 +1,53 @@
 import pandas as pd
 import numpy as np
-from scipy.stats import norm
-from scipy.stats.distributions import chi2
-from meta_analysis import all_multiple_tests, get_one_step_methods, get_step_down_methods, get_step_up_methods
+from meta_analysis import multiple_tests_table
+from random_effects import altmeta, ragged_to_padded
 
 
-def altmeta(y1, s2):
-    n = len(y1)
-    w = [(1 / x) for x in s2]
-    mu_bar = sum(a * b for a, b in zip(w, y1)) / sum(w)
+# With this function we read the genes, effect sizes and standard errors (the first three columns)
+# of an effect size file into arrays. The header rows (Gene) are dropped: a first one is skipped so the
+# values are parsed as numbers directly, any other one is filtered out of the parsed columns
+def read_effect_sizes(path):
+    with open(path, encoding='utf-8', errors='replace') as f:
+        header = f.readline().split('\t')[0].strip() == 'Gene'
+    df = pd.read_csv(path, delimiter='\t', header=None, skiprows=1 if header else 0, usecols=[0, 1, 2],
+                     dtype={0: str}, keep_default_na=False, na_values=[''], float_precision='round_trip')
+    if not all(pd.api.types.is_numeric_dtype(df[column]) for column in (1, 2)):
+        df = df[df[0] != 'Gene']
+    return df[0].to_numpy(), df[1].to_numpy(dtype=float), df[2].to_numpy(dtype=float)
 
-    Q = sum(a * b for a, b in zip(w, [(x - mu_bar) ** 2 for x in y1]))
-    p_Q = chi2.sf(Q, len(y1) - 1)
-    H = np.sqrt(Q / (n - 1))
-    if (Q == 0):
-        I2 = 0
-        tau2_DL = 0
-    else:
-        I2 = (Q - (len(s2) - 1)) / Q
-        I2 = max(0, I2)
-        tau2_DL = (Q - n + 1) / (sum(w) - sum([x ** 2 for x in w]) / sum(w))
-        tau2_DL = max(0, tau2_DL)
 
-    # re adjustment of the weights
-    w = [(1 / (x + tau2_DL)) for x in s2]
-    mu_bar = sum(a * b for a, b in zip(w, y1)) / sum(w)
-    se = np.sqrt(1 / sum(w))
-
-    z = (mu_bar / se)
-    p = 1 - norm.cdf(abs(z))
-    return (Q, I2, tau2_DL, p_Q, se, z, mu_bar, p)
+# With this function we group the rows of all files by gene, the genes in order of first appearance and the rows
+# of each gene in file order. Output: the genes and the CSR offsets of their rows in the returned order of rows
+def group_by_gene(genes):
+    codes, unique_genes = pd.factorize(genes)
+    order = np.argsort(codes, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(unique_genes)))])
+    return unique_genes, offsets, order
 
 
 def simple_meta_analysis(file_list, folder_path, alpha, mult_tests):
-    # Read each file as a pandas DataFrame with tab delimiter
-    dataframes = []
     results_cols = ['Genes', "Effect size (Hedge's g)", 'Standard_Error', 'Q', 'I_Squared', 'Tau_Squared', 'p_Q_value',
                     'z_test_value', 'p_value', 'num_of_studies']
-    results_list = []
-
-    for file_path in file_list:
-        df = pd.read_csv(folder_path + file_path, delimiter='\t', header=None)
-
-        # Add the DataFrame to the list
-        dataframes.append(df)
-
-    # Combine all DataFrames into a single DataFrame
-    combined_df = pd.concat(dataframes, ignore_index=True)
-
-    # From the combined dataframe fetch: Gene, Effect_size, Standard error and n1,n2
-    # and perform altmeta for each gene
-
-    # Convert dataframe to dictionary
 
-    gene_dict = {}
-    for row in combined_df.itertuples(index=False):
-        gene_id = row[0]
-        values = list(row[1:])
-        if gene_id in gene_dict:
-            gene_dict[gene_id].append(values)
-        else:
-            gene_dict[gene_id] = [values]
-    del gene_dict['Gene']
+    # Read each file straight into numeric arrays
+    files = [read_effect_sizes(folder_path + file_path) for file_path in file_list]
+    genes = np.concatenate([f[0] for f in files])
+    es_values = np.concatenate([f[1] for f in files])
+    se_values = np.concatenate([f[2] for f in files])
 
-    # print(gene_dict)
+    # the effect sizes and standard errors of all genes one after the other (CSR style), then pooled at once
+    unique_genes, offsets, order = group_by_gene(genes)
+    es, valid = ragged_to_padded(es_values[order], offsets)
+    se_studies, _ = ragged_to_padded(se_values[order], offsets)
 
-    for gene in gene_dict.keys():
-        data = pd.DataFrame(gene_dict[gene])
-        es_list = list(data[0])
-        se_list = list(data[1])
+    Q, I2, tau2_DL, p_Q, se, z, mu_bar, p = altmeta(es, se_studies, valid)
+    results_df = pd.DataFrame(dict(zip(results_cols, [unique_genes, mu_bar, se, Q, I2, tau2_DL, p_Q, z, p,
+                                                      valid.sum(axis=1)])), columns=results_cols)
 
-        # Convert to floats
-        es_list = [float(num) for num in es_list]
-        se_list = [float(num) for num in se_list]
-
-        Q, I2, tau2_DL, p_Q, se, z, mu_bar, p = altmeta(es_list, se_list)
-        # ['Genes', "Effect size (Hedge's g)", 'Standard_Error', 'Q', 'I_Squared', 'Tau_Squared', 'p_Q_value',
-        #  'z_test_value', 'p_value', 'num_of_studies', 'cases', 'controls']
-        results_list.append([gene, mu_bar, se, Q, I2, tau2_DL, p_Q, z, p, len(es_list)])
-
-    results_df = pd.DataFrame(results_list, columns=results_cols)
-
-    step_down = get_step_down_methods(results_df, alpha)
-    step_up = get_step_up_methods(results_df, alpha)
-    one_step = get_one_step_methods(results_df, alpha)
-
-    all_tests = all_multiple_tests(results_df, alpha)
-
-    if mult_tests == "one_step":
-        tests = one_step
-    elif mult_tests == "step_up":
-        tests = step_up
-    elif mult_tests == "step_down":
-        tests = step_down
-    else:
-        tests = all_tests
+    # thresholds of the multiple_comparisons choice (one_step, step_down, step_up or all)
+    tests = multiple_tests_table(results_df, alpha, mult_tests)
 
     meta_an = pd.concat([results_df, tests], axis=1)
 
-    meta_an = meta_an.drop(
-        ['genes_one_step', 'genes_step_down', 'genes_step_up', 'p_values_step_down', 'p_values_step_up',
-         'p_values_one_step'], axis=1)
-
     return meta_an
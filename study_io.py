@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+
+# A parsed study file: the gene of each row, the sample IDs and classes of each column
+# and the (genes x samples) float expression matrix
+Study = namedtuple('Study', ['genes', 'ids', 'classes', 'values'])
+
+CACHE_VERSION = 1
+
+
+# With this function we read a study file the same way MAGE always did (first column genes,
+# first row sample IDs, second row classes)
+def read_text(path):
+    return pd.read_csv(path, sep='\t', low_memory=False, header=None, encoding='unicode_escape')
+
+
+# With this function we turn a raw study DataFrame (as read_csv or GISU give it) into a Study.
+# Rows without a gene name are dropped and non numeric expression values become NaN
+def parse_study(df, dtype='float64'):
+    if isinstance(df, Study):
+        return df
+    genes = df.iloc[2:, 0]
+    keep = genes.notna().to_numpy()
+    values = df.iloc[2:, 1:].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=dtype)
+    return Study(genes=genes.to_numpy()[keep].astype(str),
+                 ids=df.iloc[0, 1:].astype(str).to_numpy(),
+                 classes=df.iloc[1, 1:].astype(str).to_numpy(),
+                 values=values[keep])
+
+
+# With this function we rebuild the raw DataFrame layout of a Study (needed by GISU)
+def to_frame(study):
+    if isinstance(study, pd.DataFrame):
+        return study
+    body = pd.DataFrame(study.values, dtype=object)
+    body.insert(0, 'gene', study.genes)
+    header = pd.DataFrame([np.concatenate([['ID'], study.ids]), np.concatenate([['CLASS'], study.classes])],
+                          dtype=object)
+    body.columns = header.columns
+    return pd.concat([header, body], ignore_index=True)
+
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _cache_folder(cache_dir, path):
+    key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, key)
+
+
+def _read_manifest(folder):
+    try:
+        with open(os.path.join(folder, 'manifest.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(folder, manifest):
+    tmp = os.path.join(folder, 'manifest.json.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(folder, 'manifest.json'))
+
+
+# with mmap the expression matrix stays on disk as a read-only numpy memmap
+def _load_cached(folder, manifest, mmap=False):
+    return Study(genes=np.load(os.path.join(folder, 'genes.npy')),
+                 ids=np.array(manifest['ids'], dtype=str),
+                 classes=np.array(manifest['classes'], dtype=str),
+                 values=np.load(os.path.join(folder, 'values.npy'), mmap_mode='r' if mmap else None))
+
+
+def _save_cached(folder, study, path, stat, sha256):
+    os.makedirs(folder, exist_ok=True)
+    # the manifest is written last, a folder without it is never read
+    if os.path.exists(os.path.join(folder, 'manifest.json')):
+        os.remove(os.path.join(folder, 'manifest.json'))
+    np.save(os.path.join(folder, 'genes.npy'), study.genes.astype(str))
+    np.save(os.path.join(folder, 'values.npy'), study.values)
+    manifest = {'version': CACHE_VERSION, 'path': os.path.abspath(path),
+                'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': sha256,
+                'dtype': str(study.values.dtype),
+                'ids': study.ids.tolist(), 'classes': study.classes.tolist()}
+    _write_manifest(folder, manifest)
+    return manifest
+
+
+# With this function we load a study file as a Study.
+# If cache_dir is given the parsed arrays are kept there (a .npy per array plus a manifest.json)
+# and reused while the file keeps its size and mtime, or its content hash when only the mtime changed.
+# With mmap the expression matrix is returned memory-mapped from the cache (cache_dir is required).
+def read_study(path, cache_dir=None, dtype='float64', mmap=False):
+    if mmap and cache_dir is None:
+        raise ValueError('memory-mapped studies need a cache_dir')
+    if cache_dir is None:
+        return parse_study(read_text(path), dtype)
+
+    folder = _cache_folder(cache_dir, path)
+    stat = os.stat(path)
+    manifest = _read_manifest(folder)
+    sha256 = None
+    if manifest is not None and manifest.get('version') == CACHE_VERSION and manifest['dtype'] == dtype \
+            and manifest['size'] == stat.st_size:
+        if manifest['mtime'] == stat.st_mtime_ns:
+            return _load_cached(folder, manifest, mmap)
+        sha256 = file_hash(path)
+        if manifest['sha256'] == sha256:
+            manifest['mtime'] = stat.st_mtime_ns
+            _write_manifest(folder, manifest)
+            return _load_cached(folder, manifest, mmap)
+
+    study = parse_study(read_text(path), dtype)
+    manifest = _save_cached(folder, study, path, stat, sha256 or file_hash(path))
+    if mmap:
+        # drop the parsed copy and map the one just written
+        return _load_cached(folder, manifest, mmap)
+    return study
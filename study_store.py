@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import numpy as np
+import checkpoints
+
+# Per-study sufficient statistics of an incremental (--add-study / --remove-study) meta-analysis,
+# kept in the study_stats/ folder of the output directory.
+# For every study of study_dir the store holds the genes and the per-group means, standard deviations and sizes
+# that split_data computes from its expression matrix (a genes.npy and a stats.npz per study), and the manifest
+# records the file state and the settings they were computed with. A run recomputes only the studies that are new,
+# changed or computed with other settings and pools the rest from the store, so its StudySummaries (and results)
+# are the ones of a full run over the same studies.
+# The manifest also lists the studies removed with --remove-study, which stay out of the pool until added again.
+
+STORE_FOLDER = 'study_stats'
+
+# the settings the statistics of a study depend on
+STUDY_SETTINGS = ['controls', 'cases', 'cache_dtype', 'run_gisu', 'gene_data_online', 'updated_genes',
+                  'transformation_method', 'gene_history_file', 'homo_sapiens_file', 'platforms_folder',
+                  'transformation_organism', 'target_namespace']
+
+
+# With this function we get the key of the statistics of a study: its settings and anything else
+# (JSON serializable) its statistics depend on, such as its GISU platform
+def study_key(settings, inputs=None):
+    state = {'inputs': inputs, 'settings': {key: settings.get(key) for key in STUDY_SETTINGS}}
+    return hashlib.sha256(json.dumps(state, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _folder(filepath):
+    return os.path.join(filepath, STORE_FOLDER)
+
+
+# the folder of one study in the store, named by a hash so any file name is safe
+def _study_folder(filepath, name):
+    return os.path.join(_folder(filepath), hashlib.sha1(name.encode('utf-8')).hexdigest())
+
+
+def read_manifest(filepath):
+    try:
+        with open(os.path.join(_folder(filepath), 'manifest.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'studies': {}, 'removed': []}
+
+
+def write_manifest(filepath, manifest):
+    os.makedirs(_folder(filepath), exist_ok=True)
+    tmp = os.path.join(_folder(filepath), 'manifest.json.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(_folder(filepath), 'manifest.json'))
+
+
+def _load_stats(folder):
+    with np.load(os.path.join(folder, 'stats.npz')) as stats:
+        return (np.load(os.path.join(folder, 'genes.npy')).astype(object),
+                (stats['means'], stats['stds'], stats['sizes']))
+
+
+def _save_stats(folder, genes, stats):
+    os.makedirs(folder, exist_ok=True)
+    means, stds, sizes = stats
+    np.save(os.path.join(folder, 'genes.npy'), np.asarray(genes).astype(str))
+    with open(os.path.join(folder, 'stats.npz.tmp'), 'wb') as f:
+        np.savez(f, means=means, stds=stds, sizes=np.asarray(sizes))
+    os.replace(os.path.join(folder, 'stats.npz.tmp'), os.path.join(folder, 'stats.npz'))
+
+
+# With this function we get the studies of file_list that are pooled: the ones removed before stay out
+# unless they are added again, the removed ones are recorded in the manifest
+def pooled_studies(filepath, file_list, added=(), removed=()):
+    manifest = read_manifest(filepath)
+    added = [os.path.basename(name.strip()) for name in added]
+    unknown = [name for name in added if name not in [f.strip() for f in file_list]]
+    if unknown:
+        raise ValueError('Studies to add should be in the study_dir: ' + ', '.join(unknown))
+    removed_studies = (set(manifest['removed']) - set(added)) | {os.path.basename(name.strip()) for name in removed}
+    manifest['removed'] = sorted(removed_studies)
+    write_manifest(filepath, manifest)
+    return [name for name in file_list if name.strip() not in removed_studies]
+
+
+# With this function we get the genes and (means, stds, sizes) of every study of file_list (in that order).
+# keys[i] is the study_key of study i, compute(i) computes its statistics from the file.
+# A study is computed when it has no statistics in the store, its file or key changed or it is in refresh,
+# the store keeps only the studies of file_list. Output: the study genes and the study statistics
+def sync(filepath, study_dir, file_list, keys, compute, refresh=()):
+    manifest = read_manifest(filepath)
+    refresh = {os.path.basename(name.strip()) for name in refresh}
+    study_genes, study_stats = [], []
+    computed = 0
+    for i, name in enumerate(file_list):
+        name = name.strip()
+        state = {'file': checkpoints.files_state(study_dir, [name])[0], 'key': keys[i]}
+        folder = _study_folder(filepath, name)
+        stats = None
+        if manifest['studies'].get(name) == state and name not in refresh:
+            try:
+                stats = _load_stats(folder)
+            except (OSError, ValueError, KeyError):
+                stats = None
+        if stats is None:
+            # the entry is dropped until the new statistics are saved
+            manifest['studies'].pop(name, None)
+            write_manifest(filepath, manifest)
+            stats = compute(i)
+            _save_stats(folder, *stats)
+            manifest['studies'][name] = state
+            write_manifest(filepath, manifest)
+            computed += 1
+        study_genes.append(stats[0])
+        study_stats.append(stats[1])
+
+    # the studies that left the pool leave the store too
+    for name in set(manifest['studies']) - {name.strip() for name in file_list}:
+        del manifest['studies'][name]
+        folder = _study_folder(filepath, name)
+        for stored in ('genes.npy', 'stats.npz'):
+            if os.path.exists(os.path.join(folder, stored)):
+                os.remove(os.path.join(folder, stored))
+        if os.path.isdir(folder):
+            os.rmdir(folder)
+    write_manifest(filepath, manifest)
+    print(str(computed) + ' studies summarized, ' + str(len(file_list) - computed) + ' taken from the study store')
+    return study_genes, study_stats
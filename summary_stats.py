@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+
+# Per-study summary statistics of all genes, aligned on one gene index.
+# genes: sorted gene names, mean / sd / n: float arrays of shape (genes, studies, groups),
+# mask: (genes, studies) True where the gene is measured in the study.
+# The groups follow the order given to split_data (controls, cases[, cases2]).
+StudySummaries = namedtuple('StudySummaries', ['genes', 'mean', 'sd', 'n', 'mask'])
+
+# number of genes summarized at a time by summarize_matrix
+BLOCK_ROWS = 4096
+
+
+# With this function we get the means, standard deviations and sizes of the groups of one study
+# straight from its (genes x samples) expression matrix,
+# which may be a numpy memmap: the rows are read block_rows at a time so only one block is in memory.
+# groups holds the sample (column) indices of each group, missing values are skipped like pandas does.
+# Output: means, standard deviations, group sizes and a mask of the genes without any missing value
+def summarize_matrix(values, groups, block_rows=BLOCK_ROWS):
+    num_of_genes = values.shape[0]
+    means = np.full((num_of_genes, len(groups)), np.nan)
+    stds = np.full((num_of_genes, len(groups)), np.nan)
+    complete = np.zeros(num_of_genes, dtype=bool)
+    sizes = np.array([len(samples) for samples in groups], dtype=float)
+
+    for start in range(0, num_of_genes, block_rows):
+        block = np.asarray(values[start:start + block_rows], dtype=float)
+        complete[start:start + block_rows] = ~np.isnan(block).any(axis=1)
+        for j, samples in enumerate(groups):
+            if len(samples) == 0:
+                continue
+            group = block[:, samples]
+            counts = (~np.isnan(group)).sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.nansum(group, axis=1) / counts
+                var = np.nansum((group - mean[:, None]) ** 2, axis=1) / (counts - 1)
+            means[start:start + block_rows, j] = np.where(counts > 0, mean, np.nan)
+            stds[start:start + block_rows, j] = np.where(counts > 1, np.sqrt(var), np.nan)
+
+    return means, stds, sizes, complete
+
+
+# With this function we find the rows of the genes of one study in the sorted gene index of a StudySummaries.
+# Output: the row of each kept gene and the mask of the kept study rows (a repeated gene keeps its first row)
+def study_gene_index(genes, study):
+    idx = pd.Index(genes).get_indexer(np.asarray(study, dtype=object))
+    first = ~pd.Series(idx).duplicated().to_numpy()
+    return idx[first], first
+
+
+# With this function we align the summaries of every study into one StudySummaries.
+# study_genes[i] holds the genes of study i and study_stats[i] its (means, stds, sizes).
+# A gene repeated inside a study keeps its first row.
+def build_summaries(study_genes, study_stats):
+    genes = pd.Index(np.concatenate([np.asarray(g, dtype=object) for g in study_genes])).unique().sort_values()
+    num_of_groups = len(study_stats[0][2])
+    shape = (len(genes), len(study_genes), num_of_groups)
+
+    mean = np.full(shape, np.nan)
+    sd = np.full(shape, np.nan)
+    n = np.full(shape, np.nan)
+    mask = np.zeros(shape[:2], dtype=bool)
+
+    for i, (study, (means, stds, sizes)) in enumerate(zip(study_genes, study_stats)):
+        idx, first = study_gene_index(genes, study)
+        mean[idx, i] = means[first]
+        sd[idx, i] = stds[first]
+        n[idx, i] = sizes
+        mask[idx, i] = True
+
+    return StudySummaries(genes.to_numpy(), mean, sd, n, mask)
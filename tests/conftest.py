@@ -0,0 +1,23 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# the modules of MAGE are imported from the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# With this fixture we write a study file as MAGE reads it: the sample IDs, the classes,
+# then one row per gene with its expressions (NaN written as an empty field)
+@pytest.fixture
+def write_study():
+    def write(path, genes, classes, values):
+        rows = ['gene_symbol\t' + '\t'.join('GSM%d' % i for i in range(len(classes))),
+                'class\t' + '\t'.join(str(c) for c in classes)]
+        for gene, row in zip(genes, np.asarray(values, dtype=float)):
+            rows.append(gene + '\t' + '\t'.join('' if np.isnan(x) else repr(float(x)) for x in row))
+        with open(path, 'w') as f:
+            f.write('\n'.join(rows) + '\n')
+        return str(path)
+    return write
@@ -0,0 +1,134 @@
+import math
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+import bayesian
+import meta_analysis
+from study_io import Study
+
+# Parity of the vectorized Bayesian meta-analysis with the closed-form per-gene formulas of the loop it replaced
+# (calc_metadata_bayesian_shard), on small fixed (genes x studies) arrays, NaN where a gene is missing from a study.
+# The third gene has a study with n1 = n2 = 6 (n_i == 3, left out of the sums), the last one only two studies
+
+M1 = np.array([[1.2, 2.0, 0.3, 0.9],
+               [5.1, 4.8, 5.6, 5.0],
+               [0.9, np.nan, 1.4, 1.1],
+               [3.3, 3.1, np.nan, np.nan]])
+SD1 = np.array([[0.5, 1.1, 0.4, 0.7],
+                [0.7, 0.6, 0.9, 0.8],
+                [0.3, np.nan, 0.6, 0.2],
+                [1.0, 1.4, np.nan, np.nan]])
+N1 = np.array([[10, 8, 20, 14],
+               [15, 12, 30, 9],
+               [6, np.nan, 11, 25],
+               [40, 7, np.nan, np.nan]])
+M2 = np.array([[0.8, 1.1, 0.5, 0.2],
+               [4.9, 4.9, 5.2, 4.1],
+               [1.0, np.nan, 1.3, 1.2],
+               [3.0, 3.6, np.nan, np.nan]])
+SD2 = np.array([[0.6, 0.9, 0.5, 0.8],
+                [0.8, 0.5, 1.0, 0.7],
+                [0.4, np.nan, 0.5, 0.3],
+                [1.2, 1.1, np.nan, np.nan]])
+N2 = np.array([[12, 9, 18, 16],
+               [14, 10, 28, 11],
+               [6, np.nan, 13, 22],
+               [35, 9, np.nan, np.nan]])
+
+PRIORS = [(0, 2), (1, 3)]
+
+
+# With this function we get the Bayesian estimates of one gene with the formulas of the old per-gene loop
+def per_gene_bayesian(rows, a, b):
+    n_i, ste, y_i = [], [], []
+    for m1, sd1, n1, m2, sd2, n2 in rows:
+        N = int(n1) + int(n2)
+        df = N - 2
+        s = math.sqrt(((n1 - 1) * sd1 * sd1 + (n2 - 1) * sd2 * sd2) / (N - 2))
+        J = (math.gamma(df / 2) / (math.sqrt(df / 2) * math.gamma((df - 1) / 2)))
+        n_i.append((n1 * n2) / (n1 + n2))
+        smd = (m1 - m2) * J / s
+        y_i.append(smd)
+        ste.append((J * J) * math.sqrt(N / (n1 * n2) + (smd * smd) / (2 * (N - 2))))
+
+    mean_y_i = sum(y_i) / len(y_i)
+    k = len(y_i)
+    if k < 3:
+        a, b = 2, 2
+    RSSb = sum(y ** 2 for y in y_i) - k * mean_y_i ** 2
+    t2 = 2 * (1 + b * RSSb / 2)
+
+    first_big_sum = second_big_sum = 0
+    for i in range(k):
+        if n_i[i] - 3 == 0.0:
+            continue
+        q1 = (n_i[i] * ste[i] * ste[i]) / (n_i[i] - 3)
+        q2 = (mean_y_i * (k - 3) + y_i[i]) / k
+        q3 = ((mean_y_i * mean_y_i * (mean_y_i - y_i[i]) + mean_y_i * y_i[i] * y_i[i]) * (k + 2 * a + 1) * b) / t2
+        first_big_sum += q1 * (q2 - q3)
+        second_big_sum += q1 * (((k - 1) / k) - (((mean_y_i * (mean_y_i - y_i[i]) + y_i[i] ** 2)
+                                                    * (k + 2 * a + 1) * b) / t2))
+
+    f = b * (k + 2 * a - 1) / t2
+    E_m = (mean_y_i - f * first_big_sum) / (1 - f * second_big_sum)
+    V_mu = t2 / (b * k * (2 * a + k - 3) or 0.0000000000000000000000001)
+    E_tau_square = t2 / (b * (2 * a + k - 3) or 0.0000000000000000000000001)
+    V_tau_square = (8 * (1 + b * RSSb / 2) ** 2) / (b ** 2 * (2 * a + k - 3) ** 2 * (k + 2 * a - 5) or 0.000000001)
+    z = E_m / math.sqrt(V_mu)
+    return [E_m, V_mu, E_tau_square, V_tau_square, E_m - 1.96 * math.sqrt(V_mu), E_m + 1.96 * math.sqrt(V_mu),
+            z, norm.sf(abs(z)) * 2]
+
+
+def test_bayesian_meta_analysis_matches_per_gene_formulas():
+    results = np.array(bayesian.bayesian_meta_analysis(M1, SD1, N1, M2, SD2, N2, PRIORS))
+    for prior, (a, b) in enumerate(PRIORS):
+        for gene in range(M1.shape[0]):
+            studies = ~np.isnan(M1[gene])
+            rows = np.stack([M1[gene], SD1[gene], N1[gene], M2[gene], SD2[gene], N2[gene]], axis=1)[studies]
+            np.testing.assert_allclose(results[:, prior, gene], per_gene_bayesian(rows, a, b), rtol=1e-9,
+                                       err_msg='prior ' + str((a, b)) + ', gene ' + str(gene))
+
+
+def test_bayesian_pool_takes_small_k_prior():
+    y, se, n_i = bayesian.bayesian_effects(M1, SD1, N1, M2, SD2, N2)
+    small = bayesian.bayesian_pool(y[3:], se[3:], n_i[3:], [(0, 2)])
+    expected = bayesian.bayesian_pool(y[3:], se[3:], n_i[3:], [bayesian.SMALL_K_PRIOR])
+    np.testing.assert_array_equal(np.array(small), np.array(expected))
+
+
+# the genes of the prior sweep: two studies of every gene but g02, found in three
+def sweep_summaries():
+    rng = np.random.default_rng(3)
+    studies = []
+    for s in range(3):
+        genes = np.array(['g%02d' % i for i in range(12)] if s < 2 else ['g02'])
+        studies.append(Study(genes=genes, ids=np.array(['s%d' % i for i in range(10)]),
+                             classes=np.array(['0'] * 5 + ['1'] * 5),
+                             values=rng.normal(size=(len(genes), 10)) + np.r_[np.zeros(5), np.ones(5)]))
+    return meta_analysis.split_data(studies, '0', '1', keep_expressions=False)[-1]
+
+
+def test_prior_sweep_pairs_every_a_with_every_b():
+    settings = {'a': '0,1', 'b': '2,3,4', 'prior_sweep': 'YES'}
+    assert meta_analysis.bayesian_priors(settings) == [(0, 2), (0, 3), (0, 4), (1, 2), (1, 3), (1, 4)]
+    assert meta_analysis.bayesian_priors(dict(settings, prior_sweep='NO', b='2,3')) == [(0, 2), (1, 3)]
+    assert meta_analysis.bayesian_priors(dict(settings, prior_sweep='NO', a='0.5')) == [(0.5, 2), (0.5, 3), (0.5, 4)]
+
+
+def test_prior_sweep_rows_are_the_single_prior_runs():
+    summaries = sweep_summaries()
+    priors = [(0, 2), (1, 3), (2, 2)]
+    sweep = meta_analysis.calc_metadata_bayesian(summaries, priors)
+    assert len(sweep) == len(summaries.genes) * len(priors)
+    assert sweep['Genes'].tolist() == np.repeat(summaries.genes, len(priors)).tolist()
+    for a, b in priors:
+        single = meta_analysis.calc_metadata_bayesian(summaries, [(a, b)])
+        rows = sweep[(sweep['a'] == a) & (sweep['b'] == b)].drop(columns=['a', 'b']).reset_index(drop=True)
+        pd.testing.assert_frame_equal(rows, single)
+
+    summary, changing = meta_analysis.prior_sensitivity(sweep, priors)
+    assert summary[['a', 'b']].values.tolist() == [list(prior) for prior in priors]
+    assert summary['gained'][0] == summary['lost'][0] == 0
+    assert 0 <= changing <= len(summaries.genes)
@@ -0,0 +1,56 @@
+import numpy as np
+
+from study_io import Study
+from meta_analysis import split_data, calc_metadata_bootstrap
+from bootstrap import resample_counts, single_sample_draws
+
+# The bootstrap meta-analysis on null data (no difference between the groups): 3 studies of 3 controls and
+# 3 cases, where a fifth of the replicates of a group would draw a single sample
+
+
+def null_studies(num_of_genes, num_of_studies, n, seed=0, shift=0.0):
+    rng = np.random.default_rng(seed)
+    genes = np.array(['g%03d' % i for i in range(num_of_genes)])
+    studies = []
+    for _ in range(num_of_studies):
+        values = rng.normal(size=(num_of_genes, 2 * n))
+        values[:, n:] += shift
+        studies.append(Study(genes=genes, ids=np.array(['s%d' % i for i in range(2 * n)]),
+                             classes=np.array(['0'] * n + ['1'] * n), values=values))
+    return studies
+
+
+def bootstrap_table(studies, num_of_reps=1000, seed=0):
+    expressions_team1, expressions_team2, summaries = split_data(studies, '0', '1')
+    return calc_metadata_bootstrap(summaries, expressions_team1, expressions_team2, 0.05, num_of_reps, seed)
+
+
+def test_resample_counts_never_draw_a_single_sample():
+    counts = resample_counts(np.random.default_rng(0), 3, 5000)
+    assert not single_sample_draws(counts).any()
+    np.testing.assert_array_equal(counts.sum(axis=1), 3)
+
+
+def test_bootstrap_p_values_keep_their_size_on_null_data():
+    df = bootstrap_table(null_studies(200, 3, 3))
+    assert (df['num_of_reps'] == 1000).all()
+    # no replicate blows up on a zero deviation
+    assert df['Standard_Error'].max() < 2
+    assert (df['p_value'] < 0.05).mean() <= 0.08
+    assert (df['bootstrap_p_value'] < 0.05).mean() <= 0.08
+
+
+def test_bootstrap_p_values_agree_on_a_difference():
+    df = bootstrap_table(null_studies(50, 3, 6, shift=2.0), num_of_reps=500)
+    assert (df['p_value'] < 0.05).mean() > 0.9
+    assert (df['bootstrap_p_value'] < 0.05).mean() > 0.9
+
+
+def test_replicates_with_tied_expressions_are_dropped():
+    studies = null_studies(5, 3, 3)
+    # two equal controls of the first gene in the first study: some replicates draw only them
+    studies[0].values[0, 1] = studies[0].values[0, 0]
+    df = bootstrap_table(studies, num_of_reps=400)
+    assert 0 < 400 - df['num_of_reps'][0] < 400
+    assert (df['num_of_reps'][1:] == 400).all()
+    assert df['Standard_Error'][0] < 2
@@ -0,0 +1,66 @@
+import os
+import pickle
+
+import pytest
+
+import checkpoints
+
+# The stage keys of a run chain each stage to the one before it: a changed setting invalidates its own stage
+# and the ones after it, never the ones before
+
+SETTINGS = {'study_dir': 'studies/', 'controls': '0', 'cases': '1', 'bootstrap': 'NO', 'num_of_reps': '200',
+            'significance_level': '0.05', 'multiple_comparisons': 'all'}
+
+
+def stage_keys(settings):
+    studies = checkpoints.stage_key(settings, 'studies', inputs=[['study1.txt', 10, 1]])
+    effects = checkpoints.stage_key(settings, 'effect_sizes', studies)
+    meta_analysis = checkpoints.stage_key(settings, 'meta_analysis', effects)
+    results = checkpoints.stage_key(settings, 'multiple_testing', meta_analysis)
+    return [studies, effects, meta_analysis, results]
+
+
+@pytest.mark.parametrize('setting, value, first_changed', [('multiple_comparisons', 'step_up', 3),
+                                                           ('bootstrap', 'YES', 2),
+                                                           ('cases', '2', 1),
+                                                           ('study_dir', 'other/', 0)])
+def test_a_changed_setting_invalidates_only_the_stages_after_it(setting, value, first_changed):
+    before, after = stage_keys(SETTINGS), stage_keys(dict(SETTINGS, **{setting: value}))
+    assert before[:first_changed] == after[:first_changed]
+    assert all(a != b for a, b in zip(before[first_changed:], after[first_changed:]))
+
+
+def test_run_stage_resumes_only_with_an_unchanged_key(tmp_path):
+    filepath = str(tmp_path) + '/'
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+
+    assert checkpoints.run_stage(filepath, 'stage', 'key1', compute, resume=True) == 1
+    assert checkpoints.run_stage(filepath, 'stage', 'key1', compute, resume=True) == 1
+    assert checkpoints.run_stage(filepath, 'stage', 'key1', compute, resume=False) == 2
+    assert checkpoints.run_stage(filepath, 'stage', 'key2', compute, resume=True) == 3
+
+
+def test_unreadable_checkpoint_is_discarded_with_its_reason(tmp_path, capsys):
+    filepath = str(tmp_path) + '/'
+    checkpoints.save(filepath, 'stage', 'key', list(range(1000)))
+    value_path = os.path.join(filepath, checkpoints.CHECKPOINT_FOLDER, 'stage.pkl')
+    with open(value_path, 'r+b') as f:
+        f.truncate(100)
+    assert checkpoints.load(filepath, 'stage', 'key') is None
+    assert 'Checkpoint of stage discarded' in capsys.readouterr().out
+
+
+class Broken:
+    def __reduce__(self):
+        return (int, ('not a number', 'not a base'))
+
+
+def test_errors_of_the_loaded_code_are_not_swallowed(tmp_path):
+    filepath = str(tmp_path) + '/'
+    checkpoints.save(filepath, 'stage', 'key', Broken())
+    with pytest.raises(TypeError):
+        checkpoints.load(filepath, 'stage', 'key')
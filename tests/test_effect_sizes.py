@@ -0,0 +1,43 @@
+import numpy as np
+
+import effect_sizes
+from summary_stats import StudySummaries
+
+# The effect size table of the effect_sizes stage read back should be the StudyEffects it was written from
+
+
+# With this function we get the StudySummaries of random studies, the genes missing from some studies
+def random_summaries(num_of_genes=9, num_of_studies=4, seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (num_of_genes, num_of_studies, 2)
+    mask = rng.random(shape[:2]) < 0.8
+    mean, sd = rng.normal(size=shape), rng.gamma(2.0, size=shape)
+    n = rng.integers(3, 30, size=shape).astype(float)
+    # a study where both groups of a gene have zero deviation
+    sd[0, 0] = 0
+    mask[0, 0] = True
+    for values in (mean, sd, n):
+        values[~mask] = np.nan
+    return StudySummaries(np.array(['G%d' % i for i in range(num_of_genes)], dtype=object), mean, sd, n, mask)
+
+
+def test_read_effects_of_write_effects(tmp_path):
+    effects = effect_sizes.study_effects(random_summaries())
+    studies = ['s%d.txt' % j for j in range(effects.mask.shape[1])]
+    path = str(tmp_path / effect_sizes.EFFECT_SIZES_FILE)
+    effect_sizes.write_effects(path, effects, studies, 'key')
+
+    read, read_studies = effect_sizes.read_effects(path, 'key')
+    assert read_studies == studies
+    assert list(read.genes) == list(effects.genes)
+    np.testing.assert_array_equal(read.mask, effects.mask)
+    for field in ('mean', 'sd', 'n', 'g', 'se'):
+        np.testing.assert_array_equal(getattr(read, field), getattr(effects, field))
+
+
+def test_read_effects_of_another_key(tmp_path):
+    effects = effect_sizes.study_effects(random_summaries())
+    path = str(tmp_path / effect_sizes.EFFECT_SIZES_FILE)
+    effect_sizes.write_effects(path, effects, ['s%d' % j for j in range(effects.mask.shape[1])], 'key')
+    assert effect_sizes.read_effects(path, 'other key') is None
+    assert effect_sizes.read_effects(str(tmp_path / 'missing.npz')) is None
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from study_io import Study
+from meta_analysis import split_data, calc_metadata_shard
+from gene_shards import map_shards, iter_shards, shard_bounds
+
+# The sharded meta-analysis gives the same table, to the byte, whatever the number of workers and shards
+
+
+def studies(seed=0):
+    rng = np.random.default_rng(seed)
+    result = []
+    for s, (num_of_genes, n1, n2) in enumerate([(60, 4, 5), (45, 6, 3), (70, 3, 3)]):
+        genes = np.array(['g%03d' % i for i in rng.choice(80, num_of_genes, replace=False)])
+        result.append(Study(genes=genes, ids=np.array(['s%d' % i for i in range(n1 + n2)]),
+                            classes=np.array(['0'] * n1 + ['1'] * n2),
+                            values=rng.normal(size=(num_of_genes, n1 + n2))))
+    return result
+
+
+def test_shard_bounds_cover_the_genes_in_order():
+    bounds = shard_bounds(10, 3)
+    assert bounds[0][0] == 0 and bounds[-1][1] == 10
+    assert all(stop == start for (_, stop), (start, _) in zip(bounds, bounds[1:]))
+    assert shard_bounds(2, 5) == [(0, 1), (1, 2)]
+
+
+def test_workers_give_byte_identical_tables():
+    summaries = split_data(studies(), '0', '1', keep_expressions=False)[-1]
+    single = map_shards(calc_metadata_shard, summaries, 1).to_csv(sep='\t')
+    assert map_shards(calc_metadata_shard, summaries, 3).to_csv(sep='\t') == single
+    sharded = pd.concat(list(iter_shards(calc_metadata_shard, summaries, 2, 7)), ignore_index=True)
+    assert sharded.to_csv(sep='\t') == single
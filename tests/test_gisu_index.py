@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import gisu_index
+
+# The transformation of a study through the probe index should give the output of the merges of the
+# platform table, gene_history and gene info that GISU ran for every study before the index
+
+PLATFORM = pd.DataFrame({'ID': ['p1', 'p2', 'p3', 'p4', 'p5', 'p6', 'p7', 'p8'],
+                         'SPOT_ID': [11, 12, 13, 14, 11, 15, 16, 12]})
+# 13 is discontinued for 21, 14 is discontinued without a replacement
+GENE_HISTORY = pd.DataFrame({'GeneID': [21, '-', 22], 'Discontinued_GeneID': [13, 14, 99]})
+# 16 has no symbol
+GENE_INFO = pd.DataFrame({'GeneID': [11, 12, 15, 21], 'Symbol': ['B', 'A', 'C', 'D']})
+
+
+# With this function we transform the data of a study with the merges of the old GISU run
+def merge_transform(data, platform_table, gene_history, gene_info, transformation_method):
+    dataIDs = pd.DataFrame(data["ID_REF"])
+    probe_ID_platform = pd.merge(dataIDs, platform_table, how="inner", left_on="ID_REF", right_on="ID").drop(
+        columns="ID")
+    probe_ID_gene_history = pd.merge(probe_ID_platform, gene_history, how="inner", left_on="SPOT_ID",
+                                     right_on="Discontinued_GeneID").drop(columns=["Discontinued_GeneID", "SPOT_ID"])
+    updated = pd.merge(probe_ID_platform, probe_ID_gene_history, how="outer", left_on="ID_REF", right_on="ID_REF")
+    updated['SPOT_ID'] = np.where(updated.GeneID.notna(), updated['GeneID'], updated['SPOT_ID'])
+    updated.drop(columns="GeneID", inplace=True)
+
+    probe_ID_final = updated[updated['SPOT_ID'] != '-'].copy()
+    probe_ID_final.dropna(axis=0, how="any", inplace=True)
+    probe_ID_final['SPOT_ID'] = probe_ID_final['SPOT_ID'].astype(int)
+    probe_ID_NCBI = pd.merge(probe_ID_final, gene_info, how="inner", left_on="SPOT_ID", right_on="GeneID").drop(
+        columns="GeneID")
+
+    final_file = pd.merge(probe_ID_NCBI, data, how="inner", left_on="ID_REF", right_on="ID_REF")
+    final_file.drop(columns="ID_REF", inplace=True)
+    for col in final_file.columns[2:]:
+        final_file[col] = final_file[col].astype(float)
+    fun = {i: transformation_method for i in list(final_file.columns.values)[2:]}
+    output = final_file.groupby(by=['SPOT_ID', 'Symbol']).agg(fun).reset_index()
+    return output.drop(columns="SPOT_ID")
+
+
+@pytest.mark.parametrize('transformation_method', ['mean', 'min', 'max'])
+def test_transform_matches_the_merges(transformation_method):
+    rng = np.random.default_rng(0)
+    # the probes of the study in another order than the platform, one of them not on the platform
+    probes = ['p8', 'p3', 'p1', 'x9', 'p6', 'p2', 'p5', 'p4', 'p7']
+    data = pd.DataFrame(rng.normal(size=(len(probes), 3)), columns=['GSM1', 'GSM2', 'GSM3'])
+    data.insert(0, 'ID_REF', probes)
+
+    index = gisu_index.build_index(PLATFORM, GENE_HISTORY, GENE_INFO)
+    expected = merge_transform(data, PLATFORM, GENE_HISTORY, GENE_INFO, transformation_method)
+    output = gisu_index.transform(data, index, transformation_method)
+    assert list(output['Symbol']) == ['B', 'A', 'C', 'D']
+    pd.testing.assert_frame_equal(output, expected, check_exact=False, rtol=1e-15)
+
+
+def test_platform_index_is_kept_in_index_dir(tmp_path):
+    built = []
+
+    def references():
+        built.append(True)
+        return PLATFORM, GENE_HISTORY, GENE_INFO
+
+    index = gisu_index.platform_index('GPL_test', 'key', references, str(tmp_path))
+    gisu_index._INDEXES.clear()
+    read = gisu_index.platform_index('GPL_test', 'key', references, str(tmp_path))
+    assert len(built) == 1
+    for field in gisu_index.GeneIndex._fields:
+        np.testing.assert_array_equal(getattr(read, field), getattr(index, field))
+    # another key builds it again
+    gisu_index._INDEXES.clear()
+    gisu_index.platform_index('GPL_test', 'other key', references, str(tmp_path))
+    assert len(built) == 2
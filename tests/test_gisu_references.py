@@ -0,0 +1,82 @@
+import gzip
+import os
+
+import numpy as np
+import pytest
+
+import gisu_references
+
+# The reference cache fetches a table only when its source changed (or a refresh is asked for) and parses it
+# only when the fetched file is a new version; the tables come from a mirror folder, so no network is used
+
+TABLES = {'gene_history': 'GeneID\tDiscontinued_GeneID\tOther\n21\t13\tx\n-\t14\ty\n',
+          'gene_info': 'GeneID\tSymbol\tOther\n11\tB\tx\n12\tA\ty\n'}
+
+
+# With this function we write the .gz file of a table to the mirror folder
+def write_source(mirror, name, text, mtime_ns=None):
+    path = gisu_references.source_of(name, str(mirror))
+    with gzip.GzipFile(path, 'wb', mtime=0) as f:
+        f.write(text.encode('utf-8'))
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return path
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = {'fetch': 0, 'parse_table': 0}
+    for name in calls:
+        def counted(*args, function=getattr(gisu_references, name), name=name):
+            calls[name] += 1
+            return function(*args)
+        monkeypatch.setattr(gisu_references, name, counted)
+    return calls
+
+
+def test_sync_fetches_only_changed_sources(tmp_path, calls):
+    mirror, cache_dir = tmp_path / 'mirror', str(tmp_path / 'cache')
+    os.makedirs(mirror)
+    for name, text in TABLES.items():
+        write_source(mirror, name, text, mtime_ns=10 ** 18)
+
+    versions = gisu_references.sync(cache_dir, str(mirror))
+    assert calls == {'fetch': 2, 'parse_table': 2}
+    gene_info = gisu_references.load_table(cache_dir, 'gene_info', versions['gene_info'])
+    assert list(gene_info['Symbol']) == ['B', 'A']
+    gene_history = gisu_references.load_table(cache_dir, 'gene_history', versions['gene_history'])
+    np.testing.assert_array_equal(gene_history['GeneID'], [21, np.nan])
+
+    # hit: the sources are unchanged
+    assert gisu_references.sync(cache_dir, str(mirror)) == versions
+    assert calls == {'fetch': 2, 'parse_table': 2}
+
+    # the same file with another modification time is fetched but not parsed again
+    write_source(mirror, 'gene_info', TABLES['gene_info'], mtime_ns=2 * 10 ** 18)
+    assert gisu_references.sync(cache_dir, str(mirror)) == versions
+    assert calls == {'fetch': 3, 'parse_table': 2}
+
+    # a new version of a table replaces the old one
+    write_source(mirror, 'gene_info', TABLES['gene_info'] + '15\tC\tz\n', mtime_ns=3 * 10 ** 18)
+    updated = gisu_references.sync(cache_dir, str(mirror))
+    assert calls == {'fetch': 4, 'parse_table': 3}
+    assert updated['gene_history'] == versions['gene_history'] and updated['gene_info'] != versions['gene_info']
+    assert os.listdir(os.path.join(cache_dir, 'gene_info')) == [updated['gene_info']]
+
+    # a refresh fetches every table again
+    assert gisu_references.sync(cache_dir, str(mirror), refresh=True) == updated
+    assert calls == {'fetch': 6, 'parse_table': 3}
+
+
+def test_sync_uses_the_cached_version_without_a_source(tmp_path, calls):
+    mirror, cache_dir = tmp_path / 'mirror', str(tmp_path / 'cache')
+    os.makedirs(mirror)
+    paths = [write_source(mirror, name, text) for name, text in TABLES.items()]
+    versions = gisu_references.sync(cache_dir, str(mirror))
+    for path in paths:
+        os.remove(path)
+    assert gisu_references.sync(cache_dir, str(mirror)) == versions
+    assert calls['fetch'] == 2
+
+    with pytest.raises(OSError):
+        gisu_references.sync(str(tmp_path / 'empty cache'), str(mirror))
@@ -0,0 +1,88 @@
+import pytest
+import requests
+
+import gprofiler_client
+
+# The g:Profiler client retried and cached against a stub of the GProfiler client, no network is used
+
+
+# A GProfiler stub converting every probe that starts with 'p' and recording the queries it gets
+class StubProfiler:
+    queries = []
+
+    def __init__(self, user_agent=None, base_url=None):
+        pass
+
+    def convert(self, query, organism, target_namespace, numeric_namespace):
+        StubProfiler.queries.append(list(query))
+        return [{'incoming': probe, 'converted': probe.upper()} for probe in query if probe.startswith('p')]
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    StubProfiler.queries = []
+    monkeypatch.setattr(gprofiler_client, 'GProfiler', StubProfiler)
+    monkeypatch.setattr(gprofiler_client, '_CONVERSIONS', {})
+    monkeypatch.setattr(gprofiler_client.time, 'sleep', lambda seconds: None)
+    return {'gprofiler_cache_dir': str(tmp_path / 'cache') + '/', 'gprofiler_retries': '2',
+            'gprofiler_concurrency': '2'}
+
+
+# With this function we get a call that fails the given times before it returns the value
+def failing(times, value):
+    calls = []
+
+    def call():
+        calls.append(True)
+        if len(calls) <= times:
+            raise requests.exceptions.ConnectionError('connection reset')
+        return value
+    return call, calls
+
+
+def test_with_retries(settings):
+    call, calls = failing(2, 'response')
+    assert gprofiler_client.with_retries(call, 2) == 'response'
+    assert len(calls) == 3
+
+    call, calls = failing(3, 'response')
+    with pytest.raises(requests.exceptions.ConnectionError):
+        gprofiler_client.with_retries(call, 2)
+    assert len(calls) == 3
+
+
+def test_cached_request(settings):
+    responses = []
+
+    def call(client):
+        assert isinstance(client, StubProfiler)
+        responses.append(len(responses))
+        return {'response': len(responses)}
+
+    request = {'organism': 'hsapiens', 'query': ['A', 'B']}
+    assert gprofiler_client.cached_request(settings, 'profile', request, call) == {'response': 1}
+    # the recorded response is used for the same request, in replay too
+    assert gprofiler_client.cached_request(settings, 'profile', dict(request), call) == {'response': 1}
+    assert gprofiler_client.cached_request(dict(settings, gprofiler_replay='YES'), 'profile', request,
+                                           call) == {'response': 1}
+    assert len(responses) == 1
+
+    other = {'organism': 'hsapiens', 'query': ['A', 'C']}
+    with pytest.raises(LookupError):
+        gprofiler_client.cached_request(dict(settings, gprofiler_replay='YES'), 'profile', other, call)
+    assert gprofiler_client.cached_request(settings, 'profile', other, call) == {'response': 2}
+
+
+def test_convert_in_batches(settings, monkeypatch):
+    monkeypatch.setattr(gprofiler_client, 'CONVERT_BATCH', 2)
+    probes = ['p3', 'x1', 'p1', 'p2', 'p1']
+    assert gprofiler_client.convert(settings, probes, 'hsapiens', 'ENSG') == ['P3', 'None', 'P1', 'P2', 'P1']
+    assert sorted(StubProfiler.queries) == [['p1', 'p2'], ['p3', 'x1']]
+
+    # the probes converted by the process are not sent again, the batches of a new process are read from the cache
+    assert gprofiler_client.convert(settings, ['p2', 'p4'], 'hsapiens', 'ENSG') == ['P2', 'P4']
+    assert StubProfiler.queries[2:] == [['p4']]
+    monkeypatch.setattr(gprofiler_client, '_CONVERSIONS', {})
+    assert gprofiler_client.convert(dict(settings, gprofiler_replay='YES'), probes, 'hsapiens',
+                                    'ENSG') == ['P3', 'None', 'P1', 'P2', 'P1']
+    assert len(StubProfiler.queries) == 3
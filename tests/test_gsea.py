@@ -0,0 +1,85 @@
+import numpy as np
+
+import gsea
+from local_enrichment import GeneSets
+
+# The enrichment scores of the preranked GSEA on a toy ranking, checked against the running sum walked gene by gene
+
+GENES = np.array(['G%d' % i for i in range(20)], dtype=object)
+STATISTIC = np.sort(np.random.default_rng(1).normal(size=len(GENES)) * 2)[::-1]
+# a set at the top, one at the bottom and one spread over the ranking (the genes not in the ranking are left out)
+SETS = [['G0', 'G1', 'G3', 'G6'], ['G19', 'G17', 'G18', 'G12', 'G8'], ['G2', 'G9', 'G15', 'X1']]
+
+
+# With this function we get the GeneSets of SETS
+def gene_sets():
+    genes = np.unique([gene for members in SETS for gene in members])
+    codes = [np.sort(np.searchsorted(genes, members)) for members in SETS]
+    return GeneSets(genes, np.array(['TOY'] * len(SETS), dtype=object),
+                    np.array(['TOY:%d' % s for s in range(len(SETS))], dtype=object),
+                    np.array(['set %d' % s for s in range(len(SETS))], dtype=object), np.concatenate(codes),
+                    np.concatenate([[0], np.cumsum([len(c) for c in codes])]))
+
+
+# With this function we walk the running sum down the ranking: up by the weight of a gene of the set
+# over the weights of the set, down by 1 over the genes not in it. Output: its largest and smallest value
+def walk(in_set, weights):
+    running = np.cumsum(np.where(in_set, weights / weights[in_set].sum(), -1.0 / (~in_set).sum()))
+    return running.max(), running.min()
+
+
+# With this function we get the enrichment score of the walk: its largest deviation from zero
+def walk_es(in_set, weights):
+    largest, smallest = walk(in_set, weights)
+    return largest if largest >= -smallest else smallest
+
+
+# With this function we get the ranks of the genes of SETS in the ranking, one set after the other, and their offsets
+def set_ranks():
+    ranks = [np.flatnonzero(np.isin(GENES, members)) for members in SETS]
+    return np.concatenate(ranks), np.concatenate([[0], np.cumsum([len(r) for r in ranks])])
+
+
+def test_enrichment_scores_match_the_walk():
+    weights = np.abs(STATISTIC)
+    results = gsea.preranked_gsea(gene_sets(), GENES, STATISTIC, num_of_permutations=50, min_size=1).set_index(
+        'native')
+    for s, members in enumerate(SETS):
+        in_set = np.isin(GENES, members)
+        assert results.loc['TOY:%d' % s, 'size'] == in_set.sum()
+        np.testing.assert_allclose(results.loc['TOY:%d' % s, 'ES'], walk_es(in_set, weights), rtol=1e-12)
+    assert results.loc['TOY:0', 'ES'] > 0 > results.loc['TOY:1', 'ES']
+    assert results.loc['TOY:0', 'leading_edge'] == ['G0', 'G1', 'G3', 'G6']
+    assert results.loc['TOY:1', 'leading_edge'] == ['G17', 'G18', 'G19']
+
+
+def test_null_scores_match_the_walk():
+    weights = np.abs(STATISTIC) ** 0.5
+    ranks, offsets = set_ranks()
+    null = gsea.null_scores(ranks, offsets, weights, 200, 7)
+
+    # the permutations of the seed spawned from the seed of the run move the genes of the sets to random ranks
+    rng = np.random.default_rng(np.random.SeedSequence(7).spawn(1)[0])
+    for i in range(200):
+        permutation = rng.permutation(len(GENES))
+        for s in range(len(SETS)):
+            in_set = np.zeros(len(GENES), dtype=bool)
+            in_set[permutation[ranks[offsets[s]:offsets[s + 1]]]] = True
+            largest, smallest = walk(in_set, weights)
+            np.testing.assert_allclose(abs(null[i, s]), max(largest, -smallest), rtol=1e-12)
+            # the sign of a walk whose largest and smallest deviations tie is up to the last bit
+            if not np.isclose(largest, -smallest, rtol=1e-12):
+                assert (null[i, s] >= 0) == (largest > -smallest)
+
+
+def test_normalized_scores_and_p_values():
+    results = gsea.preranked_gsea(gene_sets(), GENES, STATISTIC, num_of_permutations=200, seed=7, weight=0.5,
+                                  min_size=1).set_index('native')
+    ranks, offsets = set_ranks()
+    null = gsea.null_scores(ranks, offsets, np.abs(STATISTIC) ** 0.5, 200, 7)
+    for s in range(len(SETS)):
+        es = results.loc['TOY:%d' % s, 'ES']
+        same_sign = null[:, s][null[:, s] >= 0] if es >= 0 else null[:, s][null[:, s] < 0]
+        np.testing.assert_allclose(results.loc['TOY:%d' % s, 'NES'], es / np.abs(same_sign.mean()), rtol=1e-12)
+        np.testing.assert_allclose(results.loc['TOY:%d' % s, 'p_value'], (np.abs(same_sign) >= abs(es)).mean(),
+                                   rtol=1e-12)
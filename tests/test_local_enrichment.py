@@ -0,0 +1,64 @@
+from math import comb
+
+import numpy as np
+import pytest
+
+import local_enrichment
+
+# The local enrichment of a query against toy GMT files, checked against the hypergeometric p values
+# written out as sums of binomial coefficients
+
+# KEGG terms (source from the g:Profiler file name) and REAC terms (source from the term IDs)
+GMT_FILES = {'hsapiens.KEGG.name.gmt': ['KEGG:1\tglycolysis\tA\tB\tC\tD', 'KEGG:2\tcitrate\tC\tD\tE',
+                                        'KEGG:3\tpentose\tF\tG'],
+             'custom.gmt': ['REAC:1\tsignalling\tA\tH\tI\ta', 'REAC:2\tapoptosis\tH\tI\tJ']}
+QUERY = ['a', 'b', 'H', 'Z']
+
+
+# With this function we get the probability of at least k of the N query genes in a term of n genes
+# of a domain of M genes
+def hypergeometric_p(k, M, n, N):
+    return sum(comb(n, i) * comb(M - n, N - i) for i in range(k, min(n, N) + 1)) / comb(M, N)
+
+
+@pytest.fixture
+def gene_sets(tmp_path):
+    for filename, lines in GMT_FILES.items():
+        with open(tmp_path / filename, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+    return local_enrichment.read_gene_sets(str(tmp_path))
+
+
+def test_read_gene_sets(gene_sets):
+    assert list(gene_sets.native) == ['REAC:1', 'REAC:2', 'KEGG:1', 'KEGG:2', 'KEGG:3']
+    assert list(gene_sets.source) == ['REAC', 'REAC', 'KEGG', 'KEGG', 'KEGG']
+    # the gene repeated in REAC:1 (a, A) counts once
+    assert list(np.diff(gene_sets.offsets)) == [3, 3, 4, 3, 2]
+
+
+def test_enrichment_p_values(gene_sets):
+    results = local_enrichment.enrichment(gene_sets, QUERY, 0.05, 'bonferroni').set_index('native')
+    # KEGG: domain A-G, the query genes a and b. REAC: domain A, H, I, J, the query genes a and H
+    assert sorted(results.index) == ['KEGG:1', 'REAC:1', 'REAC:2']
+    assert list(results['query_size']) == [2, 2, 2]
+    # the genes of the query keep their case
+    assert results.loc['KEGG:1', 'intersections'] == ['a', 'b']
+    # bonferroni over the 3 KEGG terms and the 2 REAC terms
+    np.testing.assert_allclose(results.loc['KEGG:1', 'p_value'], min(3 * hypergeometric_p(2, 7, 4, 2), 1), rtol=1e-12)
+    np.testing.assert_allclose(results.loc['REAC:1', 'p_value'], min(2 * hypergeometric_p(2, 4, 3, 2), 1), rtol=1e-12)
+    np.testing.assert_allclose(results.loc['REAC:2', 'p_value'], min(2 * hypergeometric_p(1, 4, 3, 2), 1), rtol=1e-12)
+    assert list(results['effective_domain_size']) == [7 if native.startswith('KEGG') else 4
+                                                     for native in results.index]
+
+
+def test_g_scs_counts_the_terms_that_can_reach_the_threshold():
+    term_size, query_size, domain_size = np.array([4, 3, 2]), np.array([2, 2, 2]), np.array([7, 7, 7])
+    # the smallest p values of the terms: 6/21, 3/21 and 1/21
+    best = [hypergeometric_p(2, 7, n, 2) for n in term_size]
+    np.testing.assert_allclose(best, [6 / 21, 3 / 21, 1 / 21])
+    p = np.array([0.01, 0.02, 0.4])
+    np.testing.assert_allclose(local_enrichment.g_scs(p, term_size, query_size, domain_size, 0.05), p)
+    np.testing.assert_allclose(local_enrichment.g_scs(p, term_size, query_size, domain_size, 0.15), [0.02, 0.04, 0.8])
+    np.testing.assert_allclose(local_enrichment.g_scs(p, term_size, query_size, domain_size, 0.5), [0.03, 0.06, 1])
+    # no term can reach the threshold: the p values are kept
+    np.testing.assert_allclose(local_enrichment.g_scs(p, term_size, query_size, domain_size, 0.01), p)
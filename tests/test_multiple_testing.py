@@ -0,0 +1,55 @@
+import numpy as np
+from statsmodels.stats.multitest import multipletests
+
+import multiple_testing
+
+# Parity of the vectorized multiple testing with statsmodels' multipletests and with the per-gene
+# threshold loops (get_one_step_methods, get_step_down_methods, get_step_up_methods) it replaced
+
+P = np.array([0.041, 0.0003, 0.52, 0.012, 0.0009, 0.2, 0.049, 0.0001, 0.87, 0.03, 0.0061, 0.3])
+ALPHA = 0.05
+
+
+def test_adjusted_p_values_match_multipletests():
+    adjusted = multiple_testing.adjusted_p_values(P)
+    for method in multiple_testing.ADJUSTED_METHODS:
+        np.testing.assert_allclose(adjusted[method], multipletests(P, method=method)[1], rtol=1e-12,
+                                   err_msg=method)
+
+
+def test_adjusted_p_values_leave_nan_out():
+    p = P.copy()
+    p[[2, 7]] = np.nan
+    finite = ~np.isnan(p)
+    adjusted = multiple_testing.adjusted_p_values(p)
+    for method in multiple_testing.ADJUSTED_METHODS:
+        assert np.isnan(adjusted[method][~finite]).all()
+        np.testing.assert_allclose(adjusted[method][finite], multipletests(p[finite], method=method)[1],
+                                   rtol=1e-12, err_msg=method)
+
+
+# With this function we get the thresholds of every p value with the loops of the old per-gene functions
+def loop_thresholds(p, alpha):
+    m = len(p)
+    limits = {name: np.empty(m) for name in multiple_testing.MULTIPLE_TESTS['all']}
+    for i in range(m):
+        limits['bonferroni'][i] = alpha / m
+        limits['sidak'][i] = 1 - (1 - alpha) ** (1 / m)
+    for i, gene in enumerate(np.argsort(p)):
+        limits['holm'][gene] = alpha / (m - i + 1)
+        limits['holland'][gene] = 1 - (1 - alpha) ** (1 / (m - i + 1))
+    descending = np.argsort(p)[::-1]
+    limits['hochberg'][descending[0]] = limits['simes'][descending[0]] = p[descending[0]]
+    for k, i in enumerate(range(m - 1, 0, -1), start=1):
+        limits['hochberg'][descending[k]] = alpha / (m + 1 - i)
+        limits['simes'][descending[k]] = (i * alpha) / m
+    return limits
+
+
+def test_thresholds_and_decisions_match_per_gene_loops():
+    limits = multiple_testing.thresholds(P, ALPHA)
+    expected = loop_thresholds(P, ALPHA)
+    found = multiple_testing.decisions(P, ALPHA)
+    for name in multiple_testing.MULTIPLE_TESTS['all']:
+        np.testing.assert_allclose(limits[name], expected[name], rtol=1e-12, err_msg=name)
+        np.testing.assert_array_equal(found[name], (P < expected[name]).astype(int), err_msg=name)
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import matplotlib.pyplot as plt
+import scipy.stats as stats
+
+import plots
+
+# The plots of two runs go through their own Renderers: their settings and figures never mix
+
+
+def test_renderers_keep_their_own_settings_and_figures(tmp_path):
+    first = plots.renderer({'plot_dpi': '50', 'plot_formats': 'png', 'plot_workers': '1'})
+    second = plots.renderer({'plot_dpi': '100', 'plot_formats': 'png, svg', 'plot_workers': '1'})
+    values = np.random.default_rng(0).normal(size=100)
+    plots.submit(first, plots.histogram_figure, str(tmp_path / 'first'), values, 'first', 'r', 10)
+    plots.submit(second, plots.histogram_figure, str(tmp_path / 'second'), values, 'second', 'g', 10)
+
+    # waiting for one run leaves the figures of the other to its own wait
+    plots.wait(first)
+    assert len(first.pending) == 0 and len(second.pending) == 1
+    plots.wait(second)
+
+    assert sorted(os.listdir(tmp_path)) == ['first.png', 'second.png', 'second.svg']
+    assert plt.imread(str(tmp_path / 'first.png')).shape[:2] == (240, 320)
+    assert plt.imread(str(tmp_path / 'second.png')).shape[:2] == (480, 640)
+
+
+def test_renderer_without_workers_renders_at_once(tmp_path):
+    renderer = plots.renderer({'plot_workers': '0', 'plot_formats': 'png'})
+    assert renderer.pool is None
+    plots.submit(renderer, plots.histogram_figure, str(tmp_path / 'now'), np.arange(10.0), 'now', 'b', 5)
+    assert os.listdir(tmp_path) == ['now.png']
+    plots.wait(renderer)
+
+
+# The aggregated volcano and QQ plots draw only their outliers as points, every other gene goes to the raster
+
+
+def test_volcano_density_draws_the_most_significant_genes(monkeypatch):
+    monkeypatch.setattr(plots, 'MAX_POINTS', 5)
+    rng = np.random.default_rng(0)
+    smd, p_values = rng.normal(size=200), rng.random(200)
+    p_values[:3] = [1e-6, 1e-8, 1e-7]
+    log_p = -np.log10(p_values)
+    smd[10] = np.nan
+
+    # 3 genes below alpha: all of them are points
+    counts, extent, x, y = plots.volcano_density(smd, log_p, p_values, 1e-5)
+    np.testing.assert_array_equal(x, smd[[1, 2, 0]])
+    np.testing.assert_array_equal(y, log_p[[1, 2, 0]])
+    # every other finite gene is in the raster
+    assert counts.shape == plots.DENSITY_BINS[::-1] and counts.sum() == 199 - 3
+    assert extent == [np.nanmin(smd), np.nanmax(smd), log_p.min(), log_p.max()]
+
+    # more genes below alpha than MAX_POINTS: the MAX_POINTS smallest p values
+    counts, extent, x, y = plots.volcano_density(smd, log_p, p_values, 0.5)
+    finite = np.isfinite(smd)
+    smallest = np.argsort(np.where(finite, p_values, np.inf))[:5]
+    np.testing.assert_array_equal(np.sort(x), np.sort(smd[smallest]))
+    assert counts.sum() == 199 - 5
+
+
+def test_qq_density_draws_the_tails(monkeypatch):
+    monkeypatch.setattr(plots, 'MAX_POINTS', 6)
+    measurements = np.random.default_rng(1).normal(size=100)
+    measurements[5] = np.nan
+    counts, extent, osm, osr, line_x, line_y = plots.qq_density(measurements)
+
+    (expected_osm, expected_osr), (slope, intercept, r) = stats.probplot(measurements[np.isfinite(measurements)])
+    # the 3 smallest and the 3 largest ordered values are points, the rest is in the raster
+    np.testing.assert_array_equal(osm, np.concatenate([expected_osm[:3], expected_osm[-3:]]))
+    np.testing.assert_array_equal(osr, np.concatenate([expected_osr[:3], expected_osr[-3:]]))
+    assert counts.shape == plots.QQ_BINS[::-1] and counts.sum() == 99 - 6
+    np.testing.assert_array_equal(line_x, expected_osm[[0, -1]])
+    np.testing.assert_allclose(line_y, slope * line_x + intercept)
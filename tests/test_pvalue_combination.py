@@ -0,0 +1,56 @@
+import math
+
+import numpy as np
+from scipy.stats import norm, chi2
+
+import pvalue_combination
+
+# Parity of the vectorized global1 combinations with the per-gene formulas of the multivariate loop they
+# replaced (calc_meta_data), on small fixed (genes x studies) arrays with a mask of the studies of every gene
+
+P_W = np.array([[0.21, 0.043, 0.67, 0.0081],
+                [0.5, 0.32, 0.11, np.nan],
+                [0.019, np.nan, 0.74, np.nan],
+                [0.9, 0.63, 0.45, 0.28]])
+N = np.array([[24, 31, 18, 60],
+              [45, 12, 27, np.nan],
+              [33, np.nan, 51, np.nan],
+              [16, 22, 38, 90]])
+VALID = ~np.isnan(P_W)
+NUM_OF_STUDIES = 4
+
+
+# With this function we get the global1 combinations of one gene with the formulas of the old per-gene loop
+def per_gene_combinations(p_w_list, N, num_of_studies):
+    z_list = [1 - norm.ppf(p) for p in p_w_list]
+    w_i_list = list(N)
+    w_i_sqrt_list = list(np.sqrt(np.sqrt(N)) * np.array(z_list))
+    stoufer_weighted = sum(w_i_sqrt_list) / (math.sqrt(sum(w_i_list)))
+    stoufer = sum(z_list) / math.sqrt(len(z_list))
+
+    U = -2 * sum(np.log(p_w_list))
+    fisher = U * sum([(- np.log(U) ** i) / math.factorial(i) for i in range(num_of_studies - 1)])
+
+    p_hat = sum(p_w_list) / num_of_studies
+    return {'global1_stoufer': 2 * (1 - norm.cdf(abs(stoufer))),
+            'global1_stoufer_weighted': 2 * (1 - norm.cdf(abs(stoufer_weighted))),
+            'global1_p_fisher': 2 * (1 - chi2.cdf(abs(fisher), 2)),
+            'global1_p_edg1': (sum(p_w_list) ** num_of_studies) / math.factorial(num_of_studies),
+            'global1_p_edg2': 2 * (1 - norm.cdf(abs((0.5 - p_hat) * math.sqrt(12))))}
+
+
+def test_global1_combinations_match_per_gene_formulas():
+    combinations = pvalue_combination.global1_combinations(np.log(P_W), 1 - norm.ppf(P_W), N, VALID,
+                                                           NUM_OF_STUDIES)
+    for gene in range(P_W.shape[0]):
+        # the old 1 - cdf rounded the tail p values below about 1e-16 to 0
+        expected = per_gene_combinations(P_W[gene, VALID[gene]], N[gene, VALID[gene]], NUM_OF_STUDIES)
+        for name, value in expected.items():
+            np.testing.assert_allclose(combinations[name][gene], value, rtol=1e-9, atol=1e-15, err_msg=name)
+
+
+def test_edgington_stays_finite_beyond_170_studies():
+    p = np.full((1, 200), 0.9)
+    p_edg1, p_edg2 = pvalue_combination.edgington(p, np.ones_like(p, dtype=bool), 200)
+    np.testing.assert_allclose(p_edg1, np.exp(200 * np.log(180.0) - math.lgamma(201)), rtol=1e-12)
+    assert np.isfinite(p_edg2).all()
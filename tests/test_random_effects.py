@@ -0,0 +1,113 @@
+import numpy as np
+import PythonMeta as PMA
+from scipy.stats import norm, chi2
+
+import random_effects
+
+# Parity of the vectorized random-effects kernel with the per-gene PythonMeta analysis it replaced
+# (Random, IV-Heg, SMD), on small fixed (genes x studies) arrays, NaN where a gene is missing from a study
+
+M1 = np.array([[1.2, 2.0, 0.3, np.nan],
+               [5.1, 4.8, 5.6, 5.0],
+               [0.9, np.nan, 1.4, 1.1],
+               [3.3, 3.1, np.nan, np.nan]])
+SD1 = np.array([[0.5, 1.1, 0.4, np.nan],
+                [0.7, 0.6, 0.9, 0.8],
+                [0.3, np.nan, 0.6, 0.2],
+                [1.0, 1.4, np.nan, np.nan]])
+N1 = np.array([[10, 8, 20, np.nan],
+               [15, 12, 30, 9],
+               [6, np.nan, 11, 25],
+               [40, 7, np.nan, np.nan]])
+M2 = np.array([[0.8, 1.1, 0.5, np.nan],
+               [4.9, 4.9, 5.2, 4.1],
+               [1.0, np.nan, 1.3, 1.2],
+               [3.0, 3.6, np.nan, np.nan]])
+SD2 = np.array([[0.6, 0.9, 0.5, np.nan],
+                [0.8, 0.5, 1.0, 0.7],
+                [0.4, np.nan, 0.5, 0.3],
+                [1.2, 1.1, np.nan, np.nan]])
+N2 = np.array([[12, 9, 18, np.nan],
+               [14, 10, 28, 11],
+               [7, np.nan, 13, 22],
+               [35, 9, np.nan, np.nan]])
+
+
+# With this function we run the PythonMeta analysis of one gene as the old meta_analysis.main did
+def pythonmeta_gene(gene):
+    studies = [chr(65 + j) + ',' + ','.join(str(x[gene, j]) for x in (M1, SD1, N1, M2, SD2, N2))
+               for j in range(M1.shape[1]) if not np.isnan(M1[gene, j])]
+    d = PMA.Data()
+    d.datatype = 'CONT'
+    m = PMA.Meta()
+    m.datatype = d.datatype
+    m.models = 'Random'
+    m.algorithm = 'IV-Heg'
+    m.effect = 'SMD'
+    return m.meta(d.getdata(studies))[0]
+
+
+def test_random_effects_smd_matches_pythonmeta():
+    es, se, Q, I2, tau2, p_Q, z, p, k = random_effects.random_effects_smd(M1, SD1, N1, M2, SD2, N2)
+    for gene in range(M1.shape[0]):
+        result = pythonmeta_gene(gene)
+        np.testing.assert_allclose(es[gene], result[1], rtol=1e-12)
+        np.testing.assert_allclose(se[gene], result[6], rtol=1e-12)
+        np.testing.assert_allclose(Q[gene], result[7], rtol=1e-12, atol=1e-14)
+        np.testing.assert_allclose(I2[gene], round(result[9], 2))
+        np.testing.assert_allclose(tau2[gene], result[12], rtol=1e-12, atol=1e-14)
+        np.testing.assert_allclose(z[gene], result[10], rtol=1e-12)
+        assert p_Q[gene] == result[8]
+        assert k[gene] == np.count_nonzero(~np.isnan(M1[gene]))
+
+
+def test_dersimonian_laird_matches_pythonmeta():
+    es, se = random_effects.hedges_g(M1, SD1, N1, M2, SD2, N2)
+    ttl_es, ttl_se, Q, tau2, k = random_effects.dersimonian_laird(es, se)
+    for gene in range(M1.shape[0]):
+        result = pythonmeta_gene(gene)
+        np.testing.assert_allclose([ttl_es[gene], ttl_se[gene]], [result[1], result[6]], rtol=1e-12)
+        np.testing.assert_allclose([Q[gene], tau2[gene]], [result[7], result[12]], rtol=1e-12, atol=1e-14)
+
+
+# With this function we conduct the meta-analysis of one gene with the old per-gene altmeta of meta_analysis
+def per_gene_altmeta(y1, s2):
+    n = len(y1)
+    w = [(1 / x) for x in s2]
+    mu_bar = sum(a * b for a, b in zip(w, y1)) / sum(w)
+    Q = sum(a * b for a, b in zip(w, [(x - mu_bar) ** 2 for x in y1]))
+    p_Q = chi2.sf(Q, len(y1) - 1)
+    I2 = max(0, (Q - (len(s2) - 1)) / Q)
+    tau2_DL = max(0, (Q - n + 1) / (sum(w) - sum([x ** 2 for x in w]) / sum(w)))
+    w = [(1 / (x + tau2_DL)) for x in s2]
+    mu_bar = sum(a * b for a, b in zip(w, y1)) / sum(w)
+    se = np.sqrt(1 / sum(w))
+    z = (mu_bar / se)
+    return [Q, I2, tau2_DL, p_Q, se, z, mu_bar, 1 - norm.cdf(abs(z))]
+
+
+def test_altmeta_matches_per_gene_altmeta():
+    y, se = random_effects.hedges_g(M1, SD1, N1, M2, SD2, N2)
+    results = np.array(random_effects.altmeta(y, se * se))
+    for gene in range(M1.shape[0]):
+        studies = ~np.isnan(y[gene])
+        # the old 1 - cdf rounded the tail p values below about 1e-16 to 0
+        np.testing.assert_allclose(results[:, gene], per_gene_altmeta(y[gene, studies], se[gene, studies] ** 2),
+                                   rtol=1e-12, atol=1e-15, err_msg='gene ' + str(gene))
+
+
+def test_altmeta_of_ragged_studies():
+    values = [0.4, 0.1, 0.7, -0.2, 0.3, 0.3]
+    variances = [0.05, 0.08, 0.12, 0.04, 0.09, 0.09]
+    offsets = [0, 3, 4, 6]
+    y, valid = random_effects.ragged_to_padded(values, offsets)
+    v, _ = random_effects.ragged_to_padded(variances, offsets)
+    Q, I2, tau2, p_Q, se, z, mu_bar, p = random_effects.altmeta(y, v, valid)
+    np.testing.assert_allclose([Q[0], I2[0], tau2[0], se[0], mu_bar[0]],
+                               np.array(per_gene_altmeta(values[:3], variances[:3]))[[0, 1, 2, 4, 6]], rtol=1e-12)
+    # a single study and studies without heterogeneity (Q == 0) take I^2 = tau^2 = 0
+    np.testing.assert_array_equal(Q[1:], [0, 0])
+    np.testing.assert_array_equal(I2[1:], [0, 0])
+    np.testing.assert_array_equal(tau2[1:], [0, 0])
+    np.testing.assert_allclose(se[1:], [np.sqrt(0.04), np.sqrt(0.045)], rtol=1e-12)
+    np.testing.assert_allclose(mu_bar[1:], [-0.2, 0.3], rtol=1e-12)
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+import result_writer
+import meta_analysis
+from study_io import Study
+
+# The streamed results, written chunk by chunk and completed by add_columns, are the file of the whole table
+
+SETTINGS = {'controls': '0', 'cases': '1', 'bayesian_meta_analysis': 'NO', 'bootstrap': 'NO', 'workers': '1', 'significance_level': '0.05',
+            'multiple_comparisons': 'all'}
+
+
+def studies(seed=0):
+    rng = np.random.default_rng(seed)
+    result = []
+    for num_of_genes, n1, n2 in [(120, 4, 5), (90, 6, 3), (150, 3, 4)]:
+        genes = np.array(['g%03d' % i for i in rng.choice(200, num_of_genes, replace=False)])
+        # a gene named NA must not become a missing value when read back
+        genes[0] = 'NA'
+        values = rng.normal(size=(num_of_genes, n1 + n2))
+        values[:, n1:] += rng.normal(scale=0.5, size=(num_of_genes, 1))
+        result.append(Study(genes=genes, ids=np.array(['s%d' % i for i in range(n1 + n2)]),
+                            classes=np.array(['0'] * n1 + ['1'] * n2), values=values))
+    return result
+
+
+def test_streamed_results_match_the_in_memory_table(tmp_path):
+    summaries = meta_analysis.load_summaries(SETTINGS, studies())[0]
+    table = meta_analysis.add_multiple_tests(SETTINGS, meta_analysis.results_table(SETTINGS, summaries, [], []))
+
+    partial, out = str(tmp_path / 'results.partial.txt'), str(tmp_path / 'results.txt')
+    rows = result_writer.write_chunks(meta_analysis.iter_results(SETTINGS, summaries, [], [], num_of_shards=7),
+                                      partial, str(tmp_path / 'results.partial.parquet'))
+    assert rows == len(table)
+    result_writer.add_columns(partial, out, meta_analysis.multiple_test_inputs(SETTINGS),
+                              lambda df: meta_analysis.multiple_test_columns(SETTINGS, df),
+                              str(tmp_path / 'results.parquet'), str(tmp_path / 'results.partial.parquet'),
+                              chunksize=37)
+
+    # the p of Q keeps its text (0.070, not 0.07) and the gene NA its name
+    with open(out, 'r', encoding='utf-8', newline='') as f:
+        assert f.read() == table.to_csv(sep='\t')
+    assert result_writer.read_results(out, usecols=['Genes'])['Genes'].tolist() == table['Genes'].tolist()
+    parquet = pd.read_parquet(str(tmp_path / 'results.parquet'))
+    assert parquet.columns.tolist() == table.columns.tolist()
+    pd.testing.assert_frame_equal(parquet.drop(columns='p_Q_value'), table.drop(columns='p_Q_value'),
+                                  check_dtype=False)
+
+
+def test_add_columns_keeps_the_lines_as_written(tmp_path):
+    frame = pd.DataFrame({'Genes': ['a', 'NA', 'c'], 'p_Q_value': ['0.070', '0.100', '0.999'],
+                          'p_value': [0.1, 1e-300, 0.30000000000000004]})
+    path, out = str(tmp_path / 'partial.txt'), str(tmp_path / 'out.txt')
+    result_writer.write_chunks([frame.iloc[:2], frame.iloc[2:]], path)
+    result_writer.add_columns(path, out, ['p_value'], lambda df: pd.DataFrame({'twice': 2 * df['p_value']}),
+                              chunksize=2)
+    expected = pd.concat([frame, pd.DataFrame({'twice': 2 * frame['p_value']})], axis=1)
+    with open(out, 'r', encoding='utf-8', newline='') as f:
+        assert f.read() == expected.to_csv(sep='\t')
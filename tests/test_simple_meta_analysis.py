@@ -0,0 +1,57 @@
+import numpy as np
+
+from simple_meta_analysis import group_by_gene, read_effect_sizes
+
+# The effect size files read by the simple meta-analysis: a Gene header on the first row, other header rows where
+# files were concatenated, and columns after the standard error that are not read
+
+HEADER = 'Gene\tEffect_size\tStandard_Error\tp_value\n'
+
+
+# With this function we write an effect size file from its lines
+def write_file(path, lines):
+    with open(path, 'w') as f:
+        f.write(''.join(lines))
+    return str(path)
+
+
+def test_read_effect_sizes_skips_the_first_header(tmp_path):
+    path = write_file(tmp_path / 'es.txt', [HEADER, 'A\t0.1\t0.2\t0.5\n', 'B\t-1.25\t0.3\t0.01\n'])
+    genes, es, se = read_effect_sizes(path)
+    assert list(genes) == ['A', 'B']
+    np.testing.assert_array_equal(es, [0.1, -1.25])
+    np.testing.assert_array_equal(se, [0.2, 0.3])
+
+
+def test_read_effect_sizes_drops_repeated_headers(tmp_path):
+    path = write_file(tmp_path / 'es.txt', [HEADER, 'A\t0.1\t0.2\t0.5\n', HEADER, 'B\t-1.25\t0.3\t0.01\n',
+                                            HEADER, 'C\t0.7\t0.45\t0.2\n'])
+    genes, es, se = read_effect_sizes(path)
+    assert list(genes) == ['A', 'B', 'C']
+    assert es.dtype == float and se.dtype == float
+    np.testing.assert_array_equal(es, [0.1, -1.25, 0.7])
+    np.testing.assert_array_equal(se, [0.2, 0.3, 0.45])
+
+
+def test_read_effect_sizes_without_header(tmp_path):
+    path = write_file(tmp_path / 'es.txt', ['A\t0.1\t0.2\n', 'NA\t0.3\t0.4\n'])
+    genes, es, se = read_effect_sizes(path)
+    # gene symbols such as NA stay strings
+    assert list(genes) == ['A', 'NA']
+    np.testing.assert_array_equal(es, [0.1, 0.3])
+
+
+def test_read_effect_sizes_keeps_the_floats_of_float(tmp_path):
+    values = ['0.1234567890123456789', '1e-310', '-3.0000000000000004']
+    path = write_file(tmp_path / 'es.txt', [HEADER] + ['G%d\t%s\t%s\n' % (i, v, v) for i, v in enumerate(values)])
+    _, es, se = read_effect_sizes(path)
+    assert list(es) == [float(v) for v in values]
+    assert list(se) == [float(v) for v in values]
+
+
+def test_group_by_gene_keeps_first_appearance_and_file_order():
+    genes = np.array(['B', 'A', 'B', 'C', 'A', 'B'], dtype=object)
+    unique_genes, offsets, order = group_by_gene(genes)
+    assert list(unique_genes) == ['B', 'A', 'C']
+    assert list(offsets) == [0, 3, 5, 6]
+    assert list(order) == [0, 2, 5, 1, 4, 3]
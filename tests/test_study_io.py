@@ -0,0 +1,88 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import study_io
+
+# The binary study cache: a cached study reads back as the parsed file, and a changed file is parsed again
+
+GENES = ['a1bg', 'a2m', 'aatk', 'abca1']
+CLASSES = [0, 0, 1, 1, 1]
+VALUES = np.array([[0.1, 0.2, 0.3, 0.4, 0.5],
+                   [1.5, np.nan, 1.1, 1.0, 0.9],
+                   [-0.2, -0.1, 0.0, 0.7, 0.3],
+                   [2.0, 2.5, 3.0, 3.5, 4.0]])
+
+
+def assert_same_study(study, expected):
+    np.testing.assert_array_equal(study.genes, expected.genes)
+    np.testing.assert_array_equal(study.ids, expected.ids)
+    np.testing.assert_array_equal(study.classes, expected.classes)
+    np.testing.assert_array_equal(study.values, expected.values)
+
+
+@pytest.fixture
+def no_parsing(monkeypatch):
+    def parse(path):
+        raise AssertionError('the study file was parsed again')
+    return lambda: monkeypatch.setattr(study_io, 'read_text', parse)
+
+
+def manifest(cache_dir):
+    folder, = os.listdir(cache_dir)
+    with open(os.path.join(cache_dir, folder, 'manifest.json')) as f:
+        return json.load(f)
+
+
+def test_cached_study_reads_back_as_the_parsed_file(tmp_path, write_study, no_parsing):
+    path = write_study(tmp_path / 'study1.txt', GENES, CLASSES, VALUES)
+    cache_dir = str(tmp_path / 'cache')
+    parsed = study_io.read_study(path)
+    assert_same_study(study_io.read_study(path, cache_dir), parsed)
+
+    no_parsing()
+    assert_same_study(study_io.read_study(path, cache_dir), parsed)
+
+
+def test_changed_study_file_is_parsed_again(tmp_path, write_study):
+    path = write_study(tmp_path / 'study1.txt', GENES, CLASSES, VALUES)
+    cache_dir = str(tmp_path / 'cache')
+    study_io.read_study(path, cache_dir)
+
+    write_study(path, GENES, CLASSES, VALUES * 2)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+    assert_same_study(study_io.read_study(path, cache_dir), study_io.read_study(path))
+    np.testing.assert_array_equal(study_io.read_study(path, cache_dir).values[0], VALUES[0] * 2)
+    assert manifest(cache_dir)['sha256'] == study_io.file_hash(path)
+
+
+def test_touched_study_file_keeps_its_cache(tmp_path, write_study, no_parsing):
+    path = write_study(tmp_path / 'study1.txt', GENES, CLASSES, VALUES)
+    cache_dir = str(tmp_path / 'cache')
+    parsed = study_io.read_study(path, cache_dir)
+
+    # same content, new modification time: the content hash still matches
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+    no_parsing()
+    assert_same_study(study_io.read_study(path, cache_dir), parsed)
+    assert manifest(cache_dir)['mtime'] == os.stat(path).st_mtime_ns
+
+
+def test_stale_manifest_is_not_read(tmp_path, write_study):
+    path = write_study(tmp_path / 'study1.txt', GENES, CLASSES, VALUES)
+    cache_dir = str(tmp_path / 'cache')
+    study_io.read_study(path, cache_dir)
+
+    # a manifest of another cache version or dtype is parsed again and rewritten
+    folder = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+    stale = dict(manifest(cache_dir), version=study_io.CACHE_VERSION - 1)
+    with open(os.path.join(folder, 'manifest.json'), 'w') as f:
+        json.dump(stale, f)
+    np.save(os.path.join(folder, 'values.npy'), np.zeros_like(VALUES))
+    np.testing.assert_array_equal(study_io.read_study(path, cache_dir).values, study_io.read_study(path).values)
+    assert manifest(cache_dir)['version'] == study_io.CACHE_VERSION
+
+    assert study_io.read_study(path, cache_dir, dtype='float32').values.dtype == np.float32
+    assert manifest(cache_dir)['dtype'] == 'float32'
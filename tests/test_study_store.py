@@ -0,0 +1,59 @@
+import os
+import re
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# An incremental run (--add-study / --remove-study) pools the per-study statistics of the study store,
+# its results should be the ones of a full run of mage.py over the same studies
+
+GENES = ['G%d' % i for i in range(12)]
+CLASSES = [0, 0, 0, 1, 1, 1, 1]
+
+
+# With this function we write a conf.txt of the repository with the given settings changed
+def write_conf(path, **changes):
+    with open(os.path.join(ROOT, 'conf.txt'), 'r') as f:
+        conf = f.read()
+    for key, value in changes.items():
+        conf = re.sub(r'(?m)^' + key + r' =.*$', key + ' = ' + value, conf)
+    with open(path, 'w') as f:
+        f.write(conf)
+    return str(path)
+
+
+# With this function we run mage.py and read its meta-analysis results
+def run_mage(conf, output, *args):
+    os.makedirs(output, exist_ok=True)
+    output = str(output) + '/'
+    subprocess.run([sys.executable, 'mage.py', '-c', conf, '-o', output] + list(args), cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL)
+    return pd.read_csv(output + 'meta_analysis_results.txt', sep='\t', index_col=0)
+
+
+def test_add_and_remove_study_match_full_runs(tmp_path, write_study):
+    rng = np.random.default_rng(0)
+    os.makedirs(tmp_path / 'all')
+    os.makedirs(tmp_path / 'without_b')
+    for name in ['a.txt', 'b.txt', 'c.txt']:
+        values = rng.normal(size=(len(GENES), len(CLASSES))) + np.array(CLASSES) * rng.normal(size=(len(GENES), 1))
+        write_study(tmp_path / 'all' / name, GENES, CLASSES, values)
+        if name != 'b.txt':
+            write_study(tmp_path / 'without_b' / name, GENES, CLASSES, values)
+
+    settings = dict(plots='NO', enrichment_analysis='NO')
+    conf_all = write_conf(tmp_path / 'all.txt', study_dir=str(tmp_path / 'all') + '/', **settings)
+    conf_without_b = write_conf(tmp_path / 'without_b.txt', study_dir=str(tmp_path / 'without_b') + '/', **settings)
+    full_all = run_mage(conf_all, tmp_path / 'full_all')
+    full_without_b = run_mage(conf_without_b, tmp_path / 'full_without_b')
+
+    incremental = tmp_path / 'incremental'
+    pd.testing.assert_frame_equal(run_mage(conf_all, incremental, '--add-study'), full_all)
+    pd.testing.assert_frame_equal(run_mage(conf_all, incremental, '--remove-study', 'b.txt'), full_without_b)
+    # b.txt stays out of the pool until it is added again
+    pd.testing.assert_frame_equal(run_mage(conf_all, incremental, '--add-study'), full_without_b)
+    pd.testing.assert_frame_equal(run_mage(conf_all, incremental, '--add-study', 'b.txt'), full_all)
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+import study_io
+from summary_stats import summarize_matrix
+from meta_analysis import split_data
+
+# The summaries of a memory-mapped study, read a block of genes at a time, are the ones of the study in memory
+
+rng = np.random.default_rng(0)
+GENES = ['g%02d' % i for i in range(23)]
+CLASSES = [0] * 4 + [1] * 5
+VALUES = rng.normal(size=(23, 9))
+VALUES[[2, 11, 17], [1, 6, 0]] = np.nan
+
+
+def test_memory_mapped_block_summaries_match_in_memory_ones(tmp_path, write_study):
+    path = write_study(tmp_path / 'study1.txt', GENES, CLASSES, VALUES)
+    mapped = study_io.read_study(path, str(tmp_path / 'cache'), mmap=True)
+    assert isinstance(mapped.values, np.memmap)
+
+    groups = [np.arange(4), np.arange(4, 9)]
+    blocks = summarize_matrix(mapped.values, groups, block_rows=5)
+    values = study_io.read_study(path).values
+    in_memory = summarize_matrix(values, groups, block_rows=len(GENES))
+    for found, expected in zip(blocks, in_memory):
+        np.testing.assert_array_equal(found, expected)
+
+    # the pandas summaries MAGE computed before
+    frame = pd.DataFrame(values)
+    means, stds, sizes, complete = blocks
+    np.testing.assert_allclose(means[:, 0], frame.iloc[:, :4].mean(axis=1), rtol=1e-14)
+    np.testing.assert_allclose(stds[:, 1], frame.iloc[:, 4:].std(axis=1), rtol=1e-14)
+    np.testing.assert_array_equal(sizes, [4, 5])
+    np.testing.assert_array_equal(complete, ~np.isnan(VALUES).any(axis=1))
+
+
+def test_split_data_of_memory_mapped_studies(tmp_path, write_study):
+    path = write_study(tmp_path / 'study1.txt', GENES, CLASSES, VALUES)
+    mapped = study_io.read_study(path, str(tmp_path / 'cache'), mmap=True)
+    summaries = split_data([mapped], '0', '1', keep_expressions=False)[-1]
+    expected = split_data([study_io.read_study(path)], '0', '1', keep_expressions=False)[-1]
+    for found, value in zip(summaries, expected):
+        np.testing.assert_array_equal(found, value)
+    assert len(summaries.genes) == len(GENES) - 3
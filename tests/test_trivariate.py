@@ -0,0 +1,55 @@
+import math
+
+import numpy as np
+import scipy.stats as st
+
+import random_effects
+from trivariate import trivariate_studies
+
+# Parity of the vectorized trivariate effect sizes with the per-gene formulas of the multivariate loop they
+# replaced, on small fixed (genes x studies x 3) arrays of the controls, cases and cases2, NaN where a gene is
+# missing from a study
+
+MEAN = np.array([[[0.1, 0.6, 0.9], [1.2, 1.0, 1.7], [np.nan] * 3],
+                 [[2.0, 2.1, 1.4], [0.3, 0.9, 0.2], [1.1, 1.5, 1.6]]])
+SD = np.array([[[0.5, 0.7, 0.6], [1.1, 0.8, 0.9], [np.nan] * 3],
+               [[0.4, 0.3, 0.5], [0.6, 0.6, 0.7], [0.9, 1.2, 0.8]]])
+N = np.array([[[8, 9, 7], [20, 15, 18], [np.nan] * 3],
+              [[5, 6, 6], [12, 10, 14], [30, 25, 28]]])
+
+
+# With this function we get the per-study statistics of one gene with the formulas of the old loop
+def per_study_trivariate(mean, sd, n):
+    (m1, m2, m3), (st1, st2, st3), (n1, n2, n3) = mean, sd, n
+    N = n1 + n2 + n3
+    df = N - 3
+    J = (math.gamma(df / 2) / (math.sqrt(df / 2) * math.gamma((df - 1) / 2)))
+    Sp = math.sqrt(((n2 - 1) * st2 * st2 + (n1 - 1) * st1 * st1 + (n3 - 1) * st3 * st3) / (N - 3))
+    d1 = (m2 - m1) / Sp
+    d2 = (m3 - m1) / Sp
+    g1, g2 = J * d1, J * d2
+    varg1 = (J ** 2) * ((1 / n1) + (1 / n2) + (d1 ** 2) / (2 * N))
+    varg2 = (J ** 2) * ((1 / n3) + (1 / n1) + (d2 ** 2) / (2 * N))
+    covg1g2 = J * J * ((1 / n1) + (d1 * d2) / (2 * N))
+    w = ((g1 ** 2) * varg2 + (- 2 * g1 * g2 * covg1g2) + (g2 ** 2) * varg1) / ((varg1 * varg2) - (covg1g2 ** 2))
+    p_w = math.exp(-(w / 2))
+    return {'g1': g1, 'g2': g2, 'var_g1': varg1, 'var_g2': varg2, 'cov_g1_g2': covg1g2, 'w': w, 'p_w': p_w,
+            'z': 1 - st.norm.ppf(p_w), 'diff': g1 - g2, 'std_err_diff': math.sqrt(varg1 + varg2 - (2 * covg1g2)),
+            'N': N, 'se': math.sqrt((1 / n1) + (1 / n2) + (1 / n3))}
+
+
+def test_trivariate_studies_match_per_study_formulas():
+    studies = trivariate_studies(MEAN, SD, N)
+    for g in range(MEAN.shape[0]):
+        for s in range(MEAN.shape[1]):
+            if np.isnan(MEAN[g, s, 0]):
+                assert np.isnan(studies.g1[g, s]) and np.isnan(studies.w[g, s])
+                continue
+            for name, value in per_study_trivariate(MEAN[g, s], SD[g, s], N[g, s]).items():
+                np.testing.assert_allclose(getattr(studies, name)[g, s], value, rtol=1e-12,
+                                           err_msg=name + ' of gene ' + str(g) + ', study ' + str(s))
+
+
+def test_hedges_j_table_matches_hedges_j():
+    df = np.array([[3, 18, 40, np.nan], [120, 500, 3, 2000]])
+    np.testing.assert_allclose(random_effects.hedges_j_table(df), random_effects.hedges_j(df), rtol=1e-12)
@@ -0,0 +1,58 @@
+import numpy as np
+from collections import namedtuple
+from scipy.stats import norm
+from random_effects import hedges_j_table
+
+# Vectorized trivariate effect sizes of the multivariate meta-analysis.
+# The two case groups (1 and 2) are compared with the controls (0) of every study through a common pooled
+# deviation, so the two effect sizes are correlated. Every array is (genes x studies), NaN where a gene is
+# missing from a study, and all genes and studies are computed in one pass.
+
+# The per (gene, study) statistics:
+# g1, g2, var_g1, var_g2, cov_g1_g2: the effect sizes of the two case groups, their variances and covariance
+# w, log_p_w, p_w: the W statistic of the two effect sizes and its (log) p value, z: the one-sided z score of p_w
+# diff, std_err_diff: the difference g1 - g2 (global2) and its standard error
+# N: the samples of the study, se: the standard error of z
+TrivariateStudies = namedtuple('TrivariateStudies', ['g1', 'g2', 'var_g1', 'var_g2', 'cov_g1_g2', 'w', 'log_p_w', 'p_w',
+                                                     'z',
+                                                     'diff', 'std_err_diff', 'N', 'se'])
+
+
+# With this function we get the effect sizes of the (genes x studies x 3) means, deviations and group sizes
+# (controls, cases, cases2) of a StudySummaries
+def trivariate_effects(mean, sd, n):
+    m1, m2, m3 = (mean[:, :, i] for i in range(3))
+    st1, st2, st3 = (sd[:, :, i] for i in range(3))
+    n1, n2, n3 = (n[:, :, i] for i in range(3))
+
+    N = n1 + n2 + n3
+    J = hedges_j_table(N - 3)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        Sp = np.sqrt(((n2 - 1) * st2 * st2 + (n1 - 1) * st1 * st1 + (n3 - 1) * st3 * st3) / (N - 3))
+
+        d1 = (m2 - m1) / Sp
+        d2 = (m3 - m1) / Sp
+
+        var_d2 = (1 / n1) + (1 / n2) + (d1 ** 2) / (2 * N)
+        var_d3 = (1 / n3) + (1 / n1) + (d2 ** 2) / (2 * N)
+        cov_d1_d2 = (1 / n1) + (d1 * d2) / (2 * N)
+        se = np.sqrt((1 / n1) + (1 / n2) + (1 / n3))
+
+    return J * d1, J * d2, (J ** 2) * var_d2, (J ** 2) * var_d3, J * J * cov_d1_d2, N, se
+
+
+# With this function we get the TrivariateStudies of the (genes x studies x 3) arrays of a StudySummaries
+def trivariate_studies(mean, sd, n):
+    g1, g2, var_g1, var_g2, cov_g1_g2, N, se = trivariate_effects(mean, sd, n)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        # the W formula simplified in order to get the p_value easily
+        w = ((g1 ** 2) * var_g2 + (- 2 * g1 * g2 * cov_g1_g2) + (g2 ** 2) * var_g1) / \
+            ((var_g1 * var_g2) - (cov_g1_g2 ** 2))
+        log_p_w = -(w / 2)
+        p_w = np.exp(log_p_w)
+        # one-sided test
+        z = 1 - norm.ppf(p_w)
+
+        diff = g1 - g2
+        std_err_diff = np.sqrt(var_g1 + var_g2 - (2 * cov_g1_g2))
+    return TrivariateStudies(g1, g2, var_g1, var_g2, cov_g1_g2, w, log_p_w, p_w, z, diff, std_err_diff, N, se)